@@ -0,0 +1,86 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json --threshold 1.2
+
+Exits with status 1 when any stage duration or endpoint p50/p99 latency grew by
+more than the threshold ratio.
+"""
+import argparse
+import json
+import sys
+
+# Differences below this many seconds are noise, whatever the ratio
+MIN_SECONDS = 0.05
+MIN_MS = 2.0
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def metrics(result):
+    """Flatten a result file into {name: (value, unit)}"""
+    values = {}
+    for stage, data in result['stages'].items():
+        if data.get('error'):
+            continue
+        if stage == 'endpoints':
+            for path, endpoint in (data.get('detail') or {}).items():
+                for key in ('p50_ms', 'p99_ms'):
+                    values[f'GET {path} {key[:3]}'] = (endpoint[key], 'ms')
+        else:
+            values[stage] = (data['seconds'], 's')
+    values['peak_rss'] = (max(result['meta']['peak_rss_mb'].values()), 'MB')
+    return values
+
+
+def _normalize(name, case_id):
+    return name.replace(case_id, '{case}') if case_id else name
+
+
+def compare(before, after, threshold):
+    def keyed(result):
+        case = next(
+            (p.split('/')[3] for p in (result['stages'].get('endpoints', {}).get('detail') or {}) if p.startswith('/api/cases/')),
+            None
+        )
+        return {_normalize(name, case): value for name, value in metrics(result).items()}
+
+    old, new = keyed(before), keyed(after)
+    rows, regressions = [], []
+    for name in sorted(set(old) & set(new)):
+        (a, unit), (b, _) = old[name], new[name]
+        ratio = b / a if a else None
+        noise = abs(b - a) < (MIN_SECONDS if unit == 's' else MIN_MS if unit == 'ms' else 0)
+        regressed = ratio is not None and ratio > threshold and not noise
+        rows.append((name, a, b, unit, ratio, regressed))
+        if regressed:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio counted as a regression')
+    args = parser.parse_args()
+
+    before, after = _load(args.before), _load(args.after)
+    if before['meta']['events'] != after['meta']['events']:
+        print(f"warning: comparing runs of {before['meta']['events']} and {after['meta']['events']} events")
+    rows, regressions = compare(before, after, args.threshold)
+
+    width = max((len(r[0]) for r in rows), default=10)
+    print(f"{'metric':<{width}}  {'before':>10}  {'after':>10}  ratio")
+    for name, a, b, unit, ratio, regressed in rows:
+        print(f"{name:<{width}}  {a:>8.3f}{unit:<2}  {b:>8.3f}{unit:<2}  "
+              + (f"{ratio:.2f}x" if ratio is not None else '-') + ('  REGRESSION' if regressed else ''))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold}x")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
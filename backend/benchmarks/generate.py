@@ -0,0 +1,199 @@
+"""Seeded synthetic evidence generator.
+
+Writes calls.csv, whatsapp.jsonl and transactions.csv in the same shape as
+training_dataset_5k.json, plus ground_truth.json listing the planted fraud rings.
+
+    python -m benchmarks.generate --events 1000000 --seed 42 --out bench_data
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Share of background events per source, matching the bundled dataset
+SOURCE_MIX = {'calls': 0.30, 'whatsapp': 0.60, 'transactions': 0.10}
+CHUNK_SIZE = 100000
+START_TIME = datetime(2024, 1, 1)
+SPAN_DAYS = 90
+# Relative activity per hour of day: quiet at night, busiest late morning and evening
+HOURLY_WEIGHTS = np.array([
+    0.3, 0.2, 0.1, 0.1, 0.1, 0.2, 0.5, 1.0, 1.5, 1.8, 2.0, 2.0,
+    1.8, 1.7, 1.6, 1.6, 1.7, 1.9, 2.1, 2.2, 2.0, 1.5, 1.0, 0.6
+])
+CALL_TYPES = np.array(['incoming', 'outgoing', 'missed'])
+CALL_TYPE_WEIGHTS = [0.45, 0.45, 0.10]
+LANGUAGES = np.array(['English', 'Tamil', 'Hindi', 'Telugu'])
+LANGUAGE_WEIGHTS = [0.5, 0.25, 0.15, 0.10]
+MESSAGES = np.array([
+    'Hi', 'Lunch?', 'On my way', 'Call me', 'See you tomorrow', 'Ok', 'Thanks!',
+    'Where are you?', 'Meeting at 3pm', 'Good morning', 'Sent the file', 'Busy now'
+])
+TRANSACTION_TYPES = np.array(['transfer', 'upi', 'neft', 'imps', 'withdrawal'])
+RING_MESSAGES = ['Send OTP now', 'Transfer done', 'Use the new account', 'Delete this chat', 'Cash ready']
+
+CALL_FIELDS = ['call_id', 'caller', 'receiver', 'timestamp', 'duration_seconds', 'call_type', 'source']
+TRANSACTION_FIELDS = ['transaction_id', 'from_account', 'to_account', 'timestamp', 'amount', 'transaction_type', 'status', 'source']
+
+
+def _timestamps(rng, n):
+    days = rng.integers(0, SPAN_DAYS, n)
+    hours = rng.choice(24, n, p=HOURLY_WEIGHTS / HOURLY_WEIGHTS.sum())
+    seconds = days * 86400 + hours * 3600 + rng.integers(0, 3600, n)
+    return seconds
+
+
+def _format(seconds):
+    return (START_TIME + timedelta(seconds=int(seconds))).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _population(rng, size):
+    """Distinct 10-digit numbers; activity per person is Zipf-like so a few are very busy"""
+    numbers = rng.choice(9_000_000_000, size, replace=False) + 1_000_000_000
+    weights = 1.0 / np.arange(1, size + 1) ** 0.8
+    return numbers.astype(str), weights / weights.sum()
+
+
+def plant_rings(rng, numbers, ring_count, ring_size):
+    """Rings of accounts that call each other in late-night bursts, then pass money around a cycle"""
+    rings = []
+    members = rng.choice(len(numbers), ring_count * ring_size, replace=False).reshape(ring_count, ring_size)
+    for index, ring in enumerate(members):
+        accounts = [numbers[i] for i in ring]
+        events = {'calls': [], 'whatsapp': [], 'transactions': []}
+        for burst in range(int(rng.integers(3, 7))):
+            # A burst starts between midnight and 3am
+            base = int(rng.integers(0, SPAN_DAYS)) * 86400 + int(rng.integers(0, 3 * 3600))
+            for step in range(int(rng.integers(8, 20))):
+                a, b = rng.choice(len(accounts), 2, replace=False)
+                when = base + step * int(rng.integers(20, 120))
+                events['calls'].append([
+                    f'ring{index}_call_{burst}_{step}', accounts[a], accounts[b], _format(when),
+                    int(rng.integers(5, 60)), 'outgoing', 'calls'
+                ])
+                if step % 3 == 0:
+                    events['whatsapp'].append({
+                        'message_id': f'ring{index}_msg_{burst}_{step}', 'sender': accounts[a], 'receiver': accounts[b],
+                        'timestamp': _format(when + 30), 'message_text': RING_MESSAGES[step % len(RING_MESSAGES)],
+                        'deleted_flag': 1, 'language': 'English', 'source': 'whatsapp'
+                    })
+            # Money moves around the ring right after the burst
+            amount = float(rng.integers(50_000, 500_000))
+            for hop in range(len(accounts)):
+                events['transactions'].append([
+                    f'ring{index}_txn_{burst}_{hop}', accounts[hop], accounts[(hop + 1) % len(accounts)],
+                    _format(base + 3600 + hop * 300), round(amount * (0.97 ** hop), 2),
+                    'imps', 'completed', 'transactions'
+                ])
+        rings.append({'ring': index, 'accounts': accounts, 'events': {k: len(v) for k, v in events.items()}, 'rows': events})
+    return rings
+
+
+def generate(out_dir, events=100000, seed=42, ring_count=None, ring_size=8):
+    """Write the synthetic case to out_dir; returns a summary dict (also saved as ground_truth.json)"""
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    numbers, weights = _population(rng, max(1000, events // 100))
+    if ring_count is None:
+        ring_count = max(1, events // 100000)
+    rings = plant_rings(rng, numbers, ring_count, ring_size)
+    planted = sum(sum(r['events'].values()) for r in rings)
+    background = max(0, events - planted)
+
+    paths = {
+        'calls': os.path.join(out_dir, 'calls.csv'),
+        'whatsapp': os.path.join(out_dir, 'whatsapp.jsonl'),
+        'transactions': os.path.join(out_dir, 'transactions.csv'),
+    }
+    counts = dict.fromkeys(paths, 0)
+    with open(paths['calls'], 'w', newline='') as calls_f, \
+            open(paths['whatsapp'], 'w') as messages_f, \
+            open(paths['transactions'], 'w', newline='') as transactions_f:
+        calls = csv.writer(calls_f)
+        transactions = csv.writer(transactions_f)
+        calls.writerow(CALL_FIELDS)
+        transactions.writerow(TRANSACTION_FIELDS)
+
+        written = 0
+        while written < background:
+            n = min(CHUNK_SIZE, background - written)
+            sources = rng.choice(list(SOURCE_MIX), n, p=list(SOURCE_MIX.values()))
+            senders = rng.choice(len(numbers), n, p=weights)
+            receivers = rng.choice(len(numbers), n, p=weights)
+            stamps = _timestamps(rng, n)
+
+            for source in SOURCE_MIX:
+                idx = np.flatnonzero(sources == source)
+                if not len(idx):
+                    continue
+                ids = written + idx
+                ts = [_format(s) for s in stamps[idx]]
+                a, b = numbers[senders[idx]], numbers[receivers[idx]]
+                if source == 'calls':
+                    durations = np.rint(rng.lognormal(4.5, 1.0, len(idx))).astype(int)
+                    kinds = rng.choice(CALL_TYPES, len(idx), p=CALL_TYPE_WEIGHTS)
+                    durations[kinds == 'missed'] = 0
+                    calls.writerows(zip(
+                        (f'call_{i}' for i in ids), a, b, ts, durations.tolist(), kinds, ['calls'] * len(idx)
+                    ))
+                elif source == 'whatsapp':
+                    texts = rng.choice(MESSAGES, len(idx))
+                    languages = rng.choice(LANGUAGES, len(idx), p=LANGUAGE_WEIGHTS)
+                    deleted = (rng.random(len(idx)) < 0.02).astype(int)
+                    messages_f.writelines(
+                        json.dumps({
+                            'message_id': f'msg_{i}', 'sender': s, 'receiver': r, 'timestamp': t,
+                            'message_text': text, 'deleted_flag': int(d), 'language': lang, 'source': 'whatsapp'
+                        }) + '\n'
+                        for i, s, r, t, text, d, lang in zip(ids, a, b, ts, texts, deleted, languages)
+                    )
+                else:
+                    amounts = np.round(rng.lognormal(7.5, 1.3, len(idx)), 2)
+                    kinds = rng.choice(TRANSACTION_TYPES, len(idx))
+                    status = np.where(rng.random(len(idx)) < 0.03, 'failed', 'completed')
+                    transactions.writerows(zip(
+                        (f'txn_{i}' for i in ids), a, b, ts, amounts.tolist(), kinds, status,
+                        ['transactions'] * len(idx)
+                    ))
+                counts[source] += len(idx)
+            written += n
+
+        for ring in rings:
+            calls.writerows(ring['rows']['calls'])
+            transactions.writerows(ring['rows']['transactions'])
+            messages_f.writelines(json.dumps(m) + '\n' for m in ring['rows']['whatsapp'])
+            for source, n in ring['events'].items():
+                counts[source] += n
+
+    summary = {
+        'seed': seed,
+        'events': sum(counts.values()),
+        'by_source': counts,
+        'population': len(numbers),
+        'files': paths,
+        'rings': [{k: v for k, v in r.items() if k != 'rows'} for r in rings],
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+    with open(os.path.join(out_dir, 'ground_truth.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rings', type=int, default=None, help='fraud rings to plant (default: 1 per 100k events)')
+    parser.add_argument('--ring-size', type=int, default=8)
+    parser.add_argument('--out', default='bench_data')
+    args = parser.parse_args()
+    summary = generate(args.out, args.events, args.seed, args.rings, args.ring_size)
+    print(json.dumps({k: v for k, v in summary.items() if k != 'rings'}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
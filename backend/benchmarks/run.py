@@ -0,0 +1,358 @@
+"""End-to-end pipeline benchmark on a synthetic case.
+
+Generates (or reuses) a seeded dataset, runs every pipeline stage against a
+throwaway database in a scratch directory, then times the case GET endpoints.
+Results are written as JSON for benchmarks.compare.
+
+    cd backend && python -m benchmarks.run --events 1000000 --output benchmarks/results/1m.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.generate import generate  # noqa: E402
+
+STAGES = ('ingest', 'index', 'rules', 'anomaly', 'graph', 'risk', 'digest', 'report', 'endpoints')
+INGESTION_MODES = ('batch', 'streaming', 'legacy')
+ENDPOINT_REPEATS = 20
+# Copied into the scratch directory so model loading and seeding behave as in a deployment
+RUNTIME_FILES = ('models', 'training_dataset_5k.json')
+
+
+def peak_rss_mb():
+    """High-water resident set size of this process and of the largest waited-for child, in MB"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {'self': round(own / scale, 1), 'children': round(children / scale, 1)}
+
+
+def latency_stats(samples):
+    values = np.array(samples) * 1000
+    return {
+        'count': len(samples),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Benchmark:
+    """Runs the stages in order against one case; each stage records seconds, throughput and peak RSS"""
+
+    def __init__(self, files, events, ingestion_mode='batch', repeats=ENDPOINT_REPEATS, ring_accounts=()):
+        self.files = files
+        self.events = events
+        self.ring_accounts = sorted(set(ring_accounts))
+        self.ingestion_mode = ingestion_mode
+        self.repeats = repeats
+        self.case_id = None
+        self.results = {}
+
+    def timed(self, name, func, throughput=True):
+        print(f"[bench] {name}...", flush=True)
+        started = time.perf_counter()
+        try:
+            detail = func()
+            error = None
+        except Exception as e:
+            detail, error = None, f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - started
+        self.results[name] = {
+            'seconds': round(seconds, 3),
+            'events_per_second': round(self.events / seconds, 1) if throughput and seconds and not error else None,
+            'peak_rss_mb': peak_rss_mb(),
+            'detail': detail,
+            'error': error
+        }
+        print(f"[bench] {name}: {seconds:.2f}s" + (f" FAILED {error}" if error else ''), flush=True)
+        return not error
+
+    def create_case(self):
+        from engines.case_management import CaseManagementEngine
+        self.case_id = CaseManagementEngine.create_case('Benchmark case', f'{self.events} synthetic events')
+
+    def ingest(self):
+        from engines.streaming_ingestion import StreamingIngestionEngine, SpooledUpload, SPOOL_DIR
+        from engines.batch_ingestion import BatchIngestionEngine
+        from engines.deduplication import DeduplicationEngine
+
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        spooled = []
+        for path in self.files:
+            # Ingestion discards its spool files, so hand it copies
+            copy = os.path.join(SPOOL_DIR, os.path.basename(path) + '.part')
+            shutil.copyfile(path, copy)
+            spooled.append({'filename': os.path.basename(path), 'path': copy, 'file_hash': None, 'file_size': os.path.getsize(copy)})
+
+        if self.ingestion_mode == 'batch':
+            stats = BatchIngestionEngine.ingest(self.case_id, spooled)
+            return {k: v for k, v in stats.items() if k.startswith('rows_') or k.startswith('files_')}
+
+        totals = {}
+        for upload in spooled:
+            if self.ingestion_mode == 'streaming':
+                upload_id, stats = StreamingIngestionEngine.ingest_stream(self.case_id, SpooledUpload(**upload))
+                if not upload_id:
+                    raise ValueError(stats)
+                for key, value in stats.items():
+                    if key.startswith('rows_'):
+                        totals[key] = totals.get(key, 0) + value
+            else:
+                self.legacy_ingest(SpooledUpload(**upload), totals)
+        if self.ingestion_mode == 'legacy':
+            _, totals['rows_duplicate'] = DeduplicationEngine.fingerprint_events(self.case_id, remove_duplicates=True)
+        return totals
+
+    def legacy_ingest(self, spooled, totals):
+        """IngestionEngine then NormalizationEngine, timed separately"""
+        from engines.ingestion import IngestionEngine
+        from engines.normalization import NormalizationEngine
+
+        try:
+            started = time.perf_counter()
+            upload_id, records = IngestionEngine.ingest_file(self.case_id, spooled.filename, spooled.read_bytes())
+            if not upload_id:
+                raise ValueError(records)
+            totals['parse_seconds'] = round(totals.get('parse_seconds', 0) + time.perf_counter() - started, 3)
+
+            started = time.perf_counter()
+            success, message = NormalizationEngine.normalize_and_store(self.case_id, spooled.filename, records)
+            if not success:
+                raise ValueError(message)
+            totals['normalize_seconds'] = round(totals.get('normalize_seconds', 0) + time.perf_counter() - started, 3)
+        finally:
+            spooled.discard()
+
+    def index(self):
+        from engines.entity_index import EntityIndexEngine
+        from engines.search import SearchEngine
+        import pipeline
+
+        result = {
+            'entities': EntityIndexEngine.index_events(self.case_id, 0),
+            'searchable': SearchEngine.index_events(self.case_id, 0)
+        }
+        pipeline.mark_case_updated(self.case_id)
+        return result
+
+    def rules(self):
+        import pipeline
+
+        result = pipeline.run_rules(self.case_id, full=True)
+        pipeline.mark_case_updated(self.case_id)
+        return {**result, 'ring_accounts_flagged': self.ring_accounts_flagged()}
+
+    def ring_accounts_flagged(self):
+        """Share of planted fraud-ring accounts with at least one finding, as a sanity check on detection"""
+        if not self.ring_accounts:
+            return None
+        from database import get_connection
+
+        conn = get_connection()
+        placeholders = ','.join('?' * len(self.ring_accounts))
+        flagged = conn.execute(
+            f'''SELECT COUNT(DISTINCT e.user_id) FROM suspicious_events s
+            JOIN unified_events e ON e.event_id = s.event_id
+            WHERE s.case_id = ? AND e.user_id IN ({placeholders})''',
+            (self.case_id, *self.ring_accounts)
+        ).fetchone()[0]
+        conn.close()
+        return round(flagged / len(self.ring_accounts), 3)
+
+    def anomaly(self):
+        import pipeline
+
+        result = pipeline.run_anomaly_detection(None, self.case_id)
+        if 'error' in result:
+            raise ValueError(result['error'])
+        return result
+
+    def graph(self):
+        import pipeline
+        from engines.graph_view import GraphViewEngine
+
+        result = pipeline.build_graph(self.case_id, full=True)
+        GraphViewEngine.compute_layout(self.case_id)
+        return result
+
+    def risk(self):
+        from engines.risk_aggregation import RiskAggregationEngine
+        import pipeline
+
+        result = RiskAggregationEngine.aggregate_risk(self.case_id)
+        pipeline.mark_case_updated(self.case_id)
+        return result
+
+    def digest(self):
+        from engines.case_digest import CaseDigestEngine
+
+        version, sections = CaseDigestEngine.refresh(self.case_id)
+        return {'case_version': version, 'tokens': sum(s['tokens'] for s in sections)}
+
+    def report(self):
+        import pipeline
+
+        report = pipeline.render_report(self.case_id, 'Benchmark Report', force=True)
+        return {'file_size': os.path.getsize(report['file_path']), 'mode': pipeline.REPORT_ENGINE_MODE}
+
+    def endpoint_paths(self):
+        from database import get_connection
+
+        conn = get_connection()
+        top_user = conn.execute(
+            '''SELECT user_id FROM unified_events WHERE case_id = ? AND user_id IS NOT NULL
+            GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1''',
+            (self.case_id,)
+        ).fetchone()
+        report = conn.execute('SELECT id FROM reports WHERE case_id = ? LIMIT 1', (self.case_id,)).fetchone()
+        conn.close()
+
+        case = f'/api/cases/{self.case_id}'
+        paths = [
+            '/api/cases', case, f'{case}/processing-status', f'{case}/timeline', f'{case}/timeline?limit=500',
+            f'{case}/rules', f'{case}/anomaly', f'{case}/graph', f'{case}/forensic-risk', f'{case}/risk',
+            f'{case}/reports', f'{case}/search?q=transfer', '/api/models', '/api/models/active',
+            '/api/anomaly/training-stats', '/api/system/db-pool', '/api/system/response-cache'
+        ]
+        if top_user:
+            paths.append(f'/api/entities/{top_user[0]}')
+        if report:
+            paths.append(f'{case}/reports/{report[0]}/download')
+        return paths
+
+    def endpoints(self):
+        """Every GET endpoint: the first request after clearing the response cache is reported as cold"""
+        from fastapi.testclient import TestClient
+        import main
+        from response_cache import response_cache
+
+        # Not used as a context manager, so startup hooks (database setup, job runner, warm-up) stay off
+        client = TestClient(main.app)
+        results = {}
+        for path in self.endpoint_paths():
+            response_cache.clear()
+            samples, status = [], None
+            for _ in range(self.repeats + 1):
+                started = time.perf_counter()
+                response = client.get(path)
+                samples.append(time.perf_counter() - started)
+                status = response.status_code
+            results[path] = {'status': status, 'cold_ms': round(samples[0] * 1000, 3), **latency_stats(samples[1:])}
+        return results
+
+    def run(self, stages=STAGES):
+        self.timed('create_case', self.create_case, throughput=False)
+        for stage in stages:
+            if not self.timed(stage, getattr(self, stage), throughput=stage != 'endpoints') and stage == 'ingest':
+                break
+        return self.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data', help='reuse a dataset directory written by benchmarks.generate')
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma-separated subset of: ' + ', '.join(STAGES))
+    parser.add_argument('--ingestion', choices=INGESTION_MODES, default='batch')
+    parser.add_argument('--repeats', type=int, default=ENDPOINT_REPEATS, help='warm requests per endpoint')
+    parser.add_argument('--workdir', help='scratch directory for the database and reports (default: a temp dir, removed afterwards)')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<timestamp>.json)')
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    started_at = datetime.now().isoformat()
+    output = os.path.abspath(args.output or os.path.join(
+        BACKEND_DIR, 'benchmarks', 'results', f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    ))
+    data_dir = os.path.abspath(args.data) if args.data else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='forensic_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    for name in RUNTIME_FILES:
+        source, target = os.path.join(BACKEND_DIR, name), os.path.join(workdir, name)
+        if os.path.isdir(source) and not os.path.exists(target):
+            shutil.copytree(source, target)
+        elif os.path.isfile(source) and not os.path.exists(target):
+            shutil.copyfile(source, target)
+
+    # The database, reports, spool and model paths are relative to the working directory
+    os.chdir(workdir)
+    os.makedirs('reports', exist_ok=True)
+    try:
+        if data_dir:
+            with open(os.path.join(data_dir, 'ground_truth.json')) as f:
+                dataset = json.load(f)
+        else:
+            dataset = generate(os.path.join(workdir, 'data'), args.events, args.seed)
+        print(f"[bench] dataset: {dataset['events']} events {dataset['by_source']}", flush=True)
+
+        from database import init_database
+        import pipeline
+        init_database()
+
+        rings = [account for ring in dataset['rings'] for account in ring['accounts']]
+        bench = Benchmark(list(dataset['files'].values()), dataset['events'], args.ingestion, args.repeats, rings)
+        results = bench.run(stages)
+    finally:
+        os.chdir(BACKEND_DIR)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'started_at': started_at,
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'events': dataset['events'],
+            'by_source': dataset['by_source'],
+            'seed': dataset['seed'],
+            'rings': len(dataset['rings']),
+            'modes': {
+                'ingestion': args.ingestion,
+                'rules': pipeline.RULE_ENGINE_MODE,
+                'anomaly': pipeline.ANOMALY_ENGINE_MODE,
+                'graph': pipeline.GRAPH_ENGINE_MODE,
+                'report': pipeline.REPORT_ENGINE_MODE,
+            },
+            'peak_rss_mb': peak_rss_mb(),
+        },
+        'stages': results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"[bench] results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
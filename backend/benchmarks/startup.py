@@ -0,0 +1,194 @@
+"""Cold start benchmark for the API process.
+
+Starts `uvicorn main:app` in a scratch directory, measures the time until the
+first request is answered and the resident memory at that point, then checks
+both against a budget. Also verifies that importing main leaves the heavy
+libraries unloaded.
+
+    cd backend && python -m benchmarks.startup --trials 5 --max-seconds 2.5 --max-rss-mb 120
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.run import RUNTIME_FILES, git_commit  # noqa: E402
+
+# Importing main must not pull these in; they load on first use or on warm-up
+HEAVY_MODULES = ('pandas', 'sklearn', 'scipy', 'networkx', 'reportlab', 'openai', 'pyarrow')
+DEFAULT_MAX_SECONDS = 2.5
+DEFAULT_MAX_RSS_MB = 120.0
+FIRST_RESPONSE_PATH = '/api/cases'
+START_TIMEOUT_SECONDS = 60
+POLL_INTERVAL = 0.01
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_rss_mb(pid):
+    """Resident set size of another process, from /proc or ps"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    output = subprocess.run(['ps', '-o', 'rss=', '-p', str(pid)], capture_output=True, text=True).stdout.strip()
+    return round(int(output) / 1024, 1) if output else None
+
+
+def request(port, path, method='GET'):
+    req = urllib.request.Request(f'http://127.0.0.1:{port}{path}', method=method)
+    with urllib.request.urlopen(req, timeout=START_TIMEOUT_SECONDS) as response:
+        return response.status, response.read()
+
+
+def server_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get('PYTHONPATH')]))
+    # Measure the cold path; warm-up is timed separately below
+    env['API_WARMUP'] = 'none'
+    env['RETRAIN_INTERVAL_HOURS'] = '0'
+    return env
+
+
+def measure_start(workdir, warm_up=True):
+    """One server start: seconds to the first 200 response and RSS right after it"""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=workdir, env=server_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with status {server.returncode} before answering")
+            if time.perf_counter() - started > START_TIMEOUT_SECONDS:
+                raise RuntimeError(f"no response within {START_TIMEOUT_SECONDS}s")
+            try:
+                status, _ = request(port, FIRST_RESPONSE_PATH)
+                if status == 200:
+                    break
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(POLL_INTERVAL)
+        result = {
+            'first_response_seconds': round(time.perf_counter() - started, 3),
+            'rss_mb': process_rss_mb(server.pid),
+        }
+        if warm_up:
+            _, body = request(port, '/api/system/warm-up', method='POST')
+            detail = json.loads(body)
+            result['warm_up_seconds'] = detail['seconds']
+            result['warm_rss_mb'] = process_rss_mb(server.pid)
+        return result
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def modules_loaded_by_import(workdir):
+    """Heavy modules present in sys.modules after a bare `import main`"""
+    code = (
+        'import json, sys, main; '
+        f'print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))'
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=workdir, env=server_env(), capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trials', type=int, default=3, help='server starts; the median is checked')
+    parser.add_argument('--max-seconds', type=float, default=DEFAULT_MAX_SECONDS, help='budget for the first response')
+    parser.add_argument('--max-rss-mb', type=float, default=DEFAULT_MAX_RSS_MB, help='budget for RSS at the first response')
+    parser.add_argument('--no-warm-up', action='store_true', help='skip timing POST /api/system/warm-up')
+    parser.add_argument('--output', help='results file (default: print only)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='forensic_startup_')
+    for name in RUNTIME_FILES:
+        source, target = os.path.join(BACKEND_DIR, name), os.path.join(workdir, name)
+        if os.path.isdir(source):
+            shutil.copytree(source, target)
+        elif os.path.isfile(source):
+            shutil.copyfile(source, target)
+
+    try:
+        heavy = modules_loaded_by_import(workdir)
+        trials = []
+        for trial in range(args.trials):
+            # A fresh database each time, as on a first deployment
+            for name in ('security_investigation.db', 'security_investigation.db-wal', 'security_investigation.db-shm'):
+                if os.path.exists(os.path.join(workdir, name)):
+                    os.remove(os.path.join(workdir, name))
+            trials.append(measure_start(workdir, warm_up=not args.no_warm_up))
+            print(f"[startup] trial {trial + 1}: {trials[-1]}", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {
+        key: round(statistics.median(t[key] for t in trials), 3)
+        for key in trials[0] if all(t.get(key) is not None for t in trials)
+    }
+    failures = []
+    if heavy:
+        failures.append(f"import main loaded {', '.join(heavy)}")
+    if summary['first_response_seconds'] > args.max_seconds:
+        failures.append(f"first response took {summary['first_response_seconds']}s (budget {args.max_seconds}s)")
+    if summary.get('rss_mb') is not None and summary['rss_mb'] > args.max_rss_mb:
+        failures.append(f"RSS at first response was {summary['rss_mb']} MB (budget {args.max_rss_mb} MB)")
+
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'budget': {'max_seconds': args.max_seconds, 'max_rss_mb': args.max_rss_mb},
+        },
+        'heavy_modules_on_import': heavy,
+        'median': summary,
+        'trials': trials,
+        'failures': failures,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[startup] results written to {args.output}")
+
+    print(f"[startup] median: {summary}")
+    for failure in failures:
+        print(f"[startup] OVER BUDGET: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
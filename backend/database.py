@@ -1,15 +1,436 @@
+import json
+import os
+import queue
 import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
 
 DB_NAME = "security_investigation.db"
 
+BUSY_TIMEOUT_SECONDS = 30
+BULK_BATCH_SIZE = 5000
+READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', '8'))
+POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+# Applied to every connection; journal_mode=WAL is persistent and set in init_database
+CONNECTION_PRAGMAS = (
+    ('synchronous', os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')),
+    ('cache_size', int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536')) * -1),
+    ('mmap_size', int(os.getenv('SQLITE_MMAP_SIZE_MB', '256')) * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+)
+
+# Composite indexes backing the per-case queries in main.py and the engines
+INDEXES = (
+    ('idx_upload_logs_case_hash', 'upload_logs', 'case_id, file_hash'),
+    ('idx_events_case_valid_ts', 'unified_events', 'case_id, is_valid, timestamp'),
+    ('idx_events_case_type', 'unified_events', 'case_id, event_type'),
+    ('idx_events_case_user_ts', 'unified_events', 'case_id, user_id, timestamp'),
+    ('idx_events_case_receiver_ts', 'unified_events', 'case_id, receiver, timestamp'),
+    ('idx_suspicious_case_severity', 'suspicious_events', 'case_id, severity'),
+    ('idx_suspicious_case_rule', 'suspicious_events', 'case_id, rule_type'),
+    ('idx_suspicious_event', 'suspicious_events', 'event_id'),
+    ('idx_anomaly_case_flag_score', 'anomaly_results', 'case_id, is_anomaly, anomaly_score'),
+    ('idx_anomaly_event', 'anomaly_results', 'event_id'),
+    ('idx_anomaly_staging_case', 'anomaly_results_staging', 'case_id'),
+    ('idx_graph_nodes_case_node', 'graph_nodes', 'case_id, node_id'),
+    ('idx_graph_nodes_case_centrality', 'graph_nodes', 'case_id, centrality'),
+    ('idx_graph_edges_case_source', 'graph_edges', 'case_id, source'),
+    ('idx_graph_edges_case_target', 'graph_edges', 'case_id, target'),
+    ('idx_reports_case_created', 'reports', 'case_id, created_at'),
+    ('idx_jobs_case_type_created', 'jobs', 'case_id, job_type, created_at'),
+    ('idx_jobs_status_created', 'jobs', 'status, created_at'),
+    ('idx_model_registry_active', 'model_registry', 'is_active'),
+    ('idx_entity_occurrences_identifier_ts', 'entity_occurrences', 'identifier, timestamp'),
+    ('idx_entity_occurrences_case', 'entity_occurrences', 'case_id'),
+    ('idx_entity_index_case', 'entity_index', 'case_id'),
+    ('idx_pipeline_runs_case_started', 'pipeline_runs', 'case_id, started_at'),
+)
+
+# Called with the duration of every statement when set; instrumentation.py installs it
+_statement_observer = None
+
+def set_statement_observer(observer):
+    global _statement_observer
+    _statement_observer = observer
+
+def _observed(method, *args):
+    if _statement_observer is None:
+        return method(*args)
+    started = time.perf_counter()
+    try:
+        return method(*args)
+    finally:
+        _statement_observer(time.perf_counter() - started)
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        return _observed(super().execute, *args)
+
+    def executemany(self, *args):
+        return _observed(super().executemany, *args)
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that reports statement timings to the statement observer"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return _observed(super().execute, *args)
+
+    def executemany(self, *args):
+        return _observed(super().executemany, *args)
+
+    def executescript(self, *args):
+        return _observed(super().executescript, *args)
+
+def configure_connection(conn):
+    for pragma, value in CONNECTION_PRAGMAS:
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    return conn
+
 def get_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False, timeout=BUSY_TIMEOUT_SECONDS, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
-    return conn
+    return configure_connection(conn)
+
+class ConnectionPool:
+    """Thread-safe pool of read-only connections plus a single writer connection"""
+
+    def __init__(self, db_name=DB_NAME, max_readers=READ_POOL_SIZE, timeout=POOL_TIMEOUT_SECONDS):
+        self.db_name = db_name
+        self.max_readers = max_readers
+        self.timeout = timeout
+        self._idle_readers = queue.LifoQueue()
+        self._created_readers = 0
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'read_checkouts': 0,
+            'write_checkouts': 0,
+            'in_use': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+        }
+
+    def _connect(self, read_only):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=BUSY_TIMEOUT_SECONDS, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        configure_connection(conn)
+        if read_only:
+            conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    def _record_checkout(self, kind, waited):
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats[f'{kind}_checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+    def _record_checkin(self):
+        with self._lock:
+            self._stats['in_use'] -= 1
+
+    def _record_timeout(self):
+        with self._lock:
+            self._stats['timeouts'] += 1
+
+    def _acquire_reader(self):
+        started = time.perf_counter()
+        try:
+            conn = self._idle_readers.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created_readers < self.max_readers:
+                    self._created_readers += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect(read_only=True)
+                except Exception:
+                    with self._lock:
+                        self._created_readers -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle_readers.get(timeout=self.timeout)
+                except queue.Empty:
+                    self._record_timeout()
+                    raise TimeoutError('Timed out waiting for a database connection')
+        self._record_checkout('read', time.perf_counter() - started)
+        return conn
+
+    def _release_reader(self, conn):
+        self._record_checkin()
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle_readers.put(conn)
+
+    @contextmanager
+    def reader(self):
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+
+    @contextmanager
+    def writer(self):
+        """Exclusive access to the process-wide writer connection"""
+        started = time.perf_counter()
+        if not self._writer_lock.acquire(timeout=self.timeout):
+            self._record_timeout()
+            raise TimeoutError('Timed out waiting for the database writer')
+        try:
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+            self._record_checkout('write', time.perf_counter() - started)
+            try:
+                yield self._writer
+                if self._writer.in_transaction:
+                    self._writer.commit()
+            except Exception:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+                raise
+            finally:
+                self._record_checkin()
+        finally:
+            self._writer_lock.release()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['readers_open'] = self._created_readers
+        stats['readers_idle'] = self._idle_readers.qsize()
+        stats['max_readers'] = self.max_readers
+        stats['wait_time_avg'] = stats['wait_time_total'] / max(stats['checkouts'], 1)
+        return stats
+
+    def close(self):
+        while True:
+            try:
+                self._idle_readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created_readers = 0
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Per-process pool; worker processes never reuse a parent's connections"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool()
+            _pool_pid = os.getpid()
+        return _pool
+
+def get_read_db():
+    """FastAPI dependency: a pooled read-only connection for the request"""
+    with get_pool().reader() as conn:
+        yield conn
+
+def get_write_db():
+    """FastAPI dependency: the writer connection, committed when the request succeeds"""
+    with get_pool().writer() as conn:
+        yield conn
+
+def bump_case_version(case_id, conn=None):
+    """Mark a case's derived data as changed; readers compare versions to detect staleness"""
+    own = conn is None
+    conn = conn or get_connection()
+    conn.execute(
+        '''INSERT INTO case_versions (case_id, version, updated_at) VALUES (?, 1, ?)
+        ON CONFLICT(case_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at''',
+        (case_id, datetime.now().isoformat())
+    )
+    if own:
+        conn.commit()
+        conn.close()
+
+def get_case_version(conn, case_id):
+    row = conn.execute('SELECT version FROM case_versions WHERE case_id = ?', (case_id,)).fetchone()
+    return row['version'] if row else 0
+
+def _chunks(rows, size):
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def bulk_insert(conn, table, columns, rows, batch_size=BULK_BATCH_SIZE, on_conflict=None, commit=True):
+    """Insert an iterable of row tuples with executemany in fixed-size batches.
+
+    on_conflict may be 'IGNORE' or 'REPLACE'. All batches run in one
+    transaction unless commit=False, in which case the caller commits.
+    Returns the number of rows written."""
+    verb = f'INSERT OR {on_conflict}' if on_conflict else 'INSERT'
+    sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    written = 0
+    try:
+        for chunk in _chunks(rows, batch_size):
+            before = conn.total_changes
+            conn.executemany(sql, chunk)
+            written += conn.total_changes - before
+        if commit:
+            conn.commit()
+    except Exception:
+        if commit:
+            conn.rollback()
+        raise
+    return written
+
+def ensure_column(conn, table, column, declaration):
+    """Add a column introduced after a table was first created"""
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+# seq is the rowid. AUTOINCREMENT keeps SQLite from handing out the rowids of archived
+# events again, so hydrate can restore them and the search index still points at them
+UNIFIED_EVENTS_SCHEMA = '''(
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id TEXT NOT NULL UNIQUE,
+        case_id TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        user_id TEXT,
+        timestamp TEXT NOT NULL,
+        source TEXT,
+        amount REAL,
+        receiver TEXT,
+        metadata TEXT,
+        is_valid INTEGER DEFAULT 1,
+        validation_errors TEXT,
+        fingerprint TEXT,
+        FOREIGN KEY (case_id) REFERENCES cases(id)
+    )'''
+
+def _autoincrement_event_rowids(conn):
+    """Rebuild a unified_events table from before AUTOINCREMENT, keeping every rowid"""
+    schema = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'unified_events'").fetchone()[0]
+    if 'AUTOINCREMENT' in schema.upper():
+        return
+    columns = ', '.join(row[1] for row in conn.execute('PRAGMA table_info(unified_events)'))
+    # Archiving used to park a placeholder event at the highest archived rowid; the sequence takes its place
+    high_water = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM unified_events').fetchone()[0]
+    conn.execute(f'CREATE TABLE unified_events_rebuild {UNIFIED_EVENTS_SCHEMA}')
+    conn.execute(
+        f"""INSERT INTO unified_events_rebuild (seq, {columns}) SELECT rowid, {columns} FROM unified_events
+            WHERE case_id != '__archive_rowid_guard__'"""
+    )
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'unified_events_rebuild'")
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('unified_events_rebuild', ?)", (high_water,))
+    conn.execute('DROP TABLE unified_events')
+    conn.execute('ALTER TABLE unified_events_rebuild RENAME TO unified_events')
+    print(f"Rebuilt unified_events with AUTOINCREMENT rowids (high-water mark {high_water})")
+
+# ISO 8601 with a 'T' separator, as written by the legacy normalizer
+ISO_T_TIMESTAMP = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]:[0-9][0-9]:[0-9][0-9]*'
+
+def normalize_event_timestamps(conn, after_rowid=0, case_id=None):
+    """Rewrite 'T'-separated timestamps to the stored 'YYYY-MM-DD HH:MM:SS' form.
+
+    Timeline filters, cursors and the per-party time ranges compare timestamps
+    as text, which only orders correctly when every row uses the same form.
+    Returns the number of rows rewritten; the caller commits."""
+    where = 'rowid > ? AND timestamp GLOB ?'
+    params = [after_rowid, ISO_T_TIMESTAMP]
+    if case_id is not None:
+        where += ' AND case_id = ?'
+        params.append(case_id)
+    # Fingerprints hash the timestamp text; clear them so the next stamping pass recomputes
+    return conn.execute(
+        f"""UPDATE unified_events SET timestamp = substr(timestamp, 1, 10) || ' ' || substr(timestamp, 12, 8),
+               fingerprint = NULL
+            WHERE {where}""",
+        params
+    ).rowcount
+
+def run_migration(conn, name, migrate):
+    """Apply a one-off data migration unless schema_migrations records it as done"""
+    if conn.execute('SELECT 1 FROM schema_migrations WHERE name = ?', (name,)).fetchone():
+        return
+    migrate(conn)
+    conn.execute('INSERT INTO schema_migrations (name, applied_at) VALUES (?, ?)', (name, datetime.now().isoformat()))
+
+def _normalize_stored_timestamps(conn):
+    cases = [row[0] for row in conn.execute(
+        'SELECT DISTINCT case_id FROM unified_events WHERE timestamp GLOB ?', (ISO_T_TIMESTAMP,)
+    )]
+    if not cases:
+        return
+    rewritten = normalize_event_timestamps(conn)
+    conn.execute(
+        "UPDATE entity_occurrences SET timestamp = substr(timestamp, 1, 10) || ' ' || substr(timestamp, 12, 8) WHERE timestamp GLOB ?",
+        (ISO_T_TIMESTAMP,)
+    )
+    for case_id in cases:
+        bump_case_version(case_id, conn)
+    print(f"Normalized {rewritten} event timestamps across {len(cases)} cases")
+
+def _split_communication_edges(conn):
+    """Sparse graph builds used to merge calls and messages into one 'communication' edge
+    type; re-aggregate those edges per event type up to each case's graph watermark"""
+    cases = conn.execute(
+        '''SELECT w.case_id, w.last_rowid FROM graph_watermarks w
+        WHERE EXISTS (SELECT 1 FROM graph_edges e WHERE e.case_id = w.case_id AND e.edge_type = 'communication')'''
+    ).fetchall()
+    for case_id, last_rowid in cases:
+        conn.execute("DELETE FROM graph_edges WHERE case_id = ? AND edge_type = 'communication'", (case_id,))
+        edges = conn.execute(
+            '''SELECT user_id, receiver, event_type, COUNT(*), COALESCE(SUM(amount), 0)
+            FROM unified_events
+            WHERE case_id = ? AND is_valid = 1 AND rowid <= ? AND event_type != 'transaction'
+              AND user_id IS NOT NULL AND receiver IS NOT NULL AND receiver != '' AND receiver != user_id
+            GROUP BY user_id, receiver, event_type''',
+            (case_id, last_rowid)
+        ).fetchall()
+        bulk_insert(
+            conn, 'graph_edges', ('id', 'case_id', 'source', 'target', 'edge_type', 'weight', 'metadata'),
+            (
+                (str(uuid.uuid4()), case_id, source, target, edge_type, weight, json.dumps({'total_amount': amount}))
+                for source, target, edge_type, weight, amount in edges
+            ),
+            commit=False
+        )
+        bump_case_version(case_id, conn)
+    if cases:
+        print(f"Split communication edges by event type in {len(cases)} case graphs")
+
+def optimize_database(conn=None):
+    """Refresh planner statistics for the indexes above"""
+    own = conn is None
+    conn = conn or get_connection()
+    conn.execute('PRAGMA optimize')
+    if own:
+        conn.close()
 
 def init_database():
     conn = get_connection()
+    conn.execute('PRAGMA journal_mode = WAL')
     c = conn.cursor()
     
     # Cases table
@@ -39,20 +460,10 @@ def init_database():
     )''')
     
     # Unified events
-    c.execute('''CREATE TABLE IF NOT EXISTS unified_events (
-        event_id TEXT PRIMARY KEY,
-        case_id TEXT NOT NULL,
-        event_type TEXT NOT NULL,
-        user_id TEXT,
-        timestamp TEXT NOT NULL,
-        source TEXT,
-        amount REAL,
-        receiver TEXT,
-        metadata TEXT,
-        is_valid INTEGER DEFAULT 1,
-        validation_errors TEXT,
-        FOREIGN KEY (case_id) REFERENCES cases(id)
-    )''')
+    c.execute(f'CREATE TABLE IF NOT EXISTS unified_events {UNIFIED_EVENTS_SCHEMA}')
+    
+    ensure_column(conn, 'unified_events', 'fingerprint', 'TEXT')
+    _autoincrement_event_rowids(conn)
     
     # Suspicious events (Rule engine output)
     c.execute('''CREATE TABLE IF NOT EXISTS suspicious_events (
@@ -77,11 +488,27 @@ def init_database():
         is_anomaly INTEGER NOT NULL,
         model_version TEXT NOT NULL,
         feature_snapshot TEXT,
+        feature_vector BLOB,
         detected_at TEXT NOT NULL,
         FOREIGN KEY (case_id) REFERENCES cases(id),
         FOREIGN KEY (event_id) REFERENCES unified_events(event_id)
     )''')
     
+    ensure_column(conn, 'anomaly_results', 'feature_vector', 'BLOB')
+    
+    # Chunked scoring writes here and swaps the finished run into anomaly_results
+    c.execute('''CREATE TABLE IF NOT EXISTS anomaly_results_staging (
+        id TEXT PRIMARY KEY,
+        case_id TEXT NOT NULL,
+        event_id TEXT NOT NULL,
+        anomaly_score REAL NOT NULL,
+        is_anomaly INTEGER NOT NULL,
+        model_version TEXT NOT NULL,
+        feature_snapshot TEXT,
+        feature_vector BLOB,
+        detected_at TEXT NOT NULL
+    )''')
+    
     # Graph nodes
     c.execute('''CREATE TABLE IF NOT EXISTS graph_nodes (
         id TEXT PRIMARY KEY,
@@ -125,9 +552,262 @@ def init_database():
         title TEXT NOT NULL,
         summary TEXT,
         file_path TEXT,
+        case_version INTEGER,
+        details TEXT,
         created_at TEXT NOT NULL,
         FOREIGN KEY (case_id) REFERENCES cases(id)
     )''')
     
+    ensure_column(conn, 'reports', 'case_version', 'INTEGER')
+    ensure_column(conn, 'reports', 'details', 'TEXT')
+    
+    # Background jobs (upload processing, analysis runs)
+    c.execute('''CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        case_id TEXT,
+        job_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        stage TEXT,
+        progress REAL DEFAULT 0,
+        counters TEXT,
+        payload TEXT,
+        result TEXT,
+        error_message TEXT,
+        claimed_by TEXT,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        FOREIGN KEY (case_id) REFERENCES cases(id)
+    )''')
+    
+    # Data version per case, bumped whenever an upload or analysis changes it
+    c.execute('''CREATE TABLE IF NOT EXISTS case_versions (
+        case_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )''')
+    
+    # Incremental rule evaluation state: last evaluated event and per-user counters
+    c.execute('''CREATE TABLE IF NOT EXISTS rule_watermarks (
+        case_id TEXT PRIMARY KEY,
+        last_rowid INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    )''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS rule_user_state (
+        case_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        transaction_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (case_id, user_id)
+    ) WITHOUT ROWID''')
+    
+    # Versioned anomaly model artifacts
+    c.execute('''CREATE TABLE IF NOT EXISTS model_registry (
+        version TEXT PRIMARY KEY,
+        algorithm TEXT NOT NULL,
+        artifact_path TEXT NOT NULL,
+        feature_schema TEXT,
+        training_rows INTEGER,
+        contamination REAL,
+        params TEXT,
+        metrics TEXT,
+        notes TEXT,
+        is_active INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL
+    )''')
+
+    # Sparse graph builds: events folded into graph_edges so far and whether centrality needs a rescore
+    c.execute('''CREATE TABLE IF NOT EXISTS graph_watermarks (
+        case_id TEXT PRIMARY KEY,
+        last_rowid INTEGER NOT NULL,
+        centrality_stale INTEGER NOT NULL DEFAULT 0,
+        epsilon REAL,
+        updated_at TEXT NOT NULL
+    )''')
+
+    # Graph layout computed once per graph build; signature identifies the build
+    c.execute('''CREATE TABLE IF NOT EXISTS graph_layouts (
+        case_id TEXT PRIMARY KEY,
+        signature TEXT NOT NULL,
+        node_count INTEGER NOT NULL,
+        computed_at TEXT NOT NULL
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS graph_layout (
+        case_id TEXT NOT NULL,
+        node_id TEXT NOT NULL,
+        x REAL NOT NULL,
+        y REAL NOT NULL,
+        PRIMARY KEY (case_id, node_id)
+    ) WITHOUT ROWID''')
+
+    # Cross-case entity index: normalized identifier -> cases and events it appears in
+    c.execute('''CREATE TABLE IF NOT EXISTS entity_index (
+        identifier TEXT NOT NULL,
+        case_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        first_seen TEXT,
+        last_seen TEXT,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (identifier, case_id, role)
+    ) WITHOUT ROWID''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS entity_occurrences (
+        identifier TEXT NOT NULL,
+        case_id TEXT NOT NULL,
+        event_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        timestamp TEXT,
+        PRIMARY KEY (identifier, case_id, event_id, role)
+    ) WITHOUT ROWID''')
+
+    # Full-text search over event text; rowid is the unified_events rowid. Combining marks (M*)
+    # count as token characters so Tamil and Devanagari words are not split at vowel signs
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS event_search USING fts5(
+        body,
+        case_key,
+        tokenize = "unicode61 remove_diacritics 2 categories 'L* N* Co M*'",
+        prefix = '2 3'
+    )''')
+
+    # Materialized dashboard counts, valid while version matches case_versions
+    c.execute('''CREATE TABLE IF NOT EXISTS case_summary (
+        case_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        total_events INTEGER NOT NULL DEFAULT 0,
+        valid_events INTEGER NOT NULL DEFAULT 0,
+        invalid_events INTEGER NOT NULL DEFAULT 0,
+        events_by_type TEXT,
+        total_violations INTEGER NOT NULL DEFAULT 0,
+        severity_counts TEXT,
+        rule_counts TEXT,
+        anomaly_total INTEGER NOT NULL DEFAULT 0,
+        anomaly_count INTEGER NOT NULL DEFAULT 0,
+        anomaly_avg_score REAL,
+        updated_at TEXT NOT NULL
+    )''')
+
+    # Incremental training: fixed-size reservoir sample, running feature statistics and watermarks
+    c.execute('''CREATE TABLE IF NOT EXISTS training_reservoir (
+        slot INTEGER PRIMARY KEY,
+        amount REAL NOT NULL,
+        hour REAL NOT NULL,
+        metadata_size REAL NOT NULL,
+        event_type_code REAL NOT NULL,
+        source TEXT,
+        added_at TEXT NOT NULL
+    )''')
+    for column in ('user_velocity', 'pair_velocity', 'log_gap', 'log_since_call'):
+        ensure_column(conn, 'training_reservoir', column, 'REAL')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS training_stats (
+        feature TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        mean REAL NOT NULL,
+        m2 REAL NOT NULL,
+        min REAL,
+        max REAL
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS training_state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )''')
+
+    # AI assistant: compact per-case context and answers, both stamped with the case version
+    c.execute('''CREATE TABLE IF NOT EXISTS case_digests (
+        case_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        sections TEXT NOT NULL,
+        token_estimate INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS assistant_answers (
+        case_id TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        question_key TEXT NOT NULL,
+        question TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        backend TEXT NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (case_id, version, question_key)
+    ) WITHOUT ROWID''')
+
+    # Cases moved to the Parquet archive tier; status is 'archived' or 'hydrated' (rows loaded back for reading)
+    c.execute('''CREATE TABLE IF NOT EXISTS case_archives (
+        case_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        case_version INTEGER NOT NULL,
+        rows TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        flattened_columns TEXT,
+        max_event_rowid INTEGER,
+        layout_current INTEGER NOT NULL DEFAULT 0,
+        archived_at TEXT NOT NULL,
+        hydrated_at TEXT,
+        accessed_at TEXT
+    )''')
+
+    # One row per job (or generated assistant answer) with per-stage timings; see instrumentation.py
+    c.execute('''CREATE TABLE IF NOT EXISTS pipeline_runs (
+        id TEXT PRIMARY KEY,
+        case_id TEXT,
+        job_id TEXT,
+        run_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        error TEXT,
+        started_at TEXT NOT NULL,
+        seconds REAL NOT NULL,
+        rows INTEGER,
+        sql_queries INTEGER NOT NULL DEFAULT 0,
+        sql_seconds REAL NOT NULL DEFAULT 0,
+        peak_rss_mb REAL,
+        stages TEXT NOT NULL,
+        profile_path TEXT
+    )''')
+
+    # One-off data migrations applied by run_migration
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+        name TEXT PRIMARY KEY,
+        applied_at TEXT NOT NULL
+    )''')
+
+    for name, table, columns in INDEXES:
+        c.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+    # Prefixes of the per-party timestamp indexes above
+    c.execute('DROP INDEX IF EXISTS idx_events_case_user')
+    c.execute('DROP INDEX IF EXISTS idx_events_case_receiver')
+    # Latest call of a party before a time, for the window features of scattered events
+    c.execute("CREATE INDEX IF NOT EXISTS idx_events_calls_user_ts ON unified_events (case_id, user_id, timestamp) WHERE event_type = 'call'")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_events_calls_receiver_ts ON unified_events (case_id, receiver, timestamp) WHERE event_type = 'call'")
+
+    run_migration(conn, 'normalize_event_timestamps', _normalize_stored_timestamps)
+
+    # Incremental graph updates upsert on the edge key. Builds from before the index
+    # existed may hold duplicate keys; fold their weights into one row first
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_graph_edges_key'").fetchone():
+        c.execute('''UPDATE graph_edges SET weight = (
+                SELECT SUM(g.weight) FROM graph_edges g
+                WHERE g.case_id = graph_edges.case_id AND g.source = graph_edges.source
+                  AND g.target = graph_edges.target AND g.edge_type IS graph_edges.edge_type)
+            WHERE rowid IN (
+                SELECT MIN(rowid) FROM graph_edges GROUP BY case_id, source, target, edge_type HAVING COUNT(*) > 1)''')
+        c.execute('''DELETE FROM graph_edges WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM graph_edges GROUP BY case_id, source, target, edge_type)''')
+        c.execute('CREATE UNIQUE INDEX idx_graph_edges_key ON graph_edges (case_id, source, target, edge_type)')
+
+    run_migration(conn, 'split_communication_edges', _split_communication_edges)
+
+    # Newest findings per severity; older databases name the timestamp created_at
+    finding_columns = {row[1] for row in c.execute('PRAGMA table_info(suspicious_events)')}
+    finding_ts = 'created_at' if 'created_at' in finding_columns else 'detected_at'
+    c.execute(f'CREATE INDEX IF NOT EXISTS idx_suspicious_case_severity_time ON suspicious_events (case_id, severity, {finding_ts})')
+
+    # One row per distinct record in a case; rows from before fingerprints existed are NULL until stamped
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_events_case_fingerprint ON unified_events (case_id, fingerprint)')
+    
     conn.commit()
+    optimize_database(conn)
     conn.close()
@@ -0,0 +1,164 @@
+import os
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from database import get_connection, bulk_insert
+from engines.model_registry import ModelRegistry
+from engines.window_analytics import WindowAnalyticsEngine, WINDOW_FEATURES
+
+CHUNK_SIZE = int(os.getenv('ANOMALY_CHUNK_SIZE', '50000'))
+SCORING_JOBS = int(os.getenv('ANOMALY_SCORING_JOBS', '1'))
+
+BASE_FEATURE_SCHEMA = ['amount', 'hour', 'metadata_size', 'event_type_code']
+# Models trained before the window features existed keep scoring with the base schema
+FEATURE_SCHEMA = BASE_FEATURE_SCHEMA + WINDOW_FEATURES
+SUPPORTED_SCHEMAS = (FEATURE_SCHEMA, BASE_FEATURE_SCHEMA)
+EVENT_TYPE_CODES = {'call': 0, 'message': 1, 'transaction': 2}
+UNKNOWN_EVENT_TYPE_CODE = 3
+
+RESULT_COLUMNS = (
+    'id', 'case_id', 'event_id', 'anomaly_score', 'is_anomaly',
+    'model_version', 'feature_snapshot', 'feature_vector', 'detected_at'
+)
+
+
+def _score_chunk(model, features):
+    """Runs in a joblib worker: (anomaly score in (0, 1], anomaly flag)"""
+    raw = model.score_samples(features)
+    # Same threshold IsolationForest.predict applies, without a second pass over the trees
+    flags = (raw - model.offset_) < 0
+    return -raw, flags
+
+
+class AnomalyScoringEngine:
+    """Chunked, optionally parallel IsolationForest scoring of a case"""
+
+    @staticmethod
+    def supports(meta):
+        return bool(meta) and meta.get('feature_schema') in SUPPORTED_SCHEMAS
+
+    @staticmethod
+    def feature_matrix(event_types, amounts, timestamps, metadata_sizes, window=None):
+        """Vectorized feature extraction shared by scoring and training; window (n x WINDOW_FEATURES)
+        is appended when given"""
+        amount = pd.to_numeric(pd.Series(amounts), errors='coerce').fillna(0).to_numpy(dtype=np.float32)
+        hour = pd.to_datetime(pd.Series(timestamps), errors='coerce', format='mixed').dt.hour
+        hour = hour.fillna(0).to_numpy(dtype=np.float32)
+        size = pd.Series(metadata_sizes).fillna(0).to_numpy(dtype=np.float32)
+        codes = pd.Series(event_types).map(EVENT_TYPE_CODES).fillna(UNKNOWN_EVENT_TYPE_CODE).to_numpy(dtype=np.float32)
+        base = np.column_stack([amount, hour, size, codes])
+        return base if window is None else np.column_stack([base, window])
+
+    @staticmethod
+    def decode_features(blob):
+        """feature_vector holds the features as packed little-endian float32"""
+        if not blob:
+            return None
+        values = np.frombuffer(blob, dtype='<f4').tolist()
+        return dict(zip(FEATURE_SCHEMA if len(values) == len(FEATURE_SCHEMA) else BASE_FEATURE_SCHEMA, values))
+
+    @staticmethod
+    def iter_feature_chunks(conn, case_id, chunk_size=CHUNK_SIZE, schema=FEATURE_SCHEMA):
+        """Yield (event_ids, feature matrix) per chunk straight from a cursor. With window features
+        the chunks come from WindowAnalyticsEngine.iter_case_features, in (user, time) order"""
+        if schema == FEATURE_SCHEMA:
+            for events, window in WindowAnalyticsEngine.iter_case_features(conn, case_id, chunk_size):
+                if len(events):
+                    yield tuple(events['event_id']), AnomalyScoringEngine.feature_matrix(
+                        events['event_type'].to_numpy(), events['amount'].to_numpy(), events['timestamp'].to_numpy(),
+                        events['metadata_size'].to_numpy(), window=window
+                    )
+            return
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(
+            '''SELECT event_id, event_type, amount, timestamp, LENGTH(metadata)
+            FROM unified_events WHERE case_id = ? AND is_valid = 1''',
+            (case_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            event_ids, event_types, amounts, timestamps, sizes = zip(*rows)
+            yield event_ids, AnomalyScoringEngine.feature_matrix(event_types, amounts, timestamps, sizes)
+
+    @staticmethod
+    def score_case(case_id, chunk_size=CHUNK_SIZE, n_jobs=SCORING_JOBS, on_progress=None):
+        """Score every valid event of a case with the active registry model.
+
+        Up to n_jobs chunks are held in memory and scored in parallel at a time.
+        Chunks are written to anomaly_results_staging and replace the case's
+        anomaly_results in one transaction at the end, so readers never see a partial
+        run and a failed one leaves the previous results in place."""
+        model, meta = ModelRegistry.get_active()
+        if not AnomalyScoringEngine.supports(meta):
+            return {'error': 'Active model does not use the chunked scoring feature schema'}
+
+        started = time.perf_counter()
+        read_conn = get_connection()
+        write_conn = get_connection()
+        stats = {'events_scored': 0, 'anomalies': 0, 'chunks': 0}
+        try:
+            # Left over from a run that died before its swap
+            write_conn.execute('DELETE FROM anomaly_results_staging WHERE case_id = ?', (case_id,))
+            write_conn.commit()
+
+            chunks = AnomalyScoringEngine.iter_feature_chunks(read_conn, case_id, chunk_size, meta['feature_schema'])
+            with Parallel(n_jobs=n_jobs, backend='loky' if n_jobs != 1 else 'sequential') as parallel:
+                while True:
+                    batch = [chunk for _, chunk in zip(range(max(n_jobs, 1)), chunks)]
+                    if not batch:
+                        break
+                    scored = parallel(delayed(_score_chunk)(model, features) for _, features in batch)
+                    for (event_ids, features), (scores, flags) in zip(batch, scored):
+                        AnomalyScoringEngine._write_chunk(write_conn, case_id, meta['version'], event_ids, features, scores, flags)
+                        stats['events_scored'] += len(event_ids)
+                        stats['anomalies'] += int(flags.sum())
+                        stats['chunks'] += 1
+                    if on_progress:
+                        on_progress(dict(stats))
+            if stats['events_scored']:
+                AnomalyScoringEngine._swap_in(write_conn, case_id)
+        finally:
+            write_conn.execute('DELETE FROM anomaly_results_staging WHERE case_id = ?', (case_id,))
+            write_conn.commit()
+            read_conn.close()
+            write_conn.close()
+
+        if not stats['events_scored']:
+            return {'error': 'No valid events to score'}
+
+        stats['model_version'] = meta['version']
+        stats['anomaly_rate'] = round(stats['anomalies'] / stats['events_scored'], 4)
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        return stats
+
+    @staticmethod
+    def _swap_in(conn, case_id):
+        columns = ', '.join(RESULT_COLUMNS)
+        try:
+            conn.execute('DELETE FROM anomaly_results WHERE case_id = ?', (case_id,))
+            conn.execute(
+                f'INSERT INTO anomaly_results ({columns}) SELECT {columns} FROM anomaly_results_staging WHERE case_id = ?',
+                (case_id,)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def _write_chunk(conn, case_id, version, event_ids, features, scores, flags):
+        detected_at = datetime.now().isoformat()
+        packed = features.astype('<f4')
+        rows = (
+            (str(uuid.uuid4()), case_id, event_id, float(score), int(flag), version, None, packed[i].tobytes(), detected_at)
+            for i, (event_id, score, flag) in enumerate(zip(event_ids, scores, flags))
+        )
+        bulk_insert(conn, 'anomaly_results_staging', RESULT_COLUMNS, rows)
@@ -0,0 +1,257 @@
+import abc
+import asyncio
+import os
+import re
+import time
+from datetime import datetime
+
+from database import get_connection, get_pool
+from engines.ai_assistant import AIForensicAssistant
+from engines.case_digest import CaseDigestEngine, estimate_tokens
+from instrumentation import save_run
+
+# "openai" (needs OPENAI_API_KEY), "stub" (offline, deterministic) or "legacy" (AIForensicAssistant)
+ASSISTANT_BACKEND = os.getenv('ASSISTANT_BACKEND', 'openai' if os.getenv('OPENAI_API_KEY') else 'legacy')
+ASSISTANT_MODEL = os.getenv('ASSISTANT_MODEL', 'gpt-4o-mini')
+ASSISTANT_MAX_CONCURRENCY = int(os.getenv('ASSISTANT_MAX_CONCURRENCY', '4'))
+ASSISTANT_MAX_TOKENS = int(os.getenv('ASSISTANT_MAX_TOKENS', '500'))
+ASSISTANT_TIMEOUT_SECONDS = float(os.getenv('ASSISTANT_TIMEOUT', '60'))
+# Cached answers are reused for the exact normalized question only. Setting this (e.g. 0.8)
+# also reuses answers whose question words overlap by that Jaccard ratio
+CACHE_SIMILARITY = float(os.getenv('ASSISTANT_CACHE_SIMILARITY', '0'))
+
+SYSTEM_PROMPT = (
+    "You are a forensic investigation assistant. Answer only from the case context below; "
+    "say so when the context does not contain the answer. Be concise and cite the numbers you use."
+)
+STOPWORDS = frozenset('''
+    a an the is are was were be been of in on at to for from by with and or any all this that these those
+    what which who whom how why when where me my i we our you your it its there their them do does did can
+    could should would will please tell show give about case investigation
+'''.split())
+WORD = re.compile(r"[a-z0-9]+")
+# Words that flip or pin a question's meaning; a fuzzy match must agree on all of them
+NEGATIONS = frozenset(('not', 'no', 'never', 'without', 'except', 'none', 'nor'))
+
+
+def normalize_question(question):
+    """Order-insensitive key: lower-cased content words, crude plural stripping, stopwords removed"""
+    words = set()
+    for word in WORD.findall((question or '').lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.add(word)
+    return ' '.join(sorted(words))
+
+
+def _pinned_words(words):
+    return {w for w in words if w in NEGATIONS or w.isdigit()}
+
+
+def _similarity(a, b):
+    a, b = set(a.split()), set(b.split())
+    if _pinned_words(a) != _pinned_words(b):
+        return 0.0
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class AnswerCache:
+    """Answers per (case, case version, normalized question); a new version retires the old answers"""
+
+    @staticmethod
+    def lookup(conn, case_id, version, question):
+        key = normalize_question(question)
+        row = conn.execute(
+            'SELECT * FROM assistant_answers WHERE case_id = ? AND version = ? AND question_key = ?',
+            (case_id, version, key)
+        ).fetchone()
+        if row:
+            return dict(row)
+        if CACHE_SIMILARITY <= 0:
+            return None
+        best, best_score = None, CACHE_SIMILARITY
+        for candidate in conn.execute(
+            'SELECT * FROM assistant_answers WHERE case_id = ? AND version = ?', (case_id, version)
+        ).fetchall():
+            score = _similarity(key, candidate['question_key'])
+            if score >= best_score:
+                best, best_score = dict(candidate), score
+        return best
+
+    @staticmethod
+    def store(case_id, version, question, answer, backend):
+        conn = get_connection()
+        conn.execute('DELETE FROM assistant_answers WHERE case_id = ? AND version < ?', (case_id, version))
+        conn.execute(
+            '''INSERT OR REPLACE INTO assistant_answers (case_id, version, question_key, question, answer, backend, hits, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, 0, ?)''',
+            (case_id, version, normalize_question(question), question, answer, backend, datetime.now().isoformat())
+        )
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def record_hit(case_id, version, question_key):
+        conn = get_connection()
+        conn.execute(
+            'UPDATE assistant_answers SET hits = hits + 1 WHERE case_id = ? AND version = ? AND question_key = ?',
+            (case_id, version, question_key)
+        )
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def remove_case(case_id, conn=None):
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute('DELETE FROM assistant_answers WHERE case_id = ?', (case_id,))
+        if own:
+            conn.commit()
+            conn.close()
+
+
+class AssistantBackend(abc.ABC):
+    """Pluggable answer generator: stream() yields text chunks for a question and its context"""
+    name = 'base'
+
+    @abc.abstractmethod
+    def stream(self, case_id, question, context):
+        """Async generator of answer text chunks"""
+
+
+class OpenAIBackend(AssistantBackend):
+    name = 'openai'
+
+    def __init__(self):
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(timeout=ASSISTANT_TIMEOUT_SECONDS)
+        return self._client
+
+    async def stream(self, case_id, question, context):
+        response = await self.client().chat.completions.create(
+            model=ASSISTANT_MODEL,
+            messages=[
+                {'role': 'system', 'content': f"{SYSTEM_PROMPT}\n\nCase context:\n{context}"},
+                {'role': 'user', 'content': question}
+            ],
+            max_tokens=ASSISTANT_MAX_TOKENS,
+            temperature=0.2,
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class LocalStubBackend(AssistantBackend):
+    """Offline backend: answers with the retrieved context itself, streamed line by line"""
+    name = 'stub'
+
+    async def stream(self, case_id, question, context):
+        yield f"Question: {question}\nRelevant case context:\n"
+        for line in context.splitlines():
+            await asyncio.sleep(0)
+            yield line + '\n'
+
+
+class LegacyBackend(AssistantBackend):
+    """AIForensicAssistant in a worker thread; it builds its own context, so the digest is unused"""
+    name = 'legacy'
+
+    async def stream(self, case_id, question, context):
+        result = await asyncio.to_thread(AIForensicAssistant.query_assistant, case_id, question)
+        if not result.get('success', True):
+            raise RuntimeError(result.get('response') or 'Assistant query failed')
+        yield result.get('response', '')
+
+
+BACKENDS = {
+    'openai': OpenAIBackend,
+    'stub': LocalStubBackend,
+    'legacy': LegacyBackend,
+}
+
+
+def register_backend(name, backend_class):
+    BACKENDS[name] = backend_class
+
+
+class AssistantService:
+    """Question answering over a case: digest retrieval, answer cache and a concurrency-limited backend"""
+
+    def __init__(self, backend=ASSISTANT_BACKEND, max_concurrency=ASSISTANT_MAX_CONCURRENCY):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown assistant backend: {backend}")
+        self.backend = BACKENDS[backend]()
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore = None
+
+    def _limit(self):
+        # Created on first use so it belongs to the serving event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @staticmethod
+    def _prepare(case_id, question):
+        with get_pool().reader() as conn:
+            version, sections = CaseDigestEngine.get(conn, case_id)
+            cached = AnswerCache.lookup(conn, case_id, version, question)
+        context, tokens = CaseDigestEngine.retrieve(sections, question)
+        return version, context, tokens, cached
+
+    async def open(self, case_id, question):
+        """Resolve context and cache for a question; returns (meta, chunks) with chunks an async iterator"""
+        version, context, tokens, cached = await asyncio.to_thread(self._prepare, case_id, question)
+        meta = {
+            'case_version': version,
+            'context_tokens': tokens,
+            'cached': cached is not None,
+            'backend': cached['backend'] if cached else self.backend.name
+        }
+        if cached:
+            await asyncio.to_thread(AnswerCache.record_hit, case_id, version, cached['question_key'])
+            return meta, self._replay(cached['answer'])
+        return meta, self._generate(case_id, version, question, context)
+
+    @staticmethod
+    async def _replay(answer):
+        yield answer
+
+    async def _generate(self, case_id, version, question, context):
+        parts = []
+        # Stays 'cancelled' when the client disconnects mid-stream
+        status, error = 'cancelled', None
+        async with self._limit():
+            started = time.perf_counter()
+            try:
+                async for chunk in self.backend.stream(case_id, question, context):
+                    parts.append(chunk)
+                    yield chunk
+                status = 'completed'
+            except Exception as e:
+                status, error = 'failed', str(e)
+                raise
+            finally:
+                seconds = time.perf_counter() - started
+                await asyncio.to_thread(save_run, case_id, 'assistant', seconds, [{
+                    'stage': f'assistant_{self.backend.name}', 'parent': None, 'seconds': round(seconds, 4),
+                    'rows': estimate_tokens(context), 'sql_queries': 0, 'sql_seconds': 0.0
+                }], status=status, error=error)
+        answer = ''.join(parts)
+        if answer.strip():
+            await asyncio.to_thread(AnswerCache.store, case_id, version, question, answer, self.backend.name)
+
+    async def ask(self, case_id, question):
+        meta, chunks = await self.open(case_id, question)
+        try:
+            response = ''.join([chunk async for chunk in chunks])
+            return {'response': response, 'success': True, **meta}
+        except Exception as e:
+            return {'response': f"Assistant query failed: {e}", 'success': False, **meta}
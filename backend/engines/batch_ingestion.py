@@ -0,0 +1,254 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+import tarfile
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from itertools import chain
+
+from database import get_connection, bulk_insert
+from engines.deduplication import DeduplicationEngine
+from engines.streaming_ingestion import (
+    StreamingIngestionEngine, SpooledUpload, EVENT_COLUMNS, SPOOL_DIR, CHUNK_SIZE, BATCH_SIZE
+)
+
+BATCH_INGEST_WORKERS = int(os.getenv('BATCH_INGEST_WORKERS', '0')) or os.cpu_count() or 1
+BATCH_INGEST_START_METHOD = os.getenv('JOB_START_METHOD', 'spawn')
+# Upper bound on bytes extracted from one archive (guards against zip bombs)
+ARCHIVE_MAX_BYTES = int(os.getenv('ARCHIVE_MAX_MB', '10240')) * 1024 * 1024
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def _archive_kind(filename, path):
+    name = (filename or '').lower()
+    if name.endswith('.zip'):
+        return 'zip'
+    if name.endswith(ARCHIVE_EXTENSIONS):
+        return 'tar'
+    if StreamingIngestionEngine.detect_format(filename) is None:
+        if zipfile.is_zipfile(path):
+            return 'zip'
+        if tarfile.is_tarfile(path):
+            return 'tar'
+    return None
+
+
+def _iter_archive(kind, path):
+    """(member name, binary file object) for every regular file in the archive"""
+    if kind == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, member
+    else:
+        with tarfile.open(path, 'r:*') as archive:
+            for info in archive:
+                if info.isfile():
+                    member = archive.extractfile(info)
+                    if member is not None:
+                        with member:
+                            yield info.name, member
+
+
+def _ignored_member(name):
+    base = os.path.basename(name)
+    return not base or base.startswith('.') or '__MACOSX' in name.split('/')
+
+
+def parse_member(case_id, member, batch_size=BATCH_SIZE):
+    """Worker-process entry point: parse and normalize one file into pickled row batches.
+
+    Rows go to <member path>.rows so only stats cross the process boundary."""
+    rows_path = member['path'] + '.rows'
+    default_source = os.path.splitext(os.path.basename(member['filename']))[0] or 'upload'
+    stats = {'rows_parsed': 0, 'rows_valid': 0, 'rows_invalid': 0}
+    batch = []
+    try:
+        with open(rows_path, 'wb') as out:
+            for record in StreamingIngestionEngine.iter_records(member['path'], os.path.basename(member['filename'])):
+                row = StreamingIngestionEngine.normalize_record(case_id, record, default_source)
+                batch.append(row)
+                stats['rows_parsed'] += 1
+                stats['rows_valid' if row[9] else 'rows_invalid'] += 1
+                if len(batch) >= batch_size:
+                    pickle.dump(batch, out, protocol=pickle.HIGHEST_PROTOCOL)
+                    batch = []
+            if batch:
+                pickle.dump(batch, out, protocol=pickle.HIGHEST_PROTOCOL)
+        return {'rows_path': rows_path, **stats}
+    except Exception as e:
+        if os.path.exists(rows_path):
+            os.remove(rows_path)
+        return {'error': f"{e} (after {stats['rows_parsed']} records)", **stats}
+
+
+def _read_batches(rows_path):
+    with open(rows_path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+class BatchIngestionEngine:
+    """Multi-file and archive uploads: members are parsed in parallel worker processes
+    and merged into unified_events by a single writer connection"""
+
+    @staticmethod
+    def expand(uploads, spool_dir=SPOOL_DIR):
+        """Split spooled uploads into ingestible members; archives are extracted into the spool.
+
+        Returns (members, skipped) as lists of dicts."""
+        members, skipped = [], []
+        for upload in uploads:
+            kind = _archive_kind(upload['filename'], upload['path'])
+            if kind is None:
+                if StreamingIngestionEngine.detect_format(upload['filename']) is None:
+                    skipped.append({'filename': upload['filename'], 'reason': 'unsupported file type'})
+                    SpooledUpload(upload['filename'], upload['path'], None, 0).discard()
+                else:
+                    members.append(dict(upload))
+                continue
+
+            extracted = 0
+            try:
+                for name, source in _iter_archive(kind, upload['path']):
+                    filename = f"{upload['filename']}/{name}"
+                    if _ignored_member(name):
+                        continue
+                    if StreamingIngestionEngine.detect_format(name) is None:
+                        skipped.append({'filename': filename, 'reason': 'unsupported file type'})
+                        continue
+                    path = os.path.join(spool_dir, f"{uuid.uuid4().hex}.part")
+                    sha256 = hashlib.sha256()
+                    size = 0
+                    with open(path, 'wb') as out:
+                        while True:
+                            chunk = source.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            extracted += len(chunk)
+                            if extracted > ARCHIVE_MAX_BYTES:
+                                out.close()
+                                os.remove(path)
+                                raise ValueError(f"Archive expands beyond {ARCHIVE_MAX_BYTES} bytes")
+                            sha256.update(chunk)
+                            size += len(chunk)
+                            out.write(chunk)
+                    members.append({'filename': filename, 'path': path, 'file_hash': sha256.hexdigest(), 'file_size': size})
+            except (zipfile.BadZipFile, tarfile.TarError, ValueError) as e:
+                skipped.append({'filename': upload['filename'], 'reason': f"unreadable archive: {e}"})
+            finally:
+                SpooledUpload(upload['filename'], upload['path'], None, 0).discard()
+        return members, skipped
+
+    @staticmethod
+    def dedupe(case_id, members):
+        """Drop members already ingested into the case (same file hash) or repeated within the batch"""
+        conn = get_connection()
+        known = {row[0] for row in conn.execute(
+            "SELECT file_hash FROM upload_logs WHERE case_id = ? AND status = 'completed' AND file_hash IS NOT NULL",
+            (case_id,)
+        )}
+        conn.close()
+
+        unique, duplicates, seen = [], [], set()
+        for member in members:
+            if member['file_hash'] in known or member['file_hash'] in seen:
+                reason = 'already ingested' if member['file_hash'] in known else 'duplicate within upload'
+                duplicates.append({'filename': member['filename'], 'reason': reason})
+                SpooledUpload(member['filename'], member['path'], None, 0).discard()
+            else:
+                seen.add(member['file_hash'])
+                unique.append(member)
+        return unique, duplicates
+
+    @staticmethod
+    def _store(conn, case_id, member, parsed):
+        """Single-writer merge of one parsed member, in one transaction with its upload log"""
+        upload_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        if 'error' in parsed:
+            conn.execute(
+                'INSERT INTO upload_logs (id, case_id, filename, file_hash, file_size, status, error_message, uploaded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (upload_id, case_id, member['filename'], member['file_hash'], member['file_size'], 'failed', parsed['error'], now)
+            )
+            conn.commit()
+            return None
+        try:
+            before = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM unified_events').fetchone()[0]
+            written = bulk_insert(
+                conn, 'unified_events', EVENT_COLUMNS,
+                chain.from_iterable(_read_batches(parsed['rows_path'])), on_conflict='IGNORE', commit=False
+            )
+            parsed['rows_duplicate'] = parsed['rows_parsed'] - written
+            conn.execute(
+                'UPDATE cases SET records_count = COALESCE(records_count, 0) + ? WHERE id = ?',
+                (DeduplicationEngine.count_valid_since(conn, case_id, before), case_id)
+            )
+            conn.execute(
+                'INSERT INTO upload_logs (id, case_id, filename, file_hash, file_size, status, uploaded_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (upload_id, case_id, member['filename'], member['file_hash'], member['file_size'], 'completed', now)
+            )
+            conn.commit()
+            return upload_id
+        except Exception:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def ingest(case_id, members, workers=BATCH_INGEST_WORKERS, on_progress=None):
+        """Parse members in parallel and merge each as soon as it is ready; returns combined stats"""
+        stats = {
+            'files_total': len(members), 'files_done': 0, 'files_failed': 0,
+            'bytes_total': sum(m['file_size'] for m in members), 'bytes_done': 0,
+            'rows_parsed': 0, 'rows_valid': 0, 'rows_invalid': 0, 'rows_duplicate': 0,
+            'uploads': [], 'failures': []
+        }
+        if not members:
+            return stats
+
+        workers = max(1, min(workers, len(members)))
+        conn = get_connection()
+        # Largest files first so one big member doesn't start last
+        ordered = sorted(members, key=lambda m: -m['file_size'])
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(BATCH_INGEST_START_METHOD)
+            ) as pool:
+                futures = {pool.submit(parse_member, case_id, member): member for member in ordered}
+                for future in as_completed(futures):
+                    member = futures[future]
+                    try:
+                        parsed = future.result()
+                    except Exception as e:
+                        parsed = {'error': str(e), 'rows_parsed': 0, 'rows_valid': 0, 'rows_invalid': 0}
+                    try:
+                        upload_id = BatchIngestionEngine._store(conn, case_id, member, parsed)
+                    finally:
+                        if parsed.get('rows_path') and os.path.exists(parsed['rows_path']):
+                            os.remove(parsed['rows_path'])
+                        SpooledUpload(member['filename'], member['path'], None, 0).discard()
+
+                    stats['files_done'] += 1
+                    stats['bytes_done'] += member['file_size']
+                    if upload_id:
+                        stats['uploads'].append({'filename': member['filename'], 'upload_id': upload_id, 'rows': parsed['rows_parsed']})
+                        for key in ('rows_parsed', 'rows_valid', 'rows_invalid', 'rows_duplicate'):
+                            stats[key] += parsed[key]
+                    else:
+                        stats['files_failed'] += 1
+                        stats['failures'].append({'filename': member['filename'], 'error': parsed['error']})
+                    if on_progress:
+                        on_progress(dict(stats))
+        finally:
+            conn.close()
+            for member in members:
+                SpooledUpload(member['filename'], member['path'], None, 0).discard()
+                SpooledUpload(member['filename'], member['path'] + '.rows', None, 0).discard()
+        return stats
@@ -0,0 +1,360 @@
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+from database import get_connection, bulk_insert, normalize_event_timestamps
+from engines.graph_view import GraphViewEngine
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+# "manual" archives only via the archive endpoint; "reported" also after a case's report is rendered
+CASE_ARCHIVE_MODE = os.getenv('CASE_ARCHIVE_MODE', 'manual')
+ARCHIVE_COMPRESSION = os.getenv('ARCHIVE_COMPRESSION', 'zstd')
+# Rows of a case hydrated for reading are dropped again after this long without a read
+HYDRATED_TTL_HOURS = float(os.getenv('ARCHIVE_HYDRATED_TTL_HOURS', '24'))
+EXPORT_BATCH_SIZE = 50000
+TOUCH_INTERVAL_SECONDS = 60
+
+# Tables moved out of SQLite, and the columns restored into them (rowid is kept for unified_events)
+ARCHIVED_TABLES = {
+    'unified_events': (
+        'event_id', 'case_id', 'event_type', 'user_id', 'timestamp', 'source',
+        'amount', 'receiver', 'metadata', 'is_valid', 'validation_errors', 'fingerprint'
+    ),
+    'suspicious_events': (
+        'id', 'case_id', 'event_id', 'rule_type', 'severity', 'score_contribution', 'description', 'detected_at'
+    ),
+    'anomaly_results': (
+        'id', 'case_id', 'event_id', 'anomaly_score', 'is_anomaly', 'model_version',
+        'feature_snapshot', 'feature_vector', 'detected_at'
+    ),
+    'graph_nodes': ('id', 'case_id', 'node_id', 'node_type', 'label', 'centrality', 'metadata'),
+    'graph_edges': ('id', 'case_id', 'source', 'target', 'edge_type', 'weight', 'metadata'),
+}
+KEEP_ROWID = ('unified_events',)
+META_PREFIX = 'meta_'
+COLUMN_NAME = re.compile(r'[^0-9a-zA-Z_]+')
+
+_hydrate_lock = threading.Lock()
+
+
+def _arrow():
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    return pa, pq
+
+
+def _column_types(pa):
+    return {
+        'TEXT': pa.string(), 'INTEGER': pa.int64(), 'REAL': pa.float64(), 'BLOB': pa.binary(),
+    }
+
+
+class CaseArchiveEngine:
+    """Columnar archive tier for closed cases.
+
+    A case's events, findings, anomaly results and graph move to compressed Parquet
+    (one hive-style partition per case: archive/<table>/case_id=<id>/data.parquet) and
+    are deleted from SQLite. JSON metadata is also flattened into typed meta_<key>
+    columns for scans; the original text is kept so restores are exact.
+
+    Rows are hydrated back from memory-mapped Parquet by a job, never inside a
+    request: the API checks readable() and queues a 'hydrate' job for an archived
+    case, jobs call ensure_hot(). Idle hydrated cases are evicted again. Anything
+    that changes case data calls restore() first, which hydrates and drops the archive."""
+
+    @staticmethod
+    def table_path(table, case_id, base_dir=ARCHIVE_DIR):
+        return os.path.join(base_dir, table, f'case_id={case_id}', 'data.parquet')
+
+    @staticmethod
+    def get_archive(conn, case_id):
+        row = conn.execute('SELECT * FROM case_archives WHERE case_id = ?', (case_id,)).fetchone()
+        if not row:
+            return None
+        return {**dict(row), 'rows': json.loads(row['rows'])}
+
+    @staticmethod
+    def _metadata_columns(conn, table, case_id):
+        """Typed columns for top-level metadata keys with one consistent JSON type across the case"""
+        types = {}
+        for key, kind in conn.execute(
+            f'''SELECT DISTINCT j.key, j.type FROM {table} t,
+            json_each(CASE WHEN json_valid(t.metadata) AND json_type(t.metadata) = 'object' THEN t.metadata ELSE '{{}}' END) j
+            WHERE t.case_id = ?''',
+            (case_id,)
+        ):
+            types.setdefault(key, set()).add(kind)
+
+        pa, _ = _arrow()
+        columns, taken = {}, set(ARCHIVED_TABLES[table])
+        for key, kinds in sorted(types.items()):
+            kinds.discard('null')
+            if not kinds:
+                continue
+            if kinds <= {'integer'}:
+                arrow_type = pa.int64()
+            elif kinds <= {'integer', 'real'}:
+                arrow_type = pa.float64()
+            elif kinds <= {'true', 'false'}:
+                arrow_type = pa.bool_()
+            elif kinds <= {'text'}:
+                arrow_type = pa.string()
+            else:
+                # Nested or mixed values stay available through the raw metadata column only
+                continue
+            name = META_PREFIX + COLUMN_NAME.sub('_', key).strip('_').lower()
+            if name in taken:
+                continue
+            taken.add(name)
+            columns[name] = (key, arrow_type)
+        return columns
+
+    @staticmethod
+    def _export_table(conn, table, case_id, path):
+        """Stream a table's rows for the case into one Parquet file; returns (rows, max rowid, meta columns)"""
+        pa, pq = _arrow()
+        declared = {row[1]: (row[2] or 'TEXT').upper() for row in conn.execute(f'PRAGMA table_info({table})')}
+        columns = ARCHIVED_TABLES[table]
+        arrow_types = _column_types(pa)
+        fields = [pa.field('_rowid', pa.int64())] + [
+            pa.field(c, arrow_types.get(declared.get(c, 'TEXT'), pa.string())) for c in columns
+        ]
+        meta = CaseArchiveEngine._metadata_columns(conn, table, case_id) if 'metadata' in columns else {}
+        fields += [pa.field(name, arrow_type) for name, (_, arrow_type) in meta.items()]
+        schema = pa.schema(fields, metadata={'flattened_metadata': json.dumps({n: k for n, (k, _) in meta.items()})})
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(
+            f"SELECT rowid, {', '.join(columns)} FROM {table} WHERE case_id = ? ORDER BY rowid", (case_id,)
+        )
+        rows_written, max_rowid = 0, 0
+        metadata_index = columns.index('metadata') + 1 if meta else None
+        with pq.ParquetWriter(path, schema, compression=ARCHIVE_COMPRESSION) as writer:
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                data = [list(values) for values in zip(*rows)]
+                if meta:
+                    flattened = {name: [] for name in meta}
+                    for text in data[metadata_index]:
+                        try:
+                            parsed = json.loads(text) if text else {}
+                        except ValueError:
+                            parsed = {}
+                        if not isinstance(parsed, dict):
+                            parsed = {}
+                        for name, (key, _) in meta.items():
+                            flattened[name].append(parsed.get(key))
+                    data += [flattened[name] for name in meta]
+                writer.write_batch(pa.RecordBatch.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(data, schema)], schema=schema
+                ))
+                rows_written += len(rows)
+                max_rowid = rows[-1][0]
+        return rows_written, max_rowid, list(meta)
+
+    @staticmethod
+    def _drop_hot_rows(conn, case_id):
+        for table in ARCHIVED_TABLES:
+            conn.execute(f'DELETE FROM {table} WHERE case_id = ?', (case_id,))
+
+    @staticmethod
+    def archive(case_id):
+        """Export the case to Parquet and drop its rows from SQLite. A case already archived at
+        its current version (e.g. hydrated for reading) is only evicted, not exported again"""
+        conn = get_connection()
+        try:
+            version_row = conn.execute('SELECT version FROM case_versions WHERE case_id = ?', (case_id,)).fetchone()
+            version = version_row['version'] if version_row else 0
+            existing = CaseArchiveEngine.get_archive(conn, case_id)
+            if existing and existing['case_version'] == version:
+                if existing['status'] == 'hydrated':
+                    CaseArchiveEngine.evict(case_id, conn)
+                return {**existing, 'exported': False}
+
+            # Export to a staging directory, verify, then swap into place
+            staging = os.path.join(ARCHIVE_DIR, '.staging', case_id)
+            shutil.rmtree(staging, ignore_errors=True)
+            counts, size, max_event_rowid, flattened = {}, 0, 0, {}
+            _, pq = _arrow()
+            for table in ARCHIVED_TABLES:
+                path = CaseArchiveEngine.table_path(table, case_id, staging)
+                rows, max_rowid, meta = CaseArchiveEngine._export_table(conn, table, case_id, path)
+                if pq.ParquetFile(path).metadata.num_rows != rows:
+                    raise ValueError(f'Archive of {table} is incomplete')
+                counts[table] = rows
+                size += os.path.getsize(path)
+                if meta:
+                    flattened[table] = meta
+                if table == 'unified_events':
+                    max_event_rowid = max_rowid
+
+            for table in ARCHIVED_TABLES:
+                target = CaseArchiveEngine.table_path(table, case_id)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(CaseArchiveEngine.table_path(table, case_id, staging), target)
+            shutil.rmtree(staging, ignore_errors=True)
+
+            layout = conn.execute('SELECT signature FROM graph_layouts WHERE case_id = ?', (case_id,)).fetchone()
+            layout_current = bool(layout) and layout['signature'] == GraphViewEngine.build_signature(conn, case_id)
+
+            now = datetime.now().isoformat()
+            conn.execute('BEGIN IMMEDIATE')
+            CaseArchiveEngine._drop_hot_rows(conn, case_id)
+            conn.execute(
+                '''INSERT OR REPLACE INTO case_archives (case_id, status, case_version, rows, bytes, flattened_columns,
+                max_event_rowid, layout_current, archived_at, hydrated_at, accessed_at)
+                VALUES (?, 'archived', ?, ?, ?, ?, ?, ?, ?, NULL, NULL)''',
+                (case_id, version, json.dumps(counts), size, json.dumps(flattened), max_event_rowid, int(layout_current), now)
+            )
+            conn.commit()
+            return {**CaseArchiveEngine.get_archive(conn, case_id), 'exported': True}
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _hydrate_table(conn, table, case_id):
+        _, pq = _arrow()
+        columns = ARCHIVED_TABLES[table]
+        keep_rowid = table in KEEP_ROWID
+        parquet = pq.ParquetFile(CaseArchiveEngine.table_path(table, case_id), memory_map=True)
+
+        def rows():
+            for batch in parquet.iter_batches(batch_size=EXPORT_BATCH_SIZE, columns=['_rowid', *columns] if keep_rowid else list(columns)):
+                yield from zip(*(column.to_pylist() for column in batch.columns))
+
+        return bulk_insert(conn, table, ('rowid', *columns) if keep_rowid else columns, rows(), commit=False)
+
+    @staticmethod
+    def hydrate(case_id):
+        """Load an archived case's rows back into SQLite for reading; the archive stays authoritative"""
+        with _hydrate_lock:
+            conn = get_connection()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                archive = CaseArchiveEngine.get_archive(conn, case_id)
+                if not archive or archive['status'] != 'archived':
+                    conn.rollback()
+                    return False
+                for table in ARCHIVED_TABLES:
+                    CaseArchiveEngine._hydrate_table(conn, table, case_id)
+                # Archives written before timestamps were normalized still hold the 'T' form
+                normalize_event_timestamps(conn, case_id=case_id)
+
+                # Restored graph rows get new rowids; a layout that was current still describes the same graph
+                if archive['layout_current']:
+                    conn.execute(
+                        'UPDATE graph_layouts SET signature = ? WHERE case_id = ?',
+                        (GraphViewEngine.build_signature(conn, case_id), case_id)
+                    )
+                now = datetime.now().isoformat()
+                conn.execute(
+                    "UPDATE case_archives SET status = 'hydrated', hydrated_at = ?, accessed_at = ? WHERE case_id = ?",
+                    (now, now, case_id)
+                )
+                conn.commit()
+                return True
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    @staticmethod
+    def readable(case_id, conn=None):
+        """Whether the case's rows are in SQLite: it isn't archived, or it is hydrated (which
+        counts as an access). Never hydrates, so it is safe on the request path"""
+        own = conn is None
+        conn = conn or get_connection()
+        try:
+            archive = conn.execute(
+                'SELECT status, accessed_at FROM case_archives WHERE case_id = ?', (case_id,)
+            ).fetchone()
+            if archive and archive['status'] == 'hydrated':
+                now = datetime.now()
+                if not archive['accessed_at'] or now - datetime.fromisoformat(archive['accessed_at']) > timedelta(seconds=TOUCH_INTERVAL_SECONDS):
+                    conn.execute('UPDATE case_archives SET accessed_at = ? WHERE case_id = ?', (now.isoformat(), case_id))
+                    conn.commit()
+            return not archive or archive['status'] == 'hydrated'
+        finally:
+            if own:
+                conn.close()
+
+    @staticmethod
+    def ensure_hot(case_id):
+        """Make an archived case's rows readable, hydrating synchronously. For jobs only;
+        requests use readable() and queue a 'hydrate' job instead"""
+        if CaseArchiveEngine.readable(case_id):
+            return False
+        hydrated = CaseArchiveEngine.hydrate(case_id)
+        CaseArchiveEngine.evict_idle()
+        return hydrated
+
+    @staticmethod
+    def evict(case_id, conn=None):
+        """Drop a hydrated case's rows from SQLite again"""
+        own = conn is None
+        conn = conn or get_connection()
+        try:
+            archive = CaseArchiveEngine.get_archive(conn, case_id)
+            if not archive or archive['status'] != 'hydrated':
+                return False
+            CaseArchiveEngine._drop_hot_rows(conn, case_id)
+            conn.execute("UPDATE case_archives SET status = 'archived', hydrated_at = NULL WHERE case_id = ?", (case_id,))
+            conn.commit()
+            return True
+        finally:
+            if own:
+                conn.close()
+
+    @staticmethod
+    def evict_idle(ttl_hours=HYDRATED_TTL_HOURS):
+        conn = get_connection()
+        cutoff = (datetime.now() - timedelta(hours=ttl_hours)).isoformat()
+        idle = [row[0] for row in conn.execute(
+            "SELECT case_id FROM case_archives WHERE status = 'hydrated' AND accessed_at < ?", (cutoff,)
+        )]
+        for case_id in idle:
+            CaseArchiveEngine.evict(case_id, conn)
+        conn.close()
+        return idle
+
+    @staticmethod
+    def restore(case_id, conn=None):
+        """Bring an archived case back to the hot tables for good, before its data changes.
+        The rows are copied on hydrate's own connection; dropping the archive entry goes
+        through conn when given"""
+        own = conn is None
+        conn = conn or get_connection()
+        try:
+            if not CaseArchiveEngine.get_archive(conn, case_id):
+                return False
+            CaseArchiveEngine.hydrate(case_id)
+            CaseArchiveEngine.remove_case(case_id, conn)
+            if own:
+                conn.commit()
+            return True
+        finally:
+            if own:
+                conn.close()
+
+    @staticmethod
+    def remove_case(case_id, conn=None):
+        """Forget the archive (rows already hydrated stay in SQLite) and delete its files"""
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute('DELETE FROM case_archives WHERE case_id = ?', (case_id,))
+        if own:
+            conn.commit()
+            conn.close()
+        for table in ARCHIVED_TABLES:
+            shutil.rmtree(os.path.dirname(CaseArchiveEngine.table_path(table, case_id)), ignore_errors=True)
@@ -0,0 +1,165 @@
+import json
+import os
+import re
+from datetime import datetime
+
+from database import get_connection, get_case_version
+from engines.case_summary import CaseSummaryEngine, SEVERITIES
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('ASSISTANT_CONTEXT_TOKENS', '1500'))
+DIGEST_TOP_K = 10
+CHARS_PER_TOKEN = 4
+
+# Question words that make a section relevant; the overview is always included
+SECTION_KEYWORDS = {
+    'risk': ('risk', 'score', 'level', 'why', 'overall', 'summar', 'severity', 'concern'),
+    'rules': ('rule', 'violation', 'pattern', 'suspicious', 'flag', 'finding', 'summar', 'concern', 'detect'),
+    'violations': ('violation', 'midnight', 'night', 'value', 'transaction', 'transfer', 'flag', 'example', 'detail'),
+    'anomalies': ('anomal', 'unusual', 'outlier', 'deviation', 'model', 'baseline', 'abnormal'),
+    'network': ('network', 'graph', 'connection', 'central', 'cluster', 'link', 'relationship', 'hub'),
+    'entities': ('user', 'entit', 'account', 'who', 'people', 'phone', 'person', 'suspect', 'high-risk'),
+}
+WORD = re.compile(r"[a-z0-9\-]+")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class CaseDigestEngine:
+    """Compact, sectioned text digest of a case's findings for the assistant prompt.
+
+    Built from the case summary plus a few top-K reads and stored per case version,
+    so questions between analysis runs never touch the event tables."""
+
+    @staticmethod
+    def build(conn, case_id):
+        summary = CaseSummaryEngine.get(conn, case_id, fresh=True)
+        case = conn.execute('SELECT name, description FROM cases WHERE id = ?', (case_id,)).fetchone()
+        risk = conn.execute('SELECT * FROM case_risk WHERE case_id = ?', (case_id,)).fetchone()
+        sections = []
+
+        types = ', '.join(f'{t} {n}' for t, n in sorted(summary['events_by_type'].items(), key=lambda i: -i[1]))
+        sections.append(('overview', (
+            f"Case '{case['name'] if case else case_id}'"
+            + (f" ({case['description']})" if case and case['description'] else '')
+            + f": {summary['total_events']} events ({summary['valid_events']} valid, {summary['invalid_events']} invalid)"
+            + (f"; by type: {types}." if types else '.')
+            + f" {summary['total_violations']} rule violations, {summary['anomaly_count']} anomalous events."
+        )))
+
+        if risk:
+            sections.append(('risk', (
+                f"Overall risk {risk['total_score']:.0f}/100 ({(risk['risk_level'] or 'unknown').upper()}). "
+                f"Contributions: rule violations {risk['rule_score_total'] or 0:.1f}, "
+                f"anomalies {risk['anomaly_score_total'] or 0:.1f}, network correlation {risk['correlation_score'] or 0:.1f}."
+            )))
+
+        if summary['rule_counts']:
+            severities = ', '.join(f"{s} {summary['severity_counts'].get(s, 0)}" for s in SEVERITIES)
+            rules = '; '.join(
+                f"{name}: {rule['violations']} ({rule['severity']})"
+                for name, rule in sorted(summary['rule_counts'].items(), key=lambda r: -r[1]['violations'])
+            )
+            sections.append(('rules', f"Violations by severity: {severities}. By rule: {rules}."))
+
+            violations = CaseSummaryEngine.top_violations(conn, case_id, summary, limit=DIGEST_TOP_K)
+            sections.append(('violations', 'Most severe recent violations:\n' + '\n'.join(
+                f"- [{v['severity']}] {v['rule_type']}: {v['description'] or v['event_id']}" for v in violations
+            )))
+
+            entities = conn.execute(
+                '''SELECT e.user_id, COUNT(*) AS findings, COUNT(DISTINCT s.rule_type) AS rules
+                FROM suspicious_events s JOIN unified_events e ON e.event_id = s.event_id
+                WHERE s.case_id = ? AND s.severity IN ('critical', 'high') AND e.user_id IS NOT NULL
+                GROUP BY e.user_id ORDER BY findings DESC LIMIT ?''',
+                (case_id, DIGEST_TOP_K)
+            ).fetchall()
+            if entities:
+                sections.append(('entities', 'Users with the most critical/high findings: ' + '; '.join(
+                    f"{e['user_id']} ({e['findings']} findings across {e['rules']} rules)" for e in entities
+                ) + '.'))
+
+        if summary['anomaly_count']:
+            anomalies = CaseSummaryEngine.top_anomalies(conn, case_id, limit=DIGEST_TOP_K)
+            lines = []
+            for a in anomalies:
+                event = a.get('event', {})
+                lines.append(
+                    f"- score {a['anomaly_score']:.2f}: {event.get('event_type')} at {event.get('timestamp')}, "
+                    f"{event.get('user_id')} -> {event.get('receiver')}"
+                    + (f", amount {event['amount']}" if event.get('amount') is not None else '')
+                )
+            sections.append(('anomalies', (
+                f"{summary['anomaly_count']} of {summary['anomaly_total']} scored events are anomalous "
+                f"(average anomaly score {summary['anomaly_avg_score'] or 0:.2f}). Top anomalies:\n" + '\n'.join(lines)
+            )))
+
+        nodes = conn.execute(
+            'SELECT node_id, node_type, centrality FROM graph_nodes WHERE case_id = ? ORDER BY centrality DESC LIMIT ?',
+            (case_id, DIGEST_TOP_K)
+        ).fetchall()
+        if nodes:
+            sections.append(('network', 'Most central nodes in the communication/transaction graph: ' + '; '.join(
+                f"{n['node_id']} ({n['node_type']}, centrality {n['centrality'] or 0:.3f})" for n in nodes
+            ) + '.'))
+
+        return [{'name': name, 'text': text, 'tokens': estimate_tokens(text)} for name, text in sections]
+
+    @staticmethod
+    def refresh(case_id):
+        conn = get_connection()
+        try:
+            version = get_case_version(conn, case_id)
+            sections = CaseDigestEngine.build(conn, case_id)
+            conn.execute(
+                'INSERT OR REPLACE INTO case_digests (case_id, version, sections, token_estimate, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (case_id, version, json.dumps(sections), sum(s['tokens'] for s in sections), datetime.now().isoformat())
+            )
+            conn.commit()
+            return version, sections
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get(conn, case_id):
+        """(version, sections) for the current case version, rebuilt only when the version moved"""
+        row = conn.execute('SELECT version, sections FROM case_digests WHERE case_id = ?', (case_id,)).fetchone()
+        if row and row['version'] == get_case_version(conn, case_id):
+            return row['version'], json.loads(row['sections'])
+        return CaseDigestEngine.refresh(case_id)
+
+    @staticmethod
+    def retrieve(sections, question, token_budget=CONTEXT_TOKEN_BUDGET):
+        """Context text for a question: the overview, then sections ranked by keyword overlap, within the budget.
+
+        A question that matches no section gets every section in digest order."""
+        words = WORD.findall((question or '').lower())
+
+        def relevance(section):
+            keywords = SECTION_KEYWORDS.get(section['name'], ())
+            return sum(1 for w in words for k in keywords if w.startswith(k) or k in w)
+
+        scored = [(relevance(s), i, s) for i, s in enumerate(sections) if s['name'] != 'overview']
+        if any(score for score, _, _ in scored):
+            scored = [item for item in scored if item[0] > 0]
+        ranked = [s for s in sections if s['name'] == 'overview'] + [
+            s for _, _, s in sorted(scored, key=lambda item: (-item[0], item[1]))
+        ]
+
+        chosen, used = [], 0
+        for section in ranked:
+            if used + section['tokens'] > token_budget:
+                continue
+            chosen.append(section)
+            used += section['tokens']
+        return '\n\n'.join(s['text'] for s in chosen), used
+
+    @staticmethod
+    def remove_case(case_id, conn=None):
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute('DELETE FROM case_digests WHERE case_id = ?', (case_id,))
+        if own:
+            conn.commit()
+            conn.close()
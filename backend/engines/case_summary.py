@@ -0,0 +1,167 @@
+import json
+from datetime import datetime
+
+from database import get_connection, get_case_version
+from engines.vectorized_rules import VectorizedRuleEngine
+from jobs import JobQueue
+
+SEVERITY_RANK = {'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
+SEVERITIES = ('critical', 'high', 'medium', 'low')
+
+
+class CaseSummaryEngine:
+    """Materialized per-case counts, stamped with the case version they were computed at"""
+
+    @staticmethod
+    def compute(conn, case_id):
+        """Aggregate the summary straight from the underlying tables (index-only scans)"""
+        validity = dict(conn.execute(
+            'SELECT is_valid, COUNT(*) FROM unified_events WHERE case_id = ? GROUP BY is_valid',
+            (case_id,)
+        ).fetchall())
+        events_by_type = dict(conn.execute(
+            'SELECT event_type, COUNT(*) FROM unified_events WHERE case_id = ? GROUP BY event_type',
+            (case_id,)
+        ).fetchall())
+
+        severity_counts = {severity: 0 for severity in SEVERITIES}
+        severity_counts.update(conn.execute(
+            'SELECT severity, COUNT(*) FROM suspicious_events WHERE case_id = ? GROUP BY severity',
+            (case_id,)
+        ).fetchall())
+        rank = ' '.join(f"WHEN '{s}' THEN {r}" for s, r in SEVERITY_RANK.items())
+        ranks = {r: s for s, r in SEVERITY_RANK.items()}
+        rule_counts = {
+            rule_type: {'violations': count, 'severity': ranks.get(top)}
+            for rule_type, count, top in conn.execute(
+                f'''SELECT rule_type, COUNT(*), MAX(CASE severity {rank} END)
+                FROM suspicious_events WHERE case_id = ? GROUP BY rule_type''',
+                (case_id,)
+            ).fetchall()
+        }
+
+        anomaly = conn.execute(
+            '''SELECT COUNT(*), COALESCE(SUM(is_anomaly), 0), AVG(CASE WHEN is_anomaly = 1 THEN anomaly_score END)
+            FROM anomaly_results WHERE case_id = ?''',
+            (case_id,)
+        ).fetchone()
+
+        return {
+            'case_id': case_id,
+            'total_events': sum(validity.values()),
+            'valid_events': validity.get(1, 0),
+            'invalid_events': sum(v for k, v in validity.items() if k != 1),
+            'events_by_type': events_by_type,
+            'total_violations': sum(severity_counts.values()),
+            'severity_counts': severity_counts,
+            'rule_counts': rule_counts,
+            'anomaly_total': anomaly[0],
+            'anomaly_count': anomaly[1],
+            'anomaly_avg_score': anomaly[2]
+        }
+
+    @staticmethod
+    def _store(conn, summary, version):
+        conn.execute(
+            '''INSERT OR REPLACE INTO case_summary (case_id, version, total_events, valid_events, invalid_events,
+                events_by_type, total_violations, severity_counts, rule_counts,
+                anomaly_total, anomaly_count, anomaly_avg_score, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (
+                summary['case_id'], version, summary['total_events'], summary['valid_events'],
+                summary['invalid_events'], json.dumps(summary['events_by_type']), summary['total_violations'],
+                json.dumps(summary['severity_counts']), json.dumps(summary['rule_counts']),
+                summary['anomaly_total'], summary['anomaly_count'], summary['anomaly_avg_score'],
+                datetime.now().isoformat()
+            )
+        )
+
+    @staticmethod
+    def refresh(case_id):
+        """Recompute and store the summary; called by pipeline stages after they bump the version,
+        and by the 'summary' job"""
+        conn = get_connection()
+        try:
+            # Read the version first: if it moves while we aggregate, readers see a mismatch and recompute
+            version = get_case_version(conn, case_id)
+            summary = CaseSummaryEngine.compute(conn, case_id)
+            CaseSummaryEngine._store(conn, summary, version)
+            conn.commit()
+            summary['version'] = version
+            return summary
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get(conn, case_id, fresh=False):
+        """The stored summary, with 'stale' set when the case changed after it was computed.
+
+        Reads never write it: a stale or missing summary queues one 'summary' job, and the
+        last stored summary is returned meanwhile (a missing one is aggregated on conn).
+        fresh=True aggregates a stale summary on conn instead, for reports and digests
+        that are stored per case version"""
+        row = conn.execute('SELECT * FROM case_summary WHERE case_id = ?', (case_id,)).fetchone()
+        version = get_case_version(conn, case_id)
+        if row and row['version'] == version:
+            summary = CaseSummaryEngine._from_row(row)
+            summary['stale'] = False
+            return summary
+        JobQueue.submit_once('summary', case_id)
+        if row and not fresh:
+            summary = CaseSummaryEngine._from_row(row)
+            summary['stale'] = True
+            return summary
+        summary = CaseSummaryEngine.compute(conn, case_id)
+        summary.update(version=version, stale=False)
+        return summary
+
+    @staticmethod
+    def _from_row(row):
+        summary = dict(row)
+        for key in ('events_by_type', 'severity_counts', 'rule_counts'):
+            summary[key] = json.loads(summary[key])
+        return summary
+
+    @staticmethod
+    def top_violations(conn, case_id, summary, limit=50):
+        """Most severe first, newest first within a severity; each step is an index range scan"""
+        ts_column = VectorizedRuleEngine.timestamp_column(conn)
+        violations = []
+        for severity in SEVERITIES:
+            if len(violations) >= limit:
+                break
+            if not summary['severity_counts'].get(severity):
+                continue
+            violations.extend(dict(s) for s in conn.execute(
+                f'SELECT * FROM suspicious_events WHERE case_id = ? AND severity = ? ORDER BY {ts_column} DESC LIMIT ?',
+                (case_id, severity, limit - len(violations))
+            ).fetchall())
+        return violations
+
+    @staticmethod
+    def top_anomalies(conn, case_id, limit=20):
+        """Highest-scoring anomalies with their events attached, read off the (case_id, is_anomaly, anomaly_score) index"""
+        anomalies = [dict(a) for a in conn.execute(
+            'SELECT * FROM anomaly_results WHERE case_id = ? AND is_anomaly = 1 ORDER BY anomaly_score DESC LIMIT ?',
+            (case_id, limit)
+        ).fetchall()]
+        event_ids = [a['event_id'] for a in anomalies]
+        if event_ids:
+            rows = conn.execute(
+                f"SELECT * FROM unified_events WHERE event_id IN ({', '.join('?' * len(event_ids))})",
+                event_ids
+            ).fetchall()
+            events = {e['event_id']: dict(e) for e in rows}
+            for anomaly in anomalies:
+                if anomaly['event_id'] in events:
+                    anomaly['event'] = events[anomaly['event_id']]
+        return anomalies
+
+    @staticmethod
+    def remove_case(case_id, conn=None):
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute('DELETE FROM case_summary WHERE case_id = ?', (case_id,))
+        if own:
+            conn.commit()
+            conn.close()
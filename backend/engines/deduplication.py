@@ -0,0 +1,94 @@
+import hashlib
+import json
+
+from database import get_connection
+
+
+def event_fingerprint(event_type, user_id, receiver, timestamp, amount, metadata):
+    """Stable content hash of a normalized event.
+
+    The source column is left out because it defaults to the upload's file name,
+    which differs between overlapping exports of the same records. Metadata is
+    included (with sorted keys) so distinct messages in the same second survive."""
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            pass
+    if isinstance(metadata, dict):
+        metadata = json.dumps(metadata, sort_keys=True, ensure_ascii=False, default=str)
+    parts = (
+        event_type or '',
+        user_id or '',
+        receiver or '',
+        timestamp or '',
+        repr(float(amount)) if amount is not None else '',
+        metadata or ''
+    )
+    return hashlib.sha1('\x1f'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+class DeduplicationEngine:
+    """File-level (upload hash) and record-level (content fingerprint) deduplication"""
+
+    @staticmethod
+    def find_completed_upload(conn, case_id, file_hash):
+        """The completed upload of this exact file in the case, if any"""
+        if not file_hash:
+            return None
+        row = conn.execute(
+            '''SELECT id, filename, uploaded_at FROM upload_logs
+            WHERE case_id = ? AND file_hash = ? AND status = 'completed' LIMIT 1''',
+            (case_id, file_hash)
+        ).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def fingerprint_events(case_id, after_rowid=0, remove_duplicates=False):
+        """Stamp fingerprints on the case's events that lack one (rows written by the legacy path
+        or before fingerprints existed). Returns (stamped, removed).
+
+        A row whose fingerprint already exists in the case is a duplicate. With
+        remove_duplicates it is deleted, which is only safe for rows nothing has been
+        derived from yet; otherwise it is kept and marked 'dup:<event_id>' so it is not
+        revisited."""
+        conn = get_connection()
+        try:
+            conn.create_function('event_fingerprint', 6, event_fingerprint, deterministic=True)
+            stamped = conn.execute(
+                '''UPDATE OR IGNORE unified_events
+                SET fingerprint = event_fingerprint(event_type, user_id, receiver, timestamp, amount, metadata)
+                WHERE case_id = ? AND fingerprint IS NULL AND rowid > ?''',
+                (case_id, after_rowid)
+            ).rowcount
+            removed = 0
+            if remove_duplicates:
+                valid = conn.execute(
+                    'SELECT COUNT(*) FROM unified_events WHERE case_id = ? AND fingerprint IS NULL AND rowid > ? AND is_valid = 1',
+                    (case_id, after_rowid)
+                ).fetchone()[0]
+                removed = conn.execute(
+                    'DELETE FROM unified_events WHERE case_id = ? AND fingerprint IS NULL AND rowid > ?',
+                    (case_id, after_rowid)
+                ).rowcount
+                conn.execute(
+                    'UPDATE cases SET records_count = MAX(COALESCE(records_count, 0) - ?, 0) WHERE id = ?',
+                    (valid, case_id)
+                )
+            else:
+                conn.execute(
+                    '''UPDATE unified_events SET fingerprint = 'dup:' || event_id
+                    WHERE case_id = ? AND fingerprint IS NULL AND rowid > ?''',
+                    (case_id, after_rowid)
+                )
+            conn.commit()
+            return stamped, removed
+        finally:
+            conn.close()
+
+    @staticmethod
+    def count_valid_since(conn, case_id, after_rowid):
+        return conn.execute(
+            'SELECT COUNT(*) FROM unified_events WHERE case_id = ? AND rowid > ? AND is_valid = 1',
+            (case_id, after_rowid)
+        ).fetchone()[0]
@@ -0,0 +1,155 @@
+import re
+
+from database import get_connection
+
+# Metadata keys that hold phone numbers or account ids besides user_id / receiver
+METADATA_IDENTIFIER_KEYS = (
+    'caller', 'callee', 'sender', 'receiver', 'recipient', 'from', 'to',
+    'from_account', 'to_account', 'account', 'account_id', 'account_number',
+    'phone', 'phone_number', 'mobile', 'contact', 'msisdn'
+)
+PHONE_PATTERN = re.compile(r'^[\d\s\-+().]+$')
+PHONE_DIGITS = 10
+MIN_PHONE_DIGITS = 7
+MAX_MATCHES = 1000
+
+
+def normalize_identifier(value):
+    """Canonical form of a phone number or account id, or None if there is nothing to index.
+
+    Phone-like values keep their last 10 digits so +91 98765 43210 and 9876543210
+    match; anything else is upper-cased with spaces and dashes removed."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    if PHONE_PATTERN.match(text):
+        digits = re.sub(r'\D', '', text)
+        if len(digits) >= MIN_PHONE_DIGITS:
+            return digits[-PHONE_DIGITS:]
+    return re.sub(r'[\s\-]', '', text).upper() or None
+
+
+class EntityIndexEngine:
+    """Cross-case index of identifiers seen in unified_events"""
+
+    @staticmethod
+    def _collect(conn, case_id, after_rowid):
+        """Stage this case's occurrences after the rowid in a temp table, minus ones already indexed"""
+        conn.create_function('normalize_identifier', 1, normalize_identifier, deterministic=True)
+        keys = ', '.join(f"'{k}'" for k in METADATA_IDENTIFIER_KEYS)
+        conn.execute('DROP TABLE IF EXISTS temp.new_occurrences')
+        conn.execute('''CREATE TEMP TABLE new_occurrences (
+            identifier TEXT, case_id TEXT, event_id TEXT, role TEXT, timestamp TEXT,
+            PRIMARY KEY (identifier, case_id, event_id, role)
+        ) WITHOUT ROWID''')
+        conn.execute(
+            f'''INSERT OR IGNORE INTO new_occurrences
+            SELECT identifier, case_id, event_id, role, timestamp FROM (
+                SELECT normalize_identifier(user_id) AS identifier, case_id, event_id, 'user' AS role, timestamp
+                FROM unified_events WHERE case_id = ? AND rowid > ?
+                UNION ALL
+                SELECT normalize_identifier(receiver), case_id, event_id, 'receiver', timestamp
+                FROM unified_events WHERE case_id = ? AND rowid > ?
+                UNION ALL
+                SELECT normalize_identifier(j.value), e.case_id, e.event_id, 'metadata', e.timestamp
+                FROM unified_events e, json_each(CASE WHEN json_valid(e.metadata) THEN e.metadata ELSE '{{}}' END) j
+                WHERE e.case_id = ? AND e.rowid > ? AND j.key IN ({keys}) AND j.type IN ('text', 'integer')
+            ) WHERE identifier IS NOT NULL''',
+            (case_id, after_rowid) * 3
+        )
+        # An identifier in metadata that is also the user or receiver is not a separate mention
+        conn.execute(
+            '''DELETE FROM new_occurrences WHERE role = 'metadata' AND EXISTS (
+                SELECT 1 FROM new_occurrences o WHERE o.identifier = new_occurrences.identifier
+                  AND o.event_id = new_occurrences.event_id AND o.role != 'metadata')'''
+        )
+        # Re-indexing the same rows must not double count
+        conn.execute(
+            '''DELETE FROM new_occurrences WHERE EXISTS (
+                SELECT 1 FROM entity_occurrences o WHERE o.identifier = new_occurrences.identifier
+                  AND o.case_id = new_occurrences.case_id AND o.event_id = new_occurrences.event_id
+                  AND o.role = new_occurrences.role)'''
+        )
+
+    @staticmethod
+    def index_events(case_id, after_rowid=0):
+        """Index the case's events stored after the given rowid; returns new occurrences"""
+        conn = get_connection()
+        try:
+            EntityIndexEngine._collect(conn, case_id, after_rowid)
+            conn.execute('INSERT INTO entity_occurrences SELECT * FROM new_occurrences')
+            conn.execute(
+                '''INSERT INTO entity_index (identifier, case_id, role, first_seen, last_seen, count)
+                SELECT identifier, case_id, role, MIN(timestamp), MAX(timestamp), COUNT(*)
+                FROM new_occurrences WHERE 1 GROUP BY identifier, case_id, role
+                ON CONFLICT(identifier, case_id, role) DO UPDATE SET
+                    first_seen = MIN(COALESCE(first_seen, excluded.first_seen), COALESCE(excluded.first_seen, first_seen)),
+                    last_seen = MAX(COALESCE(last_seen, excluded.last_seen), COALESCE(excluded.last_seen, last_seen)),
+                    count = count + excluded.count'''
+            )
+            added = conn.execute('SELECT COUNT(*) FROM new_occurrences').fetchone()[0]
+            conn.execute('DROP TABLE temp.new_occurrences')
+            conn.commit()
+            return added
+        finally:
+            conn.close()
+
+    @staticmethod
+    def remove_case(case_id, conn=None):
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute('DELETE FROM entity_occurrences WHERE case_id = ?', (case_id,))
+        conn.execute('DELETE FROM entity_index WHERE case_id = ?', (case_id,))
+        if own:
+            conn.commit()
+            conn.close()
+
+    @staticmethod
+    def lookup(conn, identifier, exclude_case=None, limit=100):
+        """Cases and events involving an identifier, most active case first"""
+        key = normalize_identifier(identifier)
+        if key is None:
+            return None
+        limit = min(limit, MAX_MATCHES)
+
+        summary = conn.execute(
+            '''SELECT i.case_id, c.name AS case_name, i.role, i.first_seen, i.last_seen, i.count
+            FROM entity_index i LEFT JOIN cases c ON c.id = i.case_id
+            WHERE i.identifier = ? AND (? IS NULL OR i.case_id != ?)
+            ORDER BY i.count DESC''',
+            (key, exclude_case, exclude_case)
+        ).fetchall()
+
+        cases = {}
+        for row in summary:
+            case = cases.setdefault(row['case_id'], {
+                'case_id': row['case_id'],
+                'case_name': row['case_name'],
+                'first_seen': row['first_seen'],
+                'last_seen': row['last_seen'],
+                'count': 0,
+                'roles': {}
+            })
+            case['roles'][row['role']] = row['count']
+            case['count'] += row['count']
+            if row['first_seen'] and (not case['first_seen'] or row['first_seen'] < case['first_seen']):
+                case['first_seen'] = row['first_seen']
+            if row['last_seen'] and (not case['last_seen'] or row['last_seen'] > case['last_seen']):
+                case['last_seen'] = row['last_seen']
+
+        events = conn.execute(
+            '''SELECT o.case_id, o.event_id, o.role, o.timestamp, e.event_type, e.source, e.user_id, e.receiver
+            FROM entity_occurrences o JOIN unified_events e ON e.event_id = o.event_id
+            WHERE o.identifier = ? AND (? IS NULL OR o.case_id != ?)
+            ORDER BY o.timestamp DESC LIMIT ?''',
+            (key, exclude_case, exclude_case, limit)
+        ).fetchall()
+
+        return {
+            'identifier': key,
+            'cases': sorted(cases.values(), key=lambda c: c['count'], reverse=True),
+            'events': [dict(e) for e in events],
+            'total_occurrences': sum(c['count'] for c in cases.values())
+        }
@@ -0,0 +1,227 @@
+import json
+import math
+import os
+import zlib
+from datetime import datetime
+
+from database import get_connection, bulk_insert
+
+DEFAULT_NODE_LIMIT = int(os.getenv('GRAPH_DEFAULT_NODE_LIMIT', '300'))
+MAX_NODE_LIMIT = 5000
+MAX_HOPS = 3
+# Only the most central nodes get a force-directed layout; the rest are placed next to a neighbour
+LAYOUT_NODE_LIMIT = int(os.getenv('GRAPH_LAYOUT_NODE_LIMIT', '1500'))
+LAYOUT_CENTER = (400.0, 300.0)
+LAYOUT_SCALE = 350.0
+
+
+class GraphViewEngine:
+    """Filtered, level-of-detail reads of a case graph with a cached layout"""
+
+    @staticmethod
+    def _edge_filter(case_id, filters):
+        clauses = ['case_id = ?']
+        params = [case_id]
+        if filters.get('min_weight'):
+            clauses.append('weight >= ?')
+            params.append(filters['min_weight'])
+        if filters.get('edge_type'):
+            clauses.append('edge_type = ?')
+            params.append(filters['edge_type'])
+        return ' AND '.join(clauses), params
+
+    @staticmethod
+    def build_signature(conn, case_id):
+        """Identifies one graph build: a rebuild rewrites the rows, which moves max(rowid)"""
+        row = conn.execute(
+            'SELECT COUNT(*), MAX(rowid) FROM graph_nodes WHERE case_id = ?', (case_id,)
+        ).fetchone()
+        return f"{row[0]}:{row[1]}"
+
+    @staticmethod
+    def compute_layout(case_id):
+        """Lay out the case graph once and store the coordinates in graph_layout"""
+        # networkx is only needed here; keep it out of the API process until a layout is built
+        import networkx as nx
+
+        conn = get_connection()
+        try:
+            signature = GraphViewEngine.build_signature(conn, case_id)
+            nodes = conn.execute(
+                'SELECT node_id FROM graph_nodes WHERE case_id = ? ORDER BY centrality DESC',
+                (case_id,)
+            ).fetchall()
+            node_ids = [n[0] for n in nodes]
+            core = set(node_ids[:LAYOUT_NODE_LIMIT])
+
+            graph = nx.Graph()
+            graph.add_nodes_from(core)
+            # Heaviest edges first: each outer node is anchored to its strongest neighbour
+            anchors = {}
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            for source, target, weight in cursor.execute(
+                'SELECT source, target, weight FROM graph_edges WHERE case_id = ? ORDER BY weight DESC',
+                (case_id,)
+            ):
+                if source in core and target in core:
+                    if not graph.has_edge(source, target):
+                        graph.add_edge(source, target, weight=weight or 1.0)
+                else:
+                    anchors.setdefault(source, target)
+                    anchors.setdefault(target, source)
+
+            positions = {}
+            if graph.number_of_nodes():
+                layout = nx.spring_layout(graph, weight='weight', seed=42, iterations=50)
+                positions = {node: (float(x), float(y)) for node, (x, y) in layout.items()}
+
+            GraphViewEngine._place_outer_nodes(node_ids, positions, anchors)
+
+            cx, cy = LAYOUT_CENTER
+            conn.execute('DELETE FROM graph_layout WHERE case_id = ?', (case_id,))
+            bulk_insert(
+                conn, 'graph_layout', ('case_id', 'node_id', 'x', 'y'),
+                (
+                    (case_id, node, round(cx + x * LAYOUT_SCALE, 2), round(cy + y * LAYOUT_SCALE, 2))
+                    for node, (x, y) in positions.items()
+                ),
+                commit=False
+            )
+            conn.execute(
+                '''INSERT INTO graph_layouts (case_id, signature, node_count, computed_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(case_id) DO UPDATE SET signature = excluded.signature,
+                    node_count = excluded.node_count, computed_at = excluded.computed_at''',
+                (case_id, signature, len(positions), datetime.now().isoformat())
+            )
+            conn.commit()
+            return len(positions)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _place_outer_nodes(node_ids, positions, anchors):
+        unplaced = [n for n in node_ids if n not in positions]
+        # A few passes resolve chains of outer nodes anchored to other outer nodes
+        for depth in range(1, MAX_HOPS + 1):
+            remaining = []
+            for node in unplaced:
+                anchor = positions.get(anchors.get(node))
+                if anchor is None:
+                    remaining.append(node)
+                    continue
+                angle = (zlib.crc32(str(node).encode()) % 3600) / 3600 * 2 * math.pi
+                offset = 0.08 / depth
+                positions[node] = (anchor[0] + math.cos(angle) * offset, anchor[1] + math.sin(angle) * offset)
+            if len(remaining) == len(unplaced):
+                break
+            unplaced = remaining
+
+        # Disconnected leftovers go on an outer ring
+        for i, node in enumerate(unplaced):
+            angle = i / len(unplaced) * 2 * math.pi
+            positions[node] = (math.cos(angle) * 1.3, math.sin(angle) * 1.3)
+
+    @staticmethod
+    def layout_stale(conn, case_id):
+        """True when the graph was rebuilt since the cached layout; the analysis job lays it out again"""
+        cached = conn.execute('SELECT signature FROM graph_layouts WHERE case_id = ?', (case_id,)).fetchone()
+        return not cached or cached['signature'] != GraphViewEngine.build_signature(conn, case_id)
+
+    @staticmethod
+    def clear_layout(case_id, conn=None):
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute('DELETE FROM graph_layout WHERE case_id = ?', (case_id,))
+        conn.execute('DELETE FROM graph_layouts WHERE case_id = ?', (case_id,))
+        if own:
+            conn.commit()
+            conn.close()
+
+    @staticmethod
+    def _ego_nodes(conn, case_id, filters, center, hops):
+        where, params = GraphViewEngine._edge_filter(case_id, filters)
+        visited = {center}
+        frontier = [center]
+        for _ in range(hops):
+            if not frontier:
+                break
+            members = json.dumps(frontier)
+            rows = conn.execute(
+                f'''SELECT source, target FROM graph_edges WHERE {where} AND source IN (SELECT value FROM json_each(?))
+                UNION ALL
+                SELECT source, target FROM graph_edges WHERE {where} AND target IN (SELECT value FROM json_each(?))''',
+                params + [members] + params + [members]
+            ).fetchall()
+            next_frontier = set()
+            for source, target in rows:
+                next_frontier.update((source, target))
+            frontier = list(next_frontier - visited)
+            visited.update(frontier)
+        return visited
+
+    @staticmethod
+    def get_view(conn, case_id, filters):
+        """Nodes and edges matching the filters, capped to the most central nodes.
+
+        Coordinates come from the cached layout only; nodes it does not cover have null
+        x/y and layout_stale is set until the analysis job has laid out the current build"""
+        limit = min(filters.get('top_k') or DEFAULT_NODE_LIMIT, MAX_NODE_LIMIT)
+        where, params = GraphViewEngine._edge_filter(case_id, filters)
+
+        node_columns = '''g.node_id, g.label, g.node_type, g.centrality, l.x, l.y
+            FROM graph_nodes g LEFT JOIN graph_layout l ON l.case_id = g.case_id AND l.node_id = g.node_id'''
+        center = filters.get('ego')
+        if center:
+            ego = GraphViewEngine._ego_nodes(conn, case_id, filters, center, filters.get('hops') or 1)
+            nodes = conn.execute(
+                f'''SELECT {node_columns}
+                WHERE g.case_id = ? AND g.node_id IN (SELECT value FROM json_each(?))
+                ORDER BY g.node_id = ? DESC, g.centrality DESC LIMIT ?''',
+                (case_id, json.dumps(list(ego)), center, limit + 1)
+            ).fetchall()
+        else:
+            # Walk nodes by centrality and keep those with at least one edge left after filtering
+            nodes = conn.execute(
+                f'''SELECT {node_columns}
+                WHERE g.case_id = ?
+                  AND (EXISTS (SELECT 1 FROM graph_edges WHERE {where} AND source = g.node_id)
+                    OR EXISTS (SELECT 1 FROM graph_edges WHERE {where} AND target = g.node_id))
+                ORDER BY g.centrality DESC LIMIT ?''',
+                [case_id] + params + params + [limit + 1]
+            ).fetchall()
+
+        truncated = len(nodes) > limit
+        nodes = nodes[:limit]
+        selected = json.dumps([n['node_id'] for n in nodes])
+        edges = conn.execute(
+            f'''SELECT id, source, target, edge_type, weight FROM graph_edges WHERE {where}
+            AND source IN (SELECT value FROM json_each(?)) AND target IN (SELECT value FROM json_each(?))''',
+            params + [selected, selected]
+        ).fetchall()
+
+        return {
+            'nodes': [
+                {
+                    'id': n['node_id'],
+                    'label': n['label'],
+                    'type': n['node_type'],
+                    'centrality': n['centrality'],
+                    'x': n['x'],
+                    'y': n['y']
+                }
+                for n in nodes
+            ],
+            'edges': [
+                {
+                    'id': e['id'],
+                    'source': e['source'],
+                    'target': e['target'],
+                    'label': e['edge_type'],
+                    'weight': e['weight']
+                }
+                for e in edges
+            ],
+            'truncated': truncated,
+            'layout_stale': GraphViewEngine.layout_stale(conn, case_id)
+        }
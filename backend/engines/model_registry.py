@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+
+import joblib
+
+from database import get_connection
+
+MODELS_DIR = 'models'
+REGISTRY_DIR = os.path.join(MODELS_DIR, 'registry')
+LEGACY_MODEL_PATH = os.path.join(MODELS_DIR, 'anomaly_model.pkl')
+LEGACY_VERSION = 'v1.0.0'
+
+
+class ModelRegistry:
+    """Versioned anomaly model artifacts with the active model cached in memory.
+
+    Artifacts are written uncompressed, so loading them skips decompression. Each
+    process holds its own copy: sklearn rebuilds the forest's trees when unpickling,
+    so memory-mapping the artifact would not share them between workers."""
+
+    _loaded = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _to_dict(row):
+        meta = dict(row)
+        for key in ('feature_schema', 'params', 'metrics'):
+            meta[key] = json.loads(meta[key]) if meta[key] else None
+        meta['is_active'] = bool(meta['is_active'])
+        return meta
+
+    @staticmethod
+    def _next_version(conn):
+        count = conn.execute('SELECT COUNT(*) FROM model_registry').fetchone()[0]
+        version = f"v{count + 1}.0.0"
+        while conn.execute('SELECT 1 FROM model_registry WHERE version = ?', (version,)).fetchone():
+            count += 1
+            version = f"v{count + 1}.0.0"
+        return version
+
+    @staticmethod
+    def register(model, feature_schema=None, training_rows=None, contamination=None,
+                 params=None, metrics=None, notes=None, activate=True, version=None):
+        """Persist a fitted model as a new version and optionally make it active"""
+        conn = get_connection()
+        try:
+            version = version or ModelRegistry._next_version(conn)
+            artifact_dir = os.path.join(REGISTRY_DIR, version)
+            os.makedirs(artifact_dir, exist_ok=True)
+            artifact_path = os.path.join(artifact_dir, 'model.joblib')
+            joblib.dump(model, artifact_path)
+
+            conn.execute(
+                '''INSERT INTO model_registry (version, algorithm, artifact_path, feature_schema, training_rows,
+                    contamination, params, metrics, notes, is_active, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)''',
+                (
+                    version, type(model).__name__, artifact_path,
+                    json.dumps(feature_schema) if feature_schema else None,
+                    training_rows, contamination,
+                    json.dumps(params) if params else None,
+                    json.dumps(metrics) if metrics else None,
+                    notes, datetime.now().isoformat()
+                )
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        if activate:
+            ModelRegistry.activate(version)
+        return version
+
+    @staticmethod
+    def import_legacy(path=LEGACY_MODEL_PATH, version=None, activate=True):
+        """Register the pickle written by AnomalyEngine.train_baseline_model()"""
+        model = joblib.load(path)
+        return ModelRegistry.register(
+            model,
+            feature_schema=None,
+            training_rows=getattr(model, '_n_samples', None),
+            contamination=getattr(model, 'contamination', None),
+            params={'n_estimators': getattr(model, 'n_estimators', None)},
+            notes=f"Imported from {path}",
+            activate=activate,
+            version=version
+        )
+
+    @staticmethod
+    def bootstrap():
+        """Seed an empty registry with the legacy model so there is always an active version.
+        Called lazily by the read methods below, so it runs whether or not the API warmed up"""
+        conn = get_connection()
+        has_models = conn.execute('SELECT 1 FROM model_registry LIMIT 1').fetchone()
+        conn.close()
+        if not has_models and os.path.exists(LEGACY_MODEL_PATH):
+            try:
+                return ModelRegistry.import_legacy(version=LEGACY_VERSION)
+            except sqlite3.IntegrityError:
+                # Another worker registered it first
+                return None
+        return None
+
+    @staticmethod
+    def activate(version, conn=None):
+        """Switch the active version. With a caller's connection nothing is committed or
+        loaded here; the switch takes effect once the caller commits"""
+        own = conn is None
+        conn = conn or get_connection()
+        try:
+            if not conn.execute('SELECT 1 FROM model_registry WHERE version = ?', (version,)).fetchone():
+                raise ValueError(f"Unknown model version: {version}")
+            conn.execute('UPDATE model_registry SET is_active = (version = ?)', (version,))
+            if own:
+                conn.commit()
+        finally:
+            if own:
+                conn.close()
+        # Other workers notice the change on their next get_active() call
+        return ModelRegistry.get_active() if own else None
+
+    @staticmethod
+    def get(version):
+        conn = get_connection()
+        row = conn.execute('SELECT * FROM model_registry WHERE version = ?', (version,)).fetchone()
+        conn.close()
+        return ModelRegistry._to_dict(row) if row else None
+
+    @staticmethod
+    def list_models():
+        conn = get_connection()
+        rows = conn.execute('SELECT * FROM model_registry ORDER BY created_at DESC').fetchall()
+        conn.close()
+        if not rows and ModelRegistry.bootstrap():
+            return ModelRegistry.list_models()
+        return [ModelRegistry._to_dict(r) for r in rows]
+
+    @staticmethod
+    def active_version():
+        conn = get_connection()
+        row = conn.execute('SELECT version FROM model_registry WHERE is_active = 1').fetchone()
+        conn.close()
+        if row is None and ModelRegistry.bootstrap():
+            return ModelRegistry.active_version()
+        return row['version'] if row else None
+
+    @staticmethod
+    def get_active():
+        """Return (model, metadata) for the active version, loading it only when it changed"""
+        version = ModelRegistry.active_version()
+        if version is None:
+            return None, None
+
+        loaded = ModelRegistry._loaded
+        if loaded and loaded['version'] == version:
+            return loaded['model'], loaded['meta']
+
+        with ModelRegistry._lock:
+            loaded = ModelRegistry._loaded
+            if loaded and loaded['version'] == version:
+                return loaded['model'], loaded['meta']
+            meta = ModelRegistry.get(version)
+            model = joblib.load(meta['artifact_path'])
+            ModelRegistry._loaded = {'version': version, 'model': model, 'meta': meta}
+            print(f"Loaded anomaly model {version}")
+            return model, meta
+
+    @staticmethod
+    def preload():
+        return ModelRegistry.get_active()[1]
+
+    @staticmethod
+    def delete(version):
+        meta = ModelRegistry.get(version)
+        if not meta:
+            raise ValueError(f"Unknown model version: {version}")
+        if meta['is_active']:
+            raise ValueError("Cannot delete the active model")
+        conn = get_connection()
+        conn.execute('DELETE FROM model_registry WHERE version = ?', (version,))
+        conn.commit()
+        conn.close()
+        shutil.rmtree(os.path.dirname(meta['artifact_path']), ignore_errors=True)
@@ -0,0 +1,311 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from database import get_connection
+from engines.anomaly_scoring import AnomalyScoringEngine, FEATURE_SCHEMA
+from engines.window_analytics import WindowAnalyticsEngine, WINDOW_FEATURES
+from engines.model_registry import ModelRegistry
+from engines.streaming_ingestion import StreamingIngestionEngine
+
+SEED_DATASET_PATH = 'training_dataset_5k.json'
+RESERVOIR_SIZE = int(os.getenv('TRAINING_RESERVOIR_SIZE', '50000'))
+UPDATE_CHUNK_SIZE = 50000
+DEFAULT_TIME_BUDGET_SECONDS = float(os.getenv('TRAINING_TIME_BUDGET', '60'))
+CONTAMINATION = 0.1
+ESTIMATOR_STEP = 25
+MAX_ESTIMATORS = 300
+# Share of the time budget catch-up folding may use before the forest is grown
+FOLD_BUDGET_SHARE = 0.5
+
+
+class IncrementalTrainer:
+    """Baseline model training over a fixed-size reservoir sample of all events.
+
+    New events are folded into running feature statistics and the reservoir
+    (Algorithm R) once each, so training cost depends on the reservoir size,
+    not on how many events the evidence store holds."""
+
+    @staticmethod
+    def _get_state(conn, key, default=0):
+        row = conn.execute('SELECT value FROM training_state WHERE key = ?', (key,)).fetchone()
+        return int(row['value']) if row else default
+
+    @staticmethod
+    def _set_state(conn, key, value):
+        conn.execute(
+            'INSERT INTO training_state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+            (key, str(value))
+        )
+
+    @staticmethod
+    def _update_stats(conn, features):
+        """Merge a chunk into the running per-feature count/mean/M2 (Chan et al.)"""
+        n_b = len(features)
+        if not n_b:
+            return
+        features = features.astype(np.float64)
+        mean_b = features.mean(axis=0)
+        m2_b = ((features - mean_b) ** 2).sum(axis=0)
+        min_b = features.min(axis=0)
+        max_b = features.max(axis=0)
+
+        for i, name in enumerate(FEATURE_SCHEMA):
+            row = conn.execute('SELECT * FROM training_stats WHERE feature = ?', (name,)).fetchone()
+            if row:
+                n_a, mean_a, m2_a = row['count'], row['mean'], row['m2']
+                n = n_a + n_b
+                delta = float(mean_b[i]) - mean_a
+                mean = mean_a + delta * n_b / n
+                m2 = m2_a + float(m2_b[i]) + delta ** 2 * n_a * n_b / n
+                lo, hi = min(row['min'], float(min_b[i])), max(row['max'], float(max_b[i]))
+            else:
+                n, mean, m2 = n_b, float(mean_b[i]), float(m2_b[i])
+                lo, hi = float(min_b[i]), float(max_b[i])
+            conn.execute(
+                '''INSERT INTO training_stats (feature, count, mean, m2, min, max) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(feature) DO UPDATE SET count = excluded.count, mean = excluded.mean,
+                    m2 = excluded.m2, min = excluded.min, max = excluded.max''',
+                (name, n, mean, m2, lo, hi)
+            )
+
+    @staticmethod
+    def _update_reservoir(conn, features, source, rng):
+        """Algorithm R over a chunk: item i (0-based, store-wide) lands in slot j ~ U[0, i]"""
+        seen = IncrementalTrainer._get_state(conn, 'seen')
+        positions = np.arange(seen, seen + len(features))
+        slots = np.where(positions < RESERVOIR_SIZE, positions, rng.integers(0, positions + 1))
+        keep = slots < RESERVOIR_SIZE
+
+        # Within a chunk a later item overwrites an earlier one in the same slot
+        chosen_slots = slots[keep][::-1]
+        chosen_rows = features[keep][::-1]
+        _, first = np.unique(chosen_slots, return_index=True)
+
+        added_at = datetime.now().isoformat()
+        conn.executemany(
+            f'''INSERT OR REPLACE INTO training_reservoir (slot, {', '.join(FEATURE_SCHEMA)}, source, added_at)
+            VALUES ({', '.join('?' * (len(FEATURE_SCHEMA) + 3))})''',
+            (
+                (int(chosen_slots[i]), *map(float, chosen_rows[i]), source, added_at)
+                for i in first
+            )
+        )
+        IncrementalTrainer._set_state(conn, 'seen', seen + len(features))
+
+    @staticmethod
+    def add_features(features, source, conn=None, rng=None):
+        own = conn is None
+        conn = conn or get_connection()
+        rng = rng or np.random.default_rng()
+        IncrementalTrainer._update_stats(conn, features)
+        IncrementalTrainer._update_reservoir(conn, features, source, rng)
+        if own:
+            conn.commit()
+            conn.close()
+
+    @staticmethod
+    def check_schema(conn):
+        """Start the sample over when FEATURE_SCHEMA changed since it was drawn"""
+        row = conn.execute("SELECT value FROM training_state WHERE key = 'feature_schema'").fetchone()
+        schema = ','.join(FEATURE_SCHEMA)
+        if row and row['value'] == schema:
+            return False
+        conn.execute('DELETE FROM training_reservoir')
+        conn.execute('DELETE FROM training_stats')
+        conn.execute("DELETE FROM training_state WHERE key IN ('seen', 'last_rowid')")
+        IncrementalTrainer._set_state(conn, 'feature_schema', schema)
+        conn.commit()
+        return bool(row)
+
+    @staticmethod
+    def seed_from_dataset(path=SEED_DATASET_PATH):
+        """Cold start: fold the bundled 5k-event dataset into an empty reservoir"""
+        conn = get_connection()
+        try:
+            if IncrementalTrainer._get_state(conn, 'seen') or not os.path.exists(path):
+                return 0
+            rows = [
+                StreamingIngestionEngine.normalize_record('seed', record, 'seed')
+                for record in StreamingIngestionEngine.iter_records(path, path)
+            ]
+            event_types, user_ids, timestamps = [r[2] for r in rows], [r[3] for r in rows], [r[4] for r in rows]
+            features = AnomalyScoringEngine.feature_matrix(
+                event_types, [r[6] for r in rows], timestamps, [len(r[8]) for r in rows],
+                window=WindowAnalyticsEngine.features_for(event_types, user_ids, [r[7] for r in rows], timestamps)
+            )
+            IncrementalTrainer.add_features(features, 'seed', conn)
+            conn.commit()
+            return len(rows)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def update_from_events(chunk_size=UPDATE_CHUNK_SIZE, deadline=None):
+        """Fold events stored since the last update into the statistics and reservoir.
+
+        Stops after the chunk that passes deadline (a time.perf_counter() value); the
+        watermark is committed per chunk, so the next call resumes where this one stopped.
+
+        Window features are computed per chunk and case from the hour before the chunk's
+        events and one anchor event per party (WindowAnalyticsEngine.chunk_features), so
+        the cost follows the new rows."""
+        conn = get_connection()
+        rng = np.random.default_rng()
+        added = 0
+        try:
+            last_rowid = IncrementalTrainer._get_state(conn, 'last_rowid')
+            while True:
+                rows = conn.execute(
+                    '''SELECT rowid, case_id, event_type, amount, timestamp, LENGTH(metadata), user_id, receiver,
+                           CAST(strftime('%s', timestamp) AS INTEGER) FROM unified_events
+                    WHERE rowid > ? AND is_valid = 1 ORDER BY rowid LIMIT ?''',
+                    (last_rowid, chunk_size)
+                ).fetchall()
+                if not rows:
+                    break
+                rowids, case_ids, event_types, amounts, timestamps, sizes, user_ids, receivers, seconds = zip(*rows)
+                chunk = pd.DataFrame({
+                    '_rowid': rowids, 'case_id': case_ids, 'event_type': event_types, 'user_id': user_ids,
+                    'receiver': receivers, 'seconds': pd.to_numeric(pd.Series(seconds), errors='coerce')
+                })
+                window = np.empty((len(rows), len(WINDOW_FEATURES)), dtype=np.float32)
+                for case_id, part in chunk.groupby('case_id', sort=False):
+                    window[part.index.to_numpy()] = WindowAnalyticsEngine.chunk_features(
+                        conn, case_id, part.drop(columns='case_id')
+                    )
+                features = AnomalyScoringEngine.feature_matrix(event_types, amounts, timestamps, sizes, window=window)
+                IncrementalTrainer.add_features(features, 'events', conn, rng)
+                last_rowid = rowids[-1]
+                IncrementalTrainer._set_state(conn, 'last_rowid', last_rowid)
+                conn.commit()
+                added += len(rows)
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+        finally:
+            conn.close()
+        return added
+
+    @staticmethod
+    def load_sample():
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(
+            f"SELECT {', '.join(FEATURE_SCHEMA)} FROM training_reservoir ORDER BY slot"
+        ).fetchall()
+        conn.close()
+        return np.asarray(rows, dtype=np.float32).reshape(-1, len(FEATURE_SCHEMA))
+
+    @staticmethod
+    def feature_stats():
+        conn = get_connection()
+        rows = conn.execute('SELECT * FROM training_stats').fetchall()
+        conn.close()
+        return {
+            r['feature']: {
+                'count': r['count'],
+                'mean': r['mean'],
+                'std': (r['m2'] / r['count']) ** 0.5 if r['count'] else 0.0,
+                'min': r['min'],
+                'max': r['max']
+            }
+            for r in rows
+        }
+
+    @staticmethod
+    def train(time_budget=DEFAULT_TIME_BUDGET_SECONDS, activate=True, on_progress=None):
+        """Catch up on new events, then grow a forest on the reservoir until the budget runs out.
+
+        Catching up gets FOLD_BUDGET_SHARE of the budget; events it could not reach are
+        folded by the next run, which resumes from the watermark."""
+        started = time.perf_counter()
+        conn = get_connection()
+        IncrementalTrainer.check_schema(conn)
+        conn.close()
+        fold_deadline = started + time_budget * FOLD_BUDGET_SHARE
+        # The seed is a single 5k-event pass, only ever run into an empty reservoir
+        seeded = IncrementalTrainer.seed_from_dataset()
+        folded = IncrementalTrainer.update_from_events(deadline=fold_deadline) if time.perf_counter() < fold_deadline else 0
+        conn = get_connection()
+        backlog = conn.execute(
+            'SELECT EXISTS(SELECT 1 FROM unified_events WHERE rowid > ? AND is_valid = 1)',
+            (IncrementalTrainer._get_state(conn, 'last_rowid'),)
+        ).fetchone()[0]
+        conn.close()
+        if on_progress:
+            on_progress({'rows_folded': folded + seeded})
+
+        sample = IncrementalTrainer.load_sample()
+        if len(sample) < 10:
+            return {'error': 'Not enough events to train a baseline model'}
+
+        model = IsolationForest(
+            n_estimators=ESTIMATOR_STEP, contamination=CONTAMINATION,
+            warm_start=True, random_state=42
+        )
+        fit_started = time.perf_counter()
+        model.fit(sample)
+        while model.n_estimators < MAX_ESTIMATORS:
+            elapsed = time.perf_counter() - started
+            per_step = (time.perf_counter() - fit_started) / max(model.n_estimators // ESTIMATOR_STEP, 1)
+            if elapsed + per_step > time_budget:
+                break
+            model.n_estimators += ESTIMATOR_STEP
+            model.fit(sample)
+            if on_progress:
+                on_progress({'estimators': model.n_estimators})
+
+        conn = get_connection()
+        seen = IncrementalTrainer._get_state(conn, 'seen')
+        conn.close()
+        train_seconds = round(time.perf_counter() - started, 3)
+        version = ModelRegistry.register(
+            model,
+            feature_schema=FEATURE_SCHEMA,
+            training_rows=len(sample),
+            contamination=CONTAMINATION,
+            params={'n_estimators': model.n_estimators, 'reservoir_size': RESERVOIR_SIZE, 'time_budget': time_budget},
+            metrics={'events_seen': seen, 'train_seconds': train_seconds, 'feature_stats': IncrementalTrainer.feature_stats()},
+            notes='Incremental reservoir training',
+            activate=activate
+        )
+        return {
+            'model_version': version,
+            'training_rows': len(sample),
+            'events_seen': seen,
+            'n_estimators': model.n_estimators,
+            'train_seconds': train_seconds,
+            'rows_folded': folded + seeded,
+            'caught_up': not backlog
+        }
+
+
+class TrainingScheduler:
+    """Queues a background training job every interval.
+
+    Every API worker runs one, so submit must not add a job while another is queued or
+    running (JobQueue.submit_once); JobQueue.claim_next runs train jobs one at a time"""
+
+    def __init__(self, interval_hours, time_budget=DEFAULT_TIME_BUDGET_SECONDS):
+        self.interval = interval_hours * 3600
+        self.time_budget = time_budget
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, submit):
+        self._submit = submit
+        self._thread = threading.Thread(target=self._loop, name='training-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval):
+            self._submit(self.time_budget)
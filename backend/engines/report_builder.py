@@ -0,0 +1,272 @@
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import ListFlowable, ListItem, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from database import get_connection, get_case_version
+from engines.case_summary import CaseSummaryEngine, SEVERITIES
+
+REPORTS_DIR = 'reports'
+TOP_VIOLATIONS = int(os.getenv('REPORT_TOP_VIOLATIONS', '50'))
+TOP_ANOMALIES = int(os.getenv('REPORT_TOP_ANOMALIES', '25'))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f2937')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')]),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+
+class ReportBuilder:
+    """PDF reports rendered from the case summary plus indexed top-K reads.
+
+    A report is stamped with the case version it was rendered at; asking for the
+    same title again at the same version reuses the existing PDF."""
+
+    @staticmethod
+    def find_reusable(conn, case_id, title, version):
+        """The latest report with this title rendered at this case version, if its PDF is still on disk"""
+        row = conn.execute(
+            '''SELECT * FROM reports WHERE case_id = ? AND title = ? AND case_version = ?
+            ORDER BY created_at DESC LIMIT 1''',
+            (case_id, title, version)
+        ).fetchone()
+        if not row or not row['file_path'] or not os.path.exists(row['file_path']):
+            return None
+        report = dict(row)
+        report['details'] = json.loads(report['details'] or '{}')
+        report['reused'] = True
+        return report
+
+    @staticmethod
+    def collect(conn, case_id):
+        """Everything the report shows, in a handful of queries"""
+        case = conn.execute('SELECT * FROM cases WHERE id = ?', (case_id,)).fetchone()
+        risk = conn.execute('SELECT * FROM case_risk WHERE case_id = ?', (case_id,)).fetchone()
+        summary = CaseSummaryEngine.get(conn, case_id, fresh=True)
+        return {
+            'case': dict(case) if case else {'id': case_id, 'name': case_id},
+            'risk': dict(risk) if risk else {},
+            'summary': summary,
+            'violations': CaseSummaryEngine.top_violations(conn, case_id, summary, limit=TOP_VIOLATIONS),
+            'anomalies': CaseSummaryEngine.top_anomalies(conn, case_id, limit=TOP_ANOMALIES)
+        }
+
+    @staticmethod
+    def findings(data):
+        """Executive summary, key findings and recommendations shown in the PDF and the API"""
+        summary, risk, case = data['summary'], data['risk'], data['case']
+        suspicious_count = summary['total_violations']
+        anomaly_count = summary['anomaly_count']
+
+        key_findings = []
+        if suspicious_count > 0:
+            key_findings.append(f"{suspicious_count} rule violations detected")
+        if anomaly_count > 0:
+            key_findings.append(f"{anomaly_count} anomalous events identified")
+        if risk.get('total_score', 0) >= 70:
+            key_findings.append("High-risk activity patterns detected")
+
+        recommendations = []
+        if suspicious_count > 10:
+            recommendations.append("Review all flagged rule violations immediately")
+        if anomaly_count > 5:
+            recommendations.append("Investigate anomalous behavior patterns")
+        if risk.get('correlation_score', 0) > 30:
+            recommendations.append("Analyze network connections for coordinated activity")
+
+        return {
+            'summary': f"Investigation report generated with {suspicious_count} violations and {anomaly_count} anomalies detected.",
+            'executive_summary': f"Comprehensive forensic analysis completed for case '{case['name']}'. Risk level: {(risk.get('risk_level') or 'UNKNOWN').upper()}.",
+            'key_findings': key_findings or ['Analysis in progress'],
+            'recommendations': recommendations or ['Continue monitoring']
+        }
+
+    @staticmethod
+    def _table(header, rows, widths=None):
+        table = Table([header] + rows, colWidths=widths, repeatRows=1)
+        table.setStyle(TABLE_STYLE)
+        return table
+
+    @staticmethod
+    def render(path, title, data, findings, version):
+        styles = getSampleStyleSheet()
+        cell = styles['BodyText'].clone('cell', fontSize=8, leading=10)
+        summary, risk, case = data['summary'], data['risk'], data['case']
+
+        def bullets(items):
+            return ListFlowable([ListItem(Paragraph(escape(i), styles['BodyText'])) for i in items], bulletType='bullet')
+
+        story = [
+            Paragraph(escape(title), styles['Title']),
+            Paragraph(f"Case: {escape(case['name'])} &nbsp; | &nbsp; Generated {datetime.now().strftime('%Y-%m-%d %H:%M')} &nbsp; | &nbsp; Data version {version}", styles['Normal']),
+            Spacer(1, 6 * mm),
+            Paragraph('Executive Summary', styles['Heading2']),
+            Paragraph(escape(findings['executive_summary']), styles['BodyText']),
+            Paragraph(escape(findings['summary']), styles['BodyText']),
+            Spacer(1, 4 * mm),
+            ReportBuilder._table(['Metric', 'Value'], [
+                ['Total events', summary['total_events']],
+                ['Valid events', summary['valid_events']],
+                ['Invalid events', summary['invalid_events']],
+                ['Rule violations', summary['total_violations']],
+                ['Anomalous events', summary['anomaly_count']],
+                ['Risk score', round(risk.get('total_score') or 0, 1)],
+                ['Risk level', (risk.get('risk_level') or 'unknown').upper()],
+            ], widths=[60 * mm, 60 * mm]),
+            Paragraph('Key Findings', styles['Heading2']),
+            bullets(findings['key_findings']),
+            Paragraph('Recommendations', styles['Heading2']),
+            bullets(findings['recommendations']),
+        ]
+
+        if risk:
+            story += [
+                Paragraph('Risk Contributions', styles['Heading2']),
+                ReportBuilder._table(['Factor', 'Score'], [
+                    ['Rule violations', round(risk.get('rule_score_total') or 0, 1)],
+                    ['Anomaly score', round(risk.get('anomaly_score_total') or 0, 1)],
+                    ['Network correlation', round(risk.get('correlation_score') or 0, 1)],
+                ], widths=[60 * mm, 60 * mm]),
+            ]
+
+        if summary['rule_counts']:
+            story += [
+                Paragraph('Rule Summary', styles['Heading2']),
+                ReportBuilder._table(['Rule', 'Highest severity', 'Violations'], [
+                    [name, rule['severity'], rule['violations']]
+                    for name, rule in sorted(summary['rule_counts'].items(), key=lambda r: -r[1]['violations'])
+                ]),
+                Spacer(1, 2 * mm),
+                ReportBuilder._table(['Severity', 'Violations'], [
+                    [severity, summary['severity_counts'].get(severity, 0)] for severity in SEVERITIES
+                ], widths=[40 * mm, 40 * mm]),
+            ]
+
+        if data['violations']:
+            story += [
+                Paragraph(f"Top {len(data['violations'])} Violations", styles['Heading2']),
+                ReportBuilder._table(['Severity', 'Rule', 'Event', 'Description'], [
+                    [v['severity'], v['rule_type'], v['event_id'][:8], Paragraph(escape(v['description'] or ''), cell)]
+                    for v in data['violations']
+                ], widths=[18 * mm, 35 * mm, 20 * mm, 100 * mm]),
+            ]
+
+        if data['anomalies']:
+            story += [
+                Paragraph(f"Top {len(data['anomalies'])} Anomalies", styles['Heading2']),
+                ReportBuilder._table(['Score', 'Timestamp', 'Type', 'User', 'Receiver', 'Amount'], [
+                    [
+                        f"{a['anomaly_score']:.3f}",
+                        a.get('event', {}).get('timestamp'),
+                        a.get('event', {}).get('event_type'),
+                        a.get('event', {}).get('user_id'),
+                        a.get('event', {}).get('receiver'),
+                        a.get('event', {}).get('amount'),
+                    ]
+                    for a in data['anomalies']
+                ]),
+            ]
+
+        SimpleDocTemplate(path, pagesize=A4, title=title, leftMargin=15 * mm, rightMargin=15 * mm).build(story)
+
+    @staticmethod
+    def generate(case_id, title, force=False):
+        """Render (or reuse) a report at the current case version; returns the report record"""
+        conn = get_connection()
+        try:
+            # Read the version before the data: a change mid-render leaves this report un-reusable
+            version = get_case_version(conn, case_id)
+            existing = None if force else ReportBuilder.find_reusable(conn, case_id, title, version)
+            if existing:
+                return existing
+
+            data = ReportBuilder.collect(conn, case_id)
+            findings = ReportBuilder.findings(data)
+            report_id = str(uuid.uuid4())
+            os.makedirs(REPORTS_DIR, exist_ok=True)
+            file_path = os.path.join(REPORTS_DIR, f"report_{case_id}_{report_id[:8]}.pdf")
+            # Render to a temp name so a download never sees a half-written PDF
+            ReportBuilder.render(file_path + '.tmp', title, data, findings, version)
+            os.replace(file_path + '.tmp', file_path)
+
+            created_at = datetime.now().isoformat()
+            conn.execute(
+                '''INSERT INTO reports (id, case_id, title, summary, file_path, case_version, details, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                (report_id, case_id, title, findings['summary'], file_path, version, json.dumps(findings), created_at)
+            )
+            conn.commit()
+            return {
+                'id': report_id, 'case_id': case_id, 'title': title, 'summary': findings['summary'],
+                'file_path': file_path, 'case_version': version, 'details': findings,
+                'created_at': created_at, 'reused': False
+            }
+        finally:
+            conn.close()
+
+    @staticmethod
+    def stamp(report_id, version):
+        """Attach the version and findings to a report rendered elsewhere (legacy ReportEngine)"""
+        conn = get_connection()
+        try:
+            row = conn.execute('SELECT * FROM reports WHERE id = ?', (report_id,)).fetchone()
+            findings = ReportBuilder.findings(ReportBuilder.collect(conn, row['case_id']))
+            conn.execute(
+                'UPDATE reports SET case_version = ?, details = ? WHERE id = ?',
+                (version, json.dumps(findings), report_id)
+            )
+            conn.commit()
+            report = dict(row)
+            report.update({'case_version': version, 'details': findings, 'reused': False})
+            return report
+        finally:
+            conn.close()
+
+    @staticmethod
+    def parse_range(header, size):
+        """(start, end) inclusive for a single 'bytes=' range, None for no/unsupported range.
+
+        Raises ValueError when the range cannot be satisfied."""
+        if not header:
+            return None
+        match = RANGE_PATTERN.match(header.strip())
+        if not match:
+            return None
+        first, last = match.groups()
+        if first == '' and last == '':
+            return None
+        if first == '':
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            raise ValueError(f"Range not satisfiable for {size} bytes")
+        return start, end
+
+    @staticmethod
+    def iter_file(path, start, end, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
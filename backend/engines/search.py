@@ -0,0 +1,112 @@
+import re
+
+from database import get_connection
+from engines.timeline import TimelineEngine
+
+DEFAULT_RESULT_LIMIT = 50
+MAX_RESULT_LIMIT = 500
+SNIPPET_TOKENS = 16
+OPERATORS = ('AND', 'OR', 'NOT')
+QUERY_TOKEN = re.compile(r'"[^"]*"\*?|\S+')
+
+
+class SearchEngine:
+    """FTS5 keyword search over event text and metadata.
+
+    event_search.rowid is the unified_events rowid. body holds user_id, receiver
+    and every text value of the metadata JSON; case_key is indexed so a case
+    filter is part of the MATCH rather than a post-filter."""
+
+    @staticmethod
+    def index_events(case_id, after_rowid=0, conn=None):
+        """Index the case's events stored after the given rowid; re-indexing replaces rows"""
+        own = conn is None
+        conn = conn or get_connection()
+        try:
+            cursor = conn.execute(
+                '''INSERT OR REPLACE INTO event_search (rowid, body, case_key)
+                SELECT e.rowid,
+                       trim(COALESCE(e.user_id, '') || ' ' || COALESCE(e.receiver, '') || ' ' || COALESCE((
+                           SELECT group_concat(j.value, ' ')
+                           FROM json_each(CASE WHEN json_valid(e.metadata) THEN e.metadata ELSE '{}' END) j
+                           WHERE j.type = 'text'), '')),
+                       e.case_id
+                FROM unified_events e
+                WHERE e.case_id = ? AND e.rowid > ?''',
+                (case_id, after_rowid)
+            )
+            if own:
+                conn.commit()
+            return cursor.rowcount
+        finally:
+            if own:
+                conn.close()
+
+    @staticmethod
+    def _case_filter(case_id):
+        return 'case_key : "' + case_id.replace('"', '""') + '"'
+
+    @staticmethod
+    def remove_case(case_id, conn=None):
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute(
+            'DELETE FROM event_search WHERE rowid IN (SELECT rowid FROM event_search WHERE event_search MATCH ?)',
+            (SearchEngine._case_filter(case_id),)
+        )
+        if own:
+            conn.commit()
+            conn.close()
+
+    @staticmethod
+    def build_match(query):
+        """Turn user input into a safe FTS5 expression.
+
+        "quoted phrases", trailing-* prefixes and AND / OR / NOT are honoured;
+        every other token is quoted so punctuation never reaches the FTS parser."""
+        terms = []
+        for token in QUERY_TOKEN.findall(query or ''):
+            if token in OPERATORS:
+                if terms and terms[-1] not in OPERATORS:
+                    terms.append(token)
+                continue
+            prefix = token.endswith('*')
+            text = token.rstrip('*').strip('"')
+            if not re.search(r'\w', text):
+                continue
+            terms.append('"' + text.replace('"', '""') + '"' + ('*' if prefix else ''))
+        while terms and terms[-1] in OPERATORS:
+            terms.pop()
+        return ' '.join(terms) or None
+
+    @staticmethod
+    def search(conn, case_id, query, filters=None, limit=DEFAULT_RESULT_LIMIT, offset=0):
+        match = SearchEngine.build_match(query)
+        if match is None:
+            return None
+        expression = f"{SearchEngine._case_filter(case_id)} AND body : ({match})"
+        # Columns below are unified_events' (alias e); event_search has no clashing names.
+        # CROSS JOIN keeps the FTS match as the outer loop instead of scanning the case's events
+        where, params = TimelineEngine.build_where(case_id, filters or {})
+
+        rows = conn.execute(
+            f'''SELECT e.*, -bm25(event_search) AS score,
+                   snippet(event_search, 0, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet
+            FROM event_search CROSS JOIN unified_events e ON e.rowid = event_search.rowid
+            WHERE event_search MATCH ? AND {where}
+            ORDER BY score DESC LIMIT ? OFFSET ?''',
+            [expression] + params + [min(limit, MAX_RESULT_LIMIT), offset]
+        ).fetchall()
+        total = conn.execute(
+            f'''SELECT COUNT(*) FROM event_search CROSS JOIN unified_events e ON e.rowid = event_search.rowid
+            WHERE event_search MATCH ? AND {where}''',
+            [expression] + params
+        ).fetchone()[0]
+
+        return {
+            'query': match,
+            'total': total,
+            'limit': limit,
+            'offset': offset,
+            'results': [dict(r) for r in rows]
+        }
@@ -0,0 +1,292 @@
+import json
+import math
+import os
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+
+from database import get_connection, bulk_insert
+
+# Additive error budget on normalized betweenness, held with probability 1 - BETWEENNESS_DELTA
+BETWEENNESS_EPSILON = float(os.getenv('GRAPH_BETWEENNESS_EPSILON', '0.05'))
+BETWEENNESS_DELTA = 0.1
+MAX_PIVOTS = int(os.getenv('GRAPH_MAX_PIVOTS', '256'))
+
+EDGE_COLUMNS = ('id', 'case_id', 'source', 'target', 'edge_type', 'weight', 'metadata')
+NODE_COLUMNS = ('id', 'case_id', 'node_id', 'node_type', 'label', 'centrality', 'metadata')
+
+
+class SparseGraphEngine:
+    """Case graph built from SQL-aggregated edges with sampled betweenness on a CSR adjacency"""
+
+    @staticmethod
+    def _aggregate_edges(conn, case_id, after_rowid=0, upto_rowid=None):
+        """One row per (source, target, event type) with its event count and total amount"""
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return cursor.execute(
+            '''SELECT user_id, receiver, event_type, COUNT(*), COALESCE(SUM(amount), 0)
+            FROM unified_events
+            WHERE case_id = ? AND is_valid = 1 AND rowid > ? AND rowid <= ?
+              AND user_id IS NOT NULL AND receiver IS NOT NULL AND receiver != '' AND receiver != user_id
+            GROUP BY user_id, receiver, event_type''',
+            (case_id, after_rowid, upto_rowid if upto_rowid is not None else 2 ** 63 - 1)
+        ).fetchall()
+
+    @staticmethod
+    def adjacency(sources, targets):
+        """Undirected, unweighted CSR adjacency plus the node id for each index"""
+        node_ids, inverse = np.unique(np.concatenate([sources, targets]).astype(str), return_inverse=True)
+        src, dst = inverse[:len(sources)], inverse[len(sources):]
+        n = len(node_ids)
+        matrix = sparse.coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n, n)).tocsr()
+        matrix = (matrix + matrix.T).tocsr()
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return node_ids, matrix
+
+    @staticmethod
+    def pivot_count(n, epsilon=BETWEENNESS_EPSILON, delta=BETWEENNESS_DELTA, max_pivots=MAX_PIVOTS):
+        """Hoeffding bound with a union bound over all n nodes, capped at max_pivots"""
+        if n <= 2:
+            return n
+        needed = math.ceil(math.log(2 * n / delta) / (2 * epsilon ** 2))
+        return min(n, needed, max_pivots)
+
+    @staticmethod
+    def _dependencies(indptr, indices, source, n):
+        """Brandes single-source dependencies, one BFS level at a time"""
+        dist = np.full(n, -1, dtype=np.int64)
+        sigma = np.zeros(n)
+        dist[source] = 0
+        sigma[source] = 1
+        frontier = np.array([source])
+        levels = []
+        depth = 0
+        while frontier.size:
+            counts = indptr[frontier + 1] - indptr[frontier]
+            parents = np.repeat(frontier, counts)
+            offsets = np.repeat(indptr[frontier] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            children = indices[offsets]
+
+            unseen = children[dist[children] == -1]
+            dist[unseen] = depth + 1
+            on_path = dist[children] == depth + 1
+            parents, children = parents[on_path], children[on_path]
+            sigma += np.bincount(children, weights=sigma[parents], minlength=n)
+
+            levels.append((parents, children))
+            frontier = np.unique(unseen)
+            depth += 1
+
+        delta = np.zeros(n)
+        for parents, children in reversed(levels):
+            delta += np.bincount(parents, weights=sigma[parents] / sigma[children] * (1 + delta[children]), minlength=n)
+        delta[source] = 0
+        return delta
+
+    @staticmethod
+    def betweenness(matrix, epsilon=BETWEENNESS_EPSILON, seed=42):
+        """Normalized betweenness from k sampled pivots; exact when k reaches n.
+
+        Returns (scores, pivots, achieved epsilon). Scaling matches networkx's
+        betweenness_centrality(normalized=True, k=...) on an undirected graph."""
+        n = matrix.shape[0]
+        pivots = SparseGraphEngine.pivot_count(n, epsilon)
+        if n <= 2:
+            return np.zeros(n), pivots, 0.0
+
+        rng = np.random.default_rng(seed)
+        sources = np.arange(n) if pivots >= n else rng.choice(n, size=pivots, replace=False)
+        indptr, indices = matrix.indptr.astype(np.int64), matrix.indices.astype(np.int64)
+        scores = np.zeros(n)
+        for source in sources:
+            scores += SparseGraphEngine._dependencies(indptr, indices, source, n)
+
+        scores *= (n / len(sources)) / ((n - 1) * (n - 2))
+        achieved = 0.0 if pivots >= n else math.sqrt(math.log(2 * n / BETWEENNESS_DELTA) / (2 * pivots))
+        return scores, pivots, round(achieved, 4)
+
+    @staticmethod
+    def _node_rows(case_id, node_ids, matrix, scores, sources):
+        degree = np.diff(matrix.indptr)
+        senders = set(sources)
+        return [
+            (
+                str(uuid.uuid4()), case_id, node, 'user' if node in senders else 'contact', node,
+                float(scores[i]), json.dumps({'degree': int(degree[i])})
+            )
+            for i, node in enumerate(node_ids.tolist())
+        ]
+
+    @staticmethod
+    def _set_watermark(conn, case_id, last_rowid, stale, epsilon=None):
+        conn.execute(
+            '''INSERT INTO graph_watermarks (case_id, last_rowid, centrality_stale, epsilon, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(case_id) DO UPDATE SET last_rowid = excluded.last_rowid,
+                centrality_stale = excluded.centrality_stale,
+                epsilon = COALESCE(excluded.epsilon, epsilon), updated_at = excluded.updated_at''',
+            (case_id, last_rowid, int(stale), epsilon, datetime.now().isoformat())
+        )
+
+    @staticmethod
+    def get_watermark(conn, case_id):
+        row = conn.execute('SELECT * FROM graph_watermarks WHERE case_id = ?', (case_id,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def reset_state(case_id, conn=None):
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute('DELETE FROM graph_watermarks WHERE case_id = ?', (case_id,))
+        if own:
+            conn.commit()
+            conn.close()
+
+    @staticmethod
+    def build_graph(case_id):
+        """Full rebuild: aggregate edges in SQL, then score nodes on a CSR adjacency"""
+        started = time.perf_counter()
+        conn = get_connection()
+        try:
+            upto = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM unified_events').fetchone()[0]
+            edges = SparseGraphEngine._aggregate_edges(conn, case_id, upto_rowid=upto)
+            aggregated = time.perf_counter()
+
+            conn.execute('DELETE FROM graph_edges WHERE case_id = ?', (case_id,))
+            conn.execute('DELETE FROM graph_nodes WHERE case_id = ?', (case_id,))
+            if not edges:
+                SparseGraphEngine._set_watermark(conn, case_id, upto, stale=False, epsilon=0.0)
+                conn.commit()
+                return {'nodes': 0, 'edges': 0}
+
+            sources, targets, edge_types, weights, amounts = zip(*edges)
+            node_ids, matrix = SparseGraphEngine.adjacency(np.array(sources), np.array(targets))
+            scores, pivots, epsilon = SparseGraphEngine.betweenness(matrix)
+            scored = time.perf_counter()
+
+            bulk_insert(
+                conn, 'graph_edges', EDGE_COLUMNS,
+                (
+                    (str(uuid.uuid4()), case_id, s, t, et, w, json.dumps({'total_amount': a}))
+                    for s, t, et, w, a in edges
+                ),
+                commit=False
+            )
+            bulk_insert(
+                conn, 'graph_nodes', NODE_COLUMNS,
+                SparseGraphEngine._node_rows(case_id, node_ids, matrix, scores, sources),
+                commit=False
+            )
+            SparseGraphEngine._set_watermark(conn, case_id, upto, stale=False, epsilon=epsilon)
+            conn.commit()
+            return {
+                'mode': 'full',
+                'nodes': len(node_ids),
+                'edges': len(edges),
+                'pivots': pivots,
+                'epsilon': epsilon,
+                'timings': {
+                    'aggregate': round(aggregated - started, 4),
+                    'centrality': round(scored - aggregated, 4),
+                    'write': round(time.perf_counter() - scored, 4)
+                }
+            }
+        finally:
+            conn.close()
+
+    @staticmethod
+    def update_edges(case_id):
+        """Fold events stored since the last build into edge weights; centrality is marked stale"""
+        conn = get_connection()
+        try:
+            watermark = SparseGraphEngine.get_watermark(conn, case_id)
+            if not watermark:
+                return None
+            upto = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM unified_events').fetchone()[0]
+            edges = SparseGraphEngine._aggregate_edges(conn, case_id, watermark['last_rowid'], upto)
+
+            count_sql = 'SELECT COUNT(*) FROM graph_edges WHERE case_id = ?'
+            before = conn.execute(count_sql, (case_id,)).fetchone()[0]
+            conn.executemany(
+                f'''INSERT INTO graph_edges ({', '.join(EDGE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(case_id, source, target, edge_type) DO UPDATE SET weight = weight + excluded.weight,
+                    metadata = json_set(COALESCE(metadata, '{{}}'), '$.total_amount',
+                        COALESCE(json_extract(metadata, '$.total_amount'), 0) + json_extract(excluded.metadata, '$.total_amount'))''',
+                (
+                    (str(uuid.uuid4()), case_id, source, target, edge_type, weight, json.dumps({'total_amount': amount}))
+                    for source, target, edge_type, weight, amount in edges
+                )
+            )
+            inserted = conn.execute(count_sql, (case_id,)).fetchone()[0] - before
+
+            new_nodes = {s for s, *_ in edges} | {t for _, t, *_ in edges}
+            senders = {s for s, *_ in edges}
+            existing = {
+                r[0] for r in conn.execute(
+                    'SELECT node_id FROM graph_nodes WHERE case_id = ? AND node_id IN (SELECT value FROM json_each(?))',
+                    (case_id, json.dumps(list(new_nodes)))
+                )
+            }
+            bulk_insert(
+                conn, 'graph_nodes', NODE_COLUMNS,
+                (
+                    (str(uuid.uuid4()), case_id, node, 'user' if node in senders else 'contact', node, 0.0, None)
+                    for node in new_nodes - existing
+                ),
+                commit=False
+            )
+            SparseGraphEngine._set_watermark(conn, case_id, upto, stale=bool(edges) or watermark['centrality_stale'])
+            conn.commit()
+            return {'edges_updated': len(edges) - inserted, 'edges_added': inserted, 'nodes_added': len(new_nodes - existing)}
+        finally:
+            conn.close()
+
+    @staticmethod
+    def recompute_centrality(case_id):
+        """Rescore nodes from the stored edges, without re-aggregating events"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            edges = cursor.execute('SELECT source, target FROM graph_edges WHERE case_id = ?', (case_id,)).fetchall()
+            if not edges:
+                return {'nodes': 0, 'edges': 0}
+            sources, targets = zip(*edges)
+            node_ids, matrix = SparseGraphEngine.adjacency(np.array(sources), np.array(targets))
+            scores, pivots, epsilon = SparseGraphEngine.betweenness(matrix)
+            degree = np.diff(matrix.indptr)
+            conn.executemany(
+                'UPDATE graph_nodes SET centrality = ?, metadata = ? WHERE case_id = ? AND node_id = ?',
+                (
+                    (float(scores[i]), json.dumps({'degree': int(degree[i])}), case_id, node)
+                    for i, node in enumerate(node_ids.tolist())
+                )
+            )
+            watermark = SparseGraphEngine.get_watermark(conn, case_id)
+            SparseGraphEngine._set_watermark(conn, case_id, watermark['last_rowid'], stale=False, epsilon=epsilon)
+            conn.commit()
+            return {'nodes': len(node_ids), 'edges': len(edges), 'pivots': pivots, 'epsilon': epsilon}
+        finally:
+            conn.close()
+
+    @staticmethod
+    def refresh(case_id, full=False):
+        """Incremental when a graph already exists; falls back to a full build otherwise"""
+        if full:
+            return SparseGraphEngine.build_graph(case_id)
+        update = SparseGraphEngine.update_edges(case_id)
+        if update is None:
+            return SparseGraphEngine.build_graph(case_id)
+
+        conn = get_connection()
+        stale = SparseGraphEngine.get_watermark(conn, case_id)['centrality_stale']
+        conn.close()
+        result = {'mode': 'incremental', **update}
+        if stale:
+            result.update(SparseGraphEngine.recompute_centrality(case_id))
+        return result
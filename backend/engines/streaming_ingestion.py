@@ -0,0 +1,412 @@
+import csv
+import hashlib
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+
+from dateutil import parser as date_parser
+
+from database import get_connection, bulk_insert
+from engines.deduplication import event_fingerprint, DeduplicationEngine
+
+SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', 'upload_spool')
+CHUNK_SIZE = 1024 * 1024
+MAX_RECORD_SIZE = 64 * 1024 * 1024
+BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '5000'))
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Epoch values at or above this are milliseconds (as seconds they would be past the year 5000)
+EPOCH_MILLIS_THRESHOLD = 10 ** 11
+# Text that is an epoch number, as CSV exports write them
+EPOCH_TEXT = re.compile(r'^\d{9,}(\.\d+)?$')
+
+EVENT_COLUMNS = (
+    'event_id', 'case_id', 'event_type', 'user_id', 'timestamp', 'source',
+    'amount', 'receiver', 'metadata', 'is_valid', 'validation_errors', 'fingerprint'
+)
+
+# Field aliases per unified column, checked in order
+USER_FIELDS = ('user_id', 'caller', 'sender', 'from_account', 'from', 'user', 'actor_id')
+RECEIVER_FIELDS = ('receiver', 'to_account', 'to', 'recipient', 'callee', 'target_id')
+TIMESTAMP_FIELDS = ('timestamp', 'datetime', 'date_time', 'time', 'date')
+AMOUNT_FIELDS = ('amount', 'value', 'transaction_amount')
+# Keys of a JSON object document that hold the event records; the first one present is used
+JSON_RECORD_KEYS = tuple(
+    k.strip() for k in os.getenv('JSON_RECORD_KEYS', 'events,records,data').split(',') if k.strip()
+)
+
+
+class SpooledUpload:
+    """An upload written to disk along with its content hash"""
+
+    def __init__(self, filename, path, file_hash, file_size):
+        self.filename = filename
+        self.path = path
+        self.file_hash = file_hash
+        self.file_size = file_size
+
+    def read_bytes(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamingJSONReader:
+    """Yields records from a top-level JSON array, or from the records array of a
+    {"events": [...], ...} object, without loading the whole document"""
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE, record_keys=JSON_RECORD_KEYS):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.record_keys = record_keys
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        chunk = self.fp.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop consumed text so the buffer stays bounded
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Malformed JSON: expected '{char}' at offset {self.pos}")
+        self.pos += 1
+
+    def _decode_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # Bare numbers/literals are only complete once a delimiter follows
+                complete = (
+                    isinstance(value, (dict, list, str))
+                    or self.eof
+                    or (end < len(self.buffer) and self.buffer[end] in ' \t\r\n,]}')
+                )
+                if complete:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof or len(self.buffer) - self.pos > MAX_RECORD_SIZE:
+                    raise
+            # Read at least as much again as the partial record, so a record spanning many
+            # chunks is copied and re-decoded a logarithmic number of times, not once per chunk
+            self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def _iter_array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self._decode_value()
+            char = self._peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f"Malformed JSON array near offset {self.pos}")
+
+    def __iter__(self):
+        first = self._peek()
+        if first == '[':
+            yield from self._iter_array()
+            return
+        if first != '{':
+            raise ValueError("JSON evidence must be an array or an object containing an array")
+
+        self.pos += 1
+        records_found = False
+        while True:
+            char = self._peek()
+            if char == '}':
+                self.pos += 1
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            key = self._decode_value()
+            self._expect(':')
+            if self._peek() != '[':
+                # Scalar or object values alongside the events array are skipped
+                self._decode_value()
+            elif not records_found and key in self.record_keys:
+                records_found = True
+                yield from self._iter_array()
+            else:
+                # Other arrays (participants, attachments, ...) are not events; walk past
+                # them item by item so a large one is never held in memory
+                for _ in self._iter_array():
+                    pass
+
+
+class StreamingIngestionEngine:
+    """Chunked ingestion path for evidence files too large to hold in memory"""
+
+    @staticmethod
+    def spool_upload(upload_file, spool_dir=SPOOL_DIR):
+        """Copy a multipart upload to disk in chunks, hashing as it goes. Blocking: called from
+        sync endpoints, which FastAPI runs in its threadpool"""
+        os.makedirs(spool_dir, exist_ok=True)
+        path = os.path.join(spool_dir, f"{uuid.uuid4().hex}.part")
+        sha256 = hashlib.sha256()
+        size = 0
+
+        try:
+            with open(path, 'wb') as out:
+                while True:
+                    chunk = upload_file.file.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+
+        return SpooledUpload(upload_file.filename, path, sha256.hexdigest(), size)
+
+    @staticmethod
+    def detect_format(filename):
+        ext = os.path.splitext(filename or '')[1].lower()
+        if ext in ('.json', '.jsonl', '.ndjson'):
+            return ext[1:]
+        if ext in ('.csv', '.txt'):
+            return ext[1:]
+        return None
+
+    @staticmethod
+    def iter_records(path, filename, tracker=None):
+        """Yield raw records one at a time from a spooled CSV/JSON/TXT file.
+
+        If a tracker dict is passed, tracker['fp'] exposes the open file so
+        callers can report how far into it parsing has got."""
+        fmt = StreamingIngestionEngine.detect_format(filename)
+        if fmt is None:
+            raise ValueError(f"Unsupported file type: {filename}")
+
+        with open(path, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+            if tracker is not None:
+                tracker['fp'] = f
+            if fmt == 'json':
+                for record in StreamingJSONReader(f):
+                    yield record
+            elif fmt in ('jsonl', 'ndjson'):
+                yield from StreamingIngestionEngine._iter_json_lines(f)
+            elif fmt == 'csv':
+                yield from csv.DictReader(f)
+            else:
+                yield from StreamingIngestionEngine._iter_text(f)
+
+    @staticmethod
+    def _iter_json_lines(f):
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    @staticmethod
+    def _iter_text(f):
+        """TXT evidence is either JSON lines or a delimited table with a header"""
+        first = ''
+        for line in f:
+            if line.strip():
+                first = line
+                break
+        if not first:
+            return
+
+        if first.lstrip().startswith('{'):
+            yield json.loads(first)
+            yield from StreamingIngestionEngine._iter_json_lines(f)
+            return
+
+        try:
+            dialect = csv.Sniffer().sniff(first, delimiters=',\t|;')
+        except csv.Error:
+            dialect = csv.excel_tab
+        header = next(csv.reader([first], dialect))
+        yield from csv.DictReader(f, fieldnames=header, dialect=dialect)
+
+    @staticmethod
+    def _first(record, fields):
+        for field in fields:
+            value = record.get(field)
+            if value not in (None, ''):
+                return value, field
+        return None, None
+
+    @staticmethod
+    def _event_type(record, source):
+        explicit = record.get('event_type') or record.get('type')
+        if explicit:
+            return str(explicit).lower()
+        if 'call_id' in record or 'caller' in record or source == 'calls':
+            return 'call'
+        if 'message_id' in record or 'message_text' in record or source == 'whatsapp':
+            return 'message'
+        if 'transaction_id' in record or 'amount' in record or source == 'transactions':
+            return 'transaction'
+        return 'unknown'
+
+    @staticmethod
+    def _parse_timestamp(value):
+        """Normalized timestamp text, or None when the value is missing or not a date.
+
+        Numbers (and digit-only text) are epoch seconds, or milliseconds when they are too
+        large to be seconds; booleans are not timestamps"""
+        if value in (None, '') or isinstance(value, bool):
+            return None
+        if isinstance(value, str) and EPOCH_TEXT.match(value.strip()):
+            value = float(value)
+        try:
+            if isinstance(value, (int, float)):
+                seconds = value / 1000 if abs(value) >= EPOCH_MILLIS_THRESHOLD else value
+                return datetime.fromtimestamp(seconds).strftime(TIMESTAMP_FORMAT)
+            return date_parser.parse(str(value)).strftime(TIMESTAMP_FORMAT)
+        except (ValueError, OSError, OverflowError):
+            return None
+
+    @staticmethod
+    def normalize_record(case_id, record, default_source):
+        """Map one raw record onto the unified_events schema"""
+        if not isinstance(record, dict):
+            record = {'value': record}
+
+        errors = []
+        source = record.get('source') or default_source
+        event_type = StreamingIngestionEngine._event_type(record, source)
+
+        user_id, user_field = StreamingIngestionEngine._first(record, USER_FIELDS)
+        receiver, receiver_field = StreamingIngestionEngine._first(record, RECEIVER_FIELDS)
+        raw_ts, ts_field = StreamingIngestionEngine._first(record, TIMESTAMP_FIELDS)
+        raw_amount, amount_field = StreamingIngestionEngine._first(record, AMOUNT_FIELDS)
+
+        timestamp = StreamingIngestionEngine._parse_timestamp(raw_ts)
+        if timestamp is None:
+            errors.append('Missing or invalid timestamp')
+            timestamp = str(raw_ts) if raw_ts not in (None, '') else ''
+
+        amount = None
+        if raw_amount is not None:
+            try:
+                amount = float(raw_amount)
+            except (TypeError, ValueError):
+                errors.append(f"Invalid amount: {raw_amount}")
+
+        if user_id is None:
+            errors.append('Missing user identifier')
+
+        consumed = {'source', 'event_type', 'type', user_field, receiver_field, ts_field, amount_field}
+        metadata = {k: v for k, v in record.items() if k not in consumed and k is not None}
+        user_id = str(user_id) if user_id is not None else None
+        receiver = str(receiver) if receiver is not None else None
+
+        return (
+            str(uuid.uuid4()),
+            case_id,
+            event_type,
+            user_id,
+            timestamp,
+            source,
+            amount,
+            receiver,
+            json.dumps(metadata, ensure_ascii=False, default=str),
+            0 if errors else 1,
+            json.dumps(errors) if errors else None,
+            event_fingerprint(event_type, user_id, receiver, timestamp, amount, metadata)
+        )
+
+    @staticmethod
+    def ingest_stream(case_id, spooled, batch_size=BATCH_SIZE, on_progress=None):
+        """Parse and store a spooled upload in bounded batches.
+
+        Returns (upload_id, stats) on success or (None, error_message)."""
+        upload_id = str(uuid.uuid4())
+        default_source = os.path.splitext(os.path.basename(spooled.filename or ''))[0] or 'upload'
+        conn = get_connection()
+        conn.execute(
+            'INSERT INTO upload_logs (id, case_id, filename, file_hash, file_size, status, uploaded_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (upload_id, case_id, spooled.filename, spooled.file_hash, spooled.file_size, 'processing', datetime.now().isoformat())
+        )
+        conn.commit()
+
+        stats = {'rows_parsed': 0, 'rows_valid': 0, 'rows_invalid': 0, 'rows_duplicate': 0, 'bytes_read': 0}
+        tracker = {}
+        batch = []
+        last_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM unified_events').fetchone()[0]
+
+        def flush():
+            nonlocal last_rowid
+            # Records already in the case (same fingerprint) are skipped by the unique index
+            written = bulk_insert(
+                conn, 'unified_events', EVENT_COLUMNS, batch, batch_size=batch_size, on_conflict='IGNORE', commit=False
+            )
+            # Counted with its batch, so a failed or retried upload leaves the count matching the stored rows
+            conn.execute(
+                'UPDATE cases SET records_count = COALESCE(records_count, 0) + ? WHERE id = ?',
+                (DeduplicationEngine.count_valid_since(conn, case_id, last_rowid), case_id)
+            )
+            conn.commit()
+            last_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM unified_events').fetchone()[0]
+            stats['rows_duplicate'] += len(batch) - written
+            batch.clear()
+            fp = tracker.get('fp')
+            if fp is not None and not fp.closed:
+                stats['bytes_read'] = fp.buffer.tell()
+            if on_progress:
+                on_progress(dict(stats))
+
+        try:
+            for record in StreamingIngestionEngine.iter_records(spooled.path, spooled.filename, tracker):
+                row = StreamingIngestionEngine.normalize_record(case_id, record, default_source)
+                batch.append(row)
+                stats['rows_parsed'] += 1
+                if row[9]:
+                    stats['rows_valid'] += 1
+                else:
+                    stats['rows_invalid'] += 1
+                if len(batch) >= batch_size:
+                    flush()
+            stats['bytes_read'] = spooled.file_size
+            if batch:
+                flush()
+
+            conn.execute('UPDATE upload_logs SET status = ? WHERE id = ?', ('completed', upload_id))
+            conn.commit()
+            return upload_id, stats
+        except Exception as e:
+            conn.rollback()
+            # Batches already committed are kept; the log records where it stopped
+            conn.execute(
+                'UPDATE upload_logs SET status = ?, error_message = ? WHERE id = ?',
+                ('failed', f"{e} (after {stats['rows_parsed']} records)", upload_id)
+            )
+            conn.commit()
+            return None, str(e)
+        finally:
+            conn.close()
@@ -0,0 +1,154 @@
+import base64
+import json
+import threading
+from collections import OrderedDict
+
+from dateutil import parser as date_parser
+
+from database import get_case_version
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 5000
+COUNT_CACHE_SIZE = 1024
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Equality filters mapped straight onto unified_events columns
+EQUALITY_FILTERS = ('event_type', 'user_id', 'source', 'receiver')
+
+
+class TimelineEngine:
+    """Keyset-paginated, filtered reads over a case's unified_events"""
+
+    _count_cache = OrderedDict()
+    _count_lock = threading.Lock()
+
+    @staticmethod
+    def _normalize_time(value, end_of_day=False):
+        try:
+            parsed = date_parser.parse(value)
+        except (ValueError, OverflowError):
+            raise ValueError(f'Invalid date: {value}')
+        # A bare date as the upper bound covers the whole day
+        if end_of_day and len(value.strip()) <= 10:
+            parsed = parsed.replace(hour=23, minute=59, second=59)
+        return parsed.strftime(TIMESTAMP_FORMAT)
+
+    @staticmethod
+    def build_where(case_id, filters):
+        clauses = ['case_id = ?', 'is_valid = 1']
+        params = [case_id]
+
+        if filters.get('start'):
+            clauses.append('timestamp >= ?')
+            params.append(TimelineEngine._normalize_time(filters['start']))
+        if filters.get('end'):
+            clauses.append('timestamp <= ?')
+            params.append(TimelineEngine._normalize_time(filters['end'], end_of_day=True))
+        for column in EQUALITY_FILTERS:
+            if filters.get(column):
+                clauses.append(f'{column} = ?')
+                params.append(filters[column])
+        if filters.get('min_amount') is not None:
+            clauses.append('amount >= ?')
+            params.append(filters['min_amount'])
+        if filters.get('max_amount') is not None:
+            clauses.append('amount <= ?')
+            params.append(filters['max_amount'])
+
+        return ' AND '.join(clauses), params
+
+    @staticmethod
+    def encode_cursor(timestamp, rowid):
+        raw = json.dumps([timestamp, rowid], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            timestamp, rowid = json.loads(base64.urlsafe_b64decode(padded))
+            return str(timestamp), int(rowid)
+        except (ValueError, TypeError):
+            raise ValueError('Invalid cursor')
+
+    @staticmethod
+    def _fetch(conn, where, params, after, limit):
+        # (timestamp, rowid) matches the tail of idx_events_case_valid_ts, so
+        # each page is an index range scan rather than an OFFSET walk
+        if after:
+            where = f'{where} AND (timestamp, rowid) < (?, ?)'
+            params = params + list(after)
+        return conn.execute(
+            f'SELECT rowid AS _rowid, * FROM unified_events WHERE {where} ORDER BY timestamp DESC, rowid DESC LIMIT ?',
+            params + [limit]
+        ).fetchall()
+
+    @staticmethod
+    def get_page(conn, case_id, filters, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        where, params = TimelineEngine.build_where(case_id, filters)
+        after = TimelineEngine.decode_cursor(cursor) if cursor else None
+
+        rows = TimelineEngine._fetch(conn, where, params, after, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        events = []
+        for row in rows:
+            event = dict(row)
+            event.pop('_rowid')
+            events.append(event)
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = TimelineEngine.encode_cursor(last['timestamp'], last['_rowid'])
+
+        return {
+            'events': events,
+            'total': TimelineEngine.count(conn, case_id, filters),
+            'next_cursor': next_cursor,
+            'limit': limit
+        }
+
+    @staticmethod
+    def count(conn, case_id, filters):
+        """Exact match count, cached until the case's data version changes"""
+        version = get_case_version(conn, case_id)
+        key = (case_id, json.dumps(filters, sort_keys=True, default=str))
+
+        with TimelineEngine._count_lock:
+            cached = TimelineEngine._count_cache.get(key)
+            if cached and cached[0] == version:
+                TimelineEngine._count_cache.move_to_end(key)
+                return cached[1]
+
+        where, params = TimelineEngine.build_where(case_id, filters)
+        total = conn.execute(f'SELECT COUNT(*) FROM unified_events WHERE {where}', params).fetchone()[0]
+
+        with TimelineEngine._count_lock:
+            TimelineEngine._count_cache[key] = (version, total)
+            TimelineEngine._count_cache.move_to_end(key)
+            while len(TimelineEngine._count_cache) > COUNT_CACHE_SIZE:
+                TimelineEngine._count_cache.popitem(last=False)
+        return total
+
+    @staticmethod
+    def iter_ndjson(conn, case_id, filters, batch_size=EXPORT_BATCH_SIZE):
+        """Yield every matching event as one JSON line, a page at a time"""
+        where, params = TimelineEngine.build_where(case_id, filters)
+        after = None
+        while True:
+            rows = TimelineEngine._fetch(conn, where, params, after, batch_size)
+            if not rows:
+                return
+            lines = []
+            for row in rows:
+                event = dict(row)
+                event.pop('_rowid')
+                lines.append(json.dumps(event, ensure_ascii=False))
+            yield '\n'.join(lines) + '\n'
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1]['timestamp'], rows[-1]['_rowid'])
@@ -0,0 +1,406 @@
+import os
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from database import get_connection, bulk_insert
+from engines.window_analytics import (
+    WindowAnalyticsEngine, VELOCITY_WINDOW_SECONDS, PAIR_WINDOW_SECONDS, SEQUENCE_WINDOW_SECONDS
+)
+
+MIDNIGHT_START_HOUR = 0
+MIDNIGHT_END_HOUR = 6
+BURST_THRESHOLD = 10
+HIGH_VALUE_THRESHOLD = 10000
+
+# rule_type -> (severity, score_contribution); names match the rules page
+RULES = {
+    'Midnight Activity': ('medium', 15),
+    'Transaction Burst': ('high', 25),
+    'High Value Transfer': ('critical', 35),
+    'Deleted Messages': ('high', 20),
+    'Transaction Velocity': ('high', 25),
+    'Pair Contact Burst': ('medium', 15),
+    'Call Then Transfer': ('high', 30),
+}
+# Rules over the time structure of a case (window_analytics); incremental runs re-evaluate them for the
+# users and pairs the new events touch
+WINDOW_RULES = ('Transaction Velocity', 'Pair Contact Burst', 'Call Then Transfer')
+# The window rules add findings the legacy RuleEngine never produced, so they are opt-in
+WINDOW_RULES_ENABLED = os.getenv('RULE_WINDOW_RULES', '0') == '1'
+# A window finding depends only on events this close to it in time
+WINDOW_REACH_SECONDS = max(VELOCITY_WINDOW_SECONDS, PAIR_WINDOW_SECONDS, SEQUENCE_WINDOW_SECONDS)
+
+FINDING_COLUMNS = ('id', 'case_id', 'event_id', 'rule_type', 'severity', 'score_contribution', 'description')
+
+
+class VectorizedRuleEngine:
+    """Evaluates every rule over a case in one columnar pass"""
+
+    @staticmethod
+    def load_events(conn, case_id, since_rowid=None):
+        """Load the columns the rules need; metadata is reduced to the deleted flag in SQL"""
+        sql = '''SELECT rowid AS _rowid, event_id, event_type, user_id, receiver, timestamp, amount,
+                   CAST(strftime('%s', timestamp) AS INTEGER) AS seconds,
+                   CASE WHEN json_valid(metadata)
+                        THEN COALESCE(json_extract(metadata, '$.deleted_flag'), json_extract(metadata, '$.is_deleted'))
+                   END AS deleted_flag
+            FROM unified_events WHERE case_id = ? AND is_valid = 1'''
+        params = [case_id]
+        if since_rowid is not None:
+            sql += ' AND rowid > ?'
+            params.append(since_rowid)
+        # Plain tuples instead of sqlite3.Row keep the per-row cost down on large cases
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        frame = pd.DataFrame.from_records(cursor.fetchall(), columns=[d[0] for d in cursor.description])
+        frame['hour'] = pd.to_datetime(frame['timestamp'], errors='coerce', format='mixed').dt.hour
+        frame['amount'] = pd.to_numeric(frame['amount'], errors='coerce')
+        frame['seconds'] = pd.to_numeric(frame['seconds'], errors='coerce')
+        return frame
+
+    @staticmethod
+    def _is_transaction(frame):
+        return (frame['event_type'] == 'transaction').to_numpy()
+
+    @staticmethod
+    def midnight_mask(frame):
+        hour = frame['hour'].to_numpy(dtype=float, na_value=np.nan)
+        return (hour >= MIDNIGHT_START_HOUR) & (hour < MIDNIGHT_END_HOUR)
+
+    @staticmethod
+    def high_value_mask(frame):
+        amount = frame['amount'].to_numpy(dtype=float, na_value=np.nan)
+        return amount > HIGH_VALUE_THRESHOLD
+
+    @staticmethod
+    def deleted_mask(frame):
+        flag = frame['deleted_flag'].astype(str).str.lower()
+        return flag.isin(['1', 'true', '1.0']).to_numpy()
+
+    @staticmethod
+    def burst_mask(frame):
+        is_txn = VectorizedRuleEngine._is_transaction(frame)
+        per_user = frame.loc[is_txn, 'user_id'].value_counts()
+        bursting = per_user.index[per_user > BURST_THRESHOLD]
+        return is_txn & frame['user_id'].isin(bursting).to_numpy()
+
+    @staticmethod
+    def describe(rule_type, hits):
+        if rule_type == 'Midnight Activity':
+            return 'Activity at ' + hits['timestamp'].astype(str) + ' (00:00-06:00)'
+        if rule_type == 'Transaction Burst':
+            counts = hits.groupby('user_id')['event_id'].transform('size')
+            return 'User ' + hits['user_id'].astype(str) + ' made ' + counts.astype(str) + f' transactions (> {BURST_THRESHOLD})'
+        if rule_type == 'High Value Transfer':
+            return 'Transfer of $' + hits['amount'].map('{:,.2f}'.format) + f' exceeds ${HIGH_VALUE_THRESHOLD:,}'
+        return pd.Series('Message flagged as deleted', index=hits.index)
+
+    @staticmethod
+    def evaluate(frame, rule_types=None):
+        """Return (findings frame, per-rule timings in seconds)"""
+        masks = {
+            'Midnight Activity': VectorizedRuleEngine.midnight_mask,
+            'Transaction Burst': VectorizedRuleEngine.burst_mask,
+            'High Value Transfer': VectorizedRuleEngine.high_value_mask,
+            'Deleted Messages': VectorizedRuleEngine.deleted_mask,
+        }
+        parts = []
+        timings = {}
+        for rule_type in (rule_types or masks):
+            started = time.perf_counter()
+            hits = frame.loc[masks[rule_type](frame)]
+            if len(hits):
+                parts.append(VectorizedRuleEngine._findings(
+                    rule_type, hits, VectorizedRuleEngine.describe(rule_type, hits)
+                ))
+            timings[rule_type] = round(time.perf_counter() - started, 4)
+        return VectorizedRuleEngine._concat(parts), timings
+
+    @staticmethod
+    def evaluate_windows(conn, case_id, frame=None):
+        """Return (findings frame, timings) for WINDOW_RULES over every valid event of the case;
+        frame, when given, is the whole case as returned by load_events, or part of it
+        (WindowAnalyticsEngine.load_ranges)"""
+        started = time.perf_counter()
+        frame = WindowAnalyticsEngine.analyze(frame if frame is not None else WindowAnalyticsEngine.load(conn, case_id))
+        timings = {'Window Analysis': round(time.perf_counter() - started, 4)}
+        parts = []
+        for rule_type, (hits, descriptions) in WindowAnalyticsEngine.rule_hits(frame).items():
+            started = time.perf_counter()
+            if len(hits):
+                parts.append(VectorizedRuleEngine._findings(rule_type, hits, descriptions))
+            timings[rule_type] = round(time.perf_counter() - started, 4)
+        return VectorizedRuleEngine._concat(parts), timings
+
+    @staticmethod
+    def _findings(rule_type, hits, descriptions):
+        severity, score = RULES[rule_type]
+        return pd.DataFrame({
+            'event_id': hits['event_id'].to_numpy(),
+            'rule_type': rule_type,
+            'severity': severity,
+            'score_contribution': float(score),
+            'description': descriptions.to_numpy()
+        })
+
+    @staticmethod
+    def _concat(parts):
+        if not parts:
+            return pd.DataFrame(columns=FINDING_COLUMNS[2:])
+        return pd.concat(parts, ignore_index=True)
+
+    @staticmethod
+    def timestamp_column(conn):
+        """suspicious_events uses created_at in older databases, detected_at in new ones"""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(suspicious_events)')}
+        return 'created_at' if 'created_at' in columns else 'detected_at'
+
+    @staticmethod
+    def write_findings(conn, case_id, findings, replace=True):
+        """Stage findings on conn; the caller commits"""
+        if replace:
+            conn.execute('DELETE FROM suspicious_events WHERE case_id = ?', (case_id,))
+        detected_at = datetime.now().isoformat()
+        rows = (
+            (str(uuid.uuid4()), case_id, event_id, rule_type, severity, score, description, detected_at)
+            for event_id, rule_type, severity, score, description in findings[
+                ['event_id', 'rule_type', 'severity', 'score_contribution', 'description']
+            ].itertuples(index=False, name=None)
+        )
+        columns = FINDING_COLUMNS + (VectorizedRuleEngine.timestamp_column(conn),)
+        return bulk_insert(conn, 'suspicious_events', columns, rows, commit=False)
+
+    @staticmethod
+    def get_watermark(conn, case_id):
+        row = conn.execute('SELECT last_rowid FROM rule_watermarks WHERE case_id = ?', (case_id,)).fetchone()
+        return row['last_rowid'] if row else None
+
+    @staticmethod
+    def _set_watermark(conn, case_id, frame, previous=0):
+        last_rowid = int(frame['_rowid'].max()) if len(frame) else previous
+        conn.execute(
+            '''INSERT INTO rule_watermarks (case_id, last_rowid, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(case_id) DO UPDATE SET last_rowid = excluded.last_rowid, updated_at = excluded.updated_at''',
+            (case_id, last_rowid, datetime.now().isoformat())
+        )
+
+    @staticmethod
+    def _transaction_counts(frame):
+        return frame.loc[VectorizedRuleEngine._is_transaction(frame), 'user_id'].value_counts()
+
+    @staticmethod
+    def reset_state(case_id, conn=None):
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute('DELETE FROM rule_user_state WHERE case_id = ?', (case_id,))
+        conn.execute('DELETE FROM rule_watermarks WHERE case_id = ?', (case_id,))
+        if own:
+            conn.commit()
+            conn.close()
+
+    @staticmethod
+    def _result(events, findings, written, timings, load_seconds, write_seconds, mode):
+        return {
+            'mode': mode,
+            'events': events,
+            'rules_evaluated': len(RULES) if WINDOW_RULES_ENABLED else len(RULES) - len(WINDOW_RULES),
+            'findings': written,
+            'findings_by_rule': findings['rule_type'].value_counts().to_dict() if written else {},
+            'timings': {
+                'load': round(load_seconds, 4),
+                'rules': timings,
+                'write': round(write_seconds, 4)
+            }
+        }
+
+    @staticmethod
+    def run_all_rules(case_id):
+        """Full re-evaluation of a case; replaces its findings and rule state"""
+        conn = get_connection()
+        try:
+            started = time.perf_counter()
+            frame = VectorizedRuleEngine.load_events(conn, case_id)
+            load_seconds = time.perf_counter() - started
+
+            findings, timings = VectorizedRuleEngine.evaluate(frame)
+            if WINDOW_RULES_ENABLED:
+                window_findings, window_timings = VectorizedRuleEngine.evaluate_windows(conn, case_id, frame)
+                findings = VectorizedRuleEngine._concat([f for f in (findings, window_findings) if len(f)])
+                timings.update(window_timings)
+
+            started = time.perf_counter()
+            written = VectorizedRuleEngine.write_findings(conn, case_id, findings)
+            VectorizedRuleEngine.reset_state(case_id, conn)
+            counts = VectorizedRuleEngine._transaction_counts(frame)
+            conn.executemany(
+                'INSERT INTO rule_user_state (case_id, user_id, transaction_count) VALUES (?, ?, ?)',
+                ((case_id, user_id, int(count)) for user_id, count in counts.items())
+            )
+            VectorizedRuleEngine._set_watermark(conn, case_id, frame)
+            conn.commit()
+            write_seconds = time.perf_counter() - started
+        finally:
+            conn.close()
+
+        return VectorizedRuleEngine._result(len(frame), findings, written, timings, load_seconds, write_seconds, 'full')
+
+    @staticmethod
+    def run_incremental(case_id):
+        """Evaluate only events stored since the last run.
+
+        Stateless rules look at the new events alone. Transaction Burst adds the
+        new per-user counts to rule_user_state; when a user first crosses the
+        threshold their earlier transactions are flagged too, and the user's earlier
+        findings are rewritten with the new total. New events can land anywhere in
+        time, so the windowed rules are re-evaluated around them: each party's events
+        within twice WINDOW_REACH_SECONDS of its new events are loaded, and the window
+        findings of those within WINDOW_REACH_SECONDS are replaced (_window_scope)."""
+        conn = get_connection()
+        try:
+            watermark = VectorizedRuleEngine.get_watermark(conn, case_id)
+            if watermark is None:
+                conn.close()
+                conn = None
+                return VectorizedRuleEngine.run_all_rules(case_id)
+
+            started = time.perf_counter()
+            frame = VectorizedRuleEngine.load_events(conn, case_id, since_rowid=watermark)
+            load_seconds = time.perf_counter() - started
+
+            findings, timings = VectorizedRuleEngine.evaluate(
+                frame, ['Midnight Activity', 'High Value Transfer', 'Deleted Messages']
+            )
+
+            started = time.perf_counter()
+            new_counts = VectorizedRuleEngine._transaction_counts(frame)
+            previous = VectorizedRuleEngine._previous_counts(conn, case_id, list(new_counts.index))
+            totals = new_counts.add(previous, fill_value=0).astype(int)
+            previous = previous.reindex(totals.index, fill_value=0)
+
+            bursting = totals.index[totals > BURST_THRESHOLD]
+            crossing = totals.index[(totals > BURST_THRESHOLD) & (previous <= BURST_THRESHOLD)]
+
+            is_txn = VectorizedRuleEngine._is_transaction(frame)
+            hits = frame.loc[is_txn & frame['user_id'].isin(bursting).to_numpy()]
+            earlier = VectorizedRuleEngine._earlier_transactions(conn, case_id, list(crossing), watermark)
+            hits = pd.concat([hits[['event_id', 'user_id']], earlier], ignore_index=True)
+            if len(hits):
+                descriptions = (
+                    'User ' + hits['user_id'].astype(str) + ' made '
+                    + hits['user_id'].map(totals).astype(str) + f' transactions (> {BURST_THRESHOLD})'
+                )
+                burst = VectorizedRuleEngine._findings('Transaction Burst', hits, descriptions)
+                findings = VectorizedRuleEngine._concat([findings, burst]) if len(findings) else burst
+            timings['Transaction Burst'] = round(time.perf_counter() - started, 4)
+
+            if WINDOW_RULES_ENABLED:
+                started = time.perf_counter()
+                margin = 2 * WINDOW_REACH_SECONDS
+                ranges = WindowAnalyticsEngine.party_ranges(frame, ('user_id', 'receiver'), margin, margin)
+                involved = WindowAnalyticsEngine.load_ranges(conn, case_id, ranges)
+                load_seconds += time.perf_counter() - started
+                scope = VectorizedRuleEngine._window_scope(involved, ranges)
+                window_findings, window_timings = VectorizedRuleEngine.evaluate_windows(conn, case_id, involved)
+                window_findings = window_findings.merge(scope, on=['event_id', 'rule_type'])
+                findings = VectorizedRuleEngine._concat([f for f in (findings, window_findings) if len(f)])
+                timings.update(window_timings)
+
+            started = time.perf_counter()
+            if WINDOW_RULES_ENABLED:
+                VectorizedRuleEngine._delete_window_findings(conn, case_id, scope)
+            VectorizedRuleEngine._update_burst_totals(conn, case_id, totals[bursting.difference(crossing)])
+            written = VectorizedRuleEngine.write_findings(conn, case_id, findings, replace=False)
+            conn.executemany(
+                '''INSERT INTO rule_user_state (case_id, user_id, transaction_count) VALUES (?, ?, ?)
+                ON CONFLICT(case_id, user_id) DO UPDATE SET transaction_count = transaction_count + excluded.transaction_count''',
+                ((case_id, user_id, int(count)) for user_id, count in new_counts.items())
+            )
+            VectorizedRuleEngine._set_watermark(conn, case_id, frame, previous=watermark)
+            conn.commit()
+            write_seconds = time.perf_counter() - started
+        finally:
+            if conn is not None:
+                conn.close()
+
+        return VectorizedRuleEngine._result(len(frame), findings, written, timings, load_seconds, write_seconds, 'incremental')
+
+    @staticmethod
+    def _window_scope(frame, ranges):
+        """(event_id, rule_type) of the window findings that evaluating frame, loaded for
+        ranges (party, since, until), gets right: those of events at least
+        WINDOW_REACH_SECONDS inside a range of their user (every window rule) or receiver
+        (the pair and sequence rules)"""
+        if not ranges:
+            return pd.DataFrame(columns=['event_id', 'rule_type'])
+        bounds = pd.DataFrame(ranges, columns=['party', 'since', 'until'])
+        bounds['since'] += WINDOW_REACH_SECONDS
+        bounds['until'] -= WINDOW_REACH_SECONDS
+        parts = []
+        for column, rule_types in (('user_id', WINDOW_RULES), ('receiver', ('Pair Contact Burst', 'Call Then Transfer'))):
+            matched = frame[['event_id', column, 'seconds']].merge(bounds, left_on=column, right_on='party')
+            inside = matched.loc[matched['seconds'].between(matched['since'], matched['until']), 'event_id'].unique()
+            parts.extend(pd.DataFrame({'event_id': inside, 'rule_type': rule_type}) for rule_type in rule_types)
+        return pd.concat(parts, ignore_index=True).drop_duplicates()
+
+    @staticmethod
+    def _delete_window_findings(conn, case_id, scope):
+        """Drop the stored findings in scope (_window_scope) with one join through a temp table"""
+        conn.execute('DROP TABLE IF EXISTS temp.window_scope')
+        conn.execute('CREATE TEMP TABLE window_scope (event_id TEXT, rule_type TEXT, PRIMARY KEY (event_id, rule_type)) WITHOUT ROWID')
+        conn.executemany('INSERT INTO window_scope VALUES (?, ?)', scope.itertuples(index=False, name=None))
+        conn.execute(
+            '''DELETE FROM suspicious_events WHERE rowid IN (
+                SELECT s.rowid FROM window_scope w
+                JOIN suspicious_events s ON s.event_id = w.event_id AND s.rule_type = w.rule_type
+                WHERE s.case_id = ?)''',
+            (case_id,)
+        )
+        conn.execute('DROP TABLE temp.window_scope')
+
+    @staticmethod
+    def _update_burst_totals(conn, case_id, totals):
+        """Rewrite the stored Transaction Burst descriptions of users already over the
+        threshold with their new transaction totals"""
+        if not len(totals):
+            return
+        conn.execute('DROP TABLE IF EXISTS temp.burst_totals')
+        conn.execute('CREATE TEMP TABLE burst_totals (user_id TEXT PRIMARY KEY, total INTEGER) WITHOUT ROWID')
+        conn.executemany('INSERT INTO burst_totals VALUES (?, ?)', ((u, int(t)) for u, t in totals.items()))
+        conn.execute(
+            f'''UPDATE suspicious_events SET description = 'User ' || b.user_id || ' made ' || b.total || ' transactions (> {BURST_THRESHOLD})'
+            FROM burst_totals b JOIN unified_events e ON e.case_id = ? AND e.user_id = b.user_id
+            WHERE suspicious_events.event_id = e.event_id AND suspicious_events.case_id = ?
+              AND suspicious_events.rule_type = ?''',
+            (case_id, case_id, 'Transaction Burst')
+        )
+        conn.execute('DROP TABLE temp.burst_totals')
+
+    @staticmethod
+    def _previous_counts(conn, case_id, user_ids):
+        counts = {}
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            rows = conn.execute(
+                f"SELECT user_id, transaction_count FROM rule_user_state WHERE case_id = ? AND user_id IN ({', '.join('?' * len(chunk))})",
+                [case_id] + chunk
+            ).fetchall()
+            counts.update({row['user_id']: row['transaction_count'] for row in rows})
+        return pd.Series(counts, dtype='int64')
+
+    @staticmethod
+    def _earlier_transactions(conn, case_id, user_ids, watermark):
+        rows = []
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            rows.extend(conn.execute(
+                f"""SELECT event_id, user_id FROM unified_events
+                WHERE case_id = ? AND user_id IN ({', '.join('?' * len(chunk))})
+                  AND event_type = 'transaction' AND is_valid = 1 AND rowid <= ?""",
+                [case_id] + chunk + [watermark]
+            ).fetchall())
+        return pd.DataFrame([tuple(r) for r in rows], columns=['event_id', 'user_id'])
@@ -0,0 +1,408 @@
+import numpy as np
+import pandas as pd
+
+VELOCITY_WINDOW_SECONDS = 3600
+VELOCITY_THRESHOLD = 5
+PAIR_WINDOW_SECONDS = 3600
+PAIR_THRESHOLD = 6
+SEQUENCE_WINDOW_SECONDS = 60 * 60
+# Gaps longer than this (and "no earlier event") are clipped to it in features
+GAP_CAP_SECONDS = 30 * 86400
+# How far back the velocity features count events
+CONTEXT_SECONDS = max(VELOCITY_WINDOW_SECONDS, PAIR_WINDOW_SECONDS)
+
+EVENT_COLUMNS = ['_rowid', 'event_id', 'event_type', 'user_id', 'receiver', 'amount', 'seconds']
+SELECT_EVENTS = '''SELECT rowid, event_id, event_type, user_id, receiver, amount,
+                   CAST(strftime('%s', timestamp) AS INTEGER)
+            FROM unified_events'''
+# Stored timestamps are 'YYYY-MM-DD HH:MM:SS' text, so epoch bounds become index ranges on
+# idx_events_case_user_ts / idx_events_case_receiver_ts
+AT_OR_AFTER = "timestamp >= strftime('%Y-%m-%d %H:%M:%S', ?, 'unixepoch')"
+BEFORE = "timestamp < strftime('%Y-%m-%d %H:%M:%S', ?, 'unixepoch')"
+
+# A case's events under one party column, as user (role 1) or as receiver (role 0)
+STREAM_COLUMNS = ['party', 'timestamp', '_rowid', 'role', 'event_id', 'event_type', 'user_id', 'receiver',
+                  'amount', 'metadata_size', 'seconds']
+STREAM_SQL = '''SELECT {party}, timestamp, rowid, {role}, event_id, event_type, user_id, receiver, amount,
+                   LENGTH(metadata), CAST(strftime('%s', timestamp) AS INTEGER)
+            FROM unified_events WHERE case_id = ? AND is_valid = 1 AND {party} {condition}'''
+
+# Appended to the base anomaly features; order is part of the model's feature schema
+WINDOW_FEATURES = ['user_velocity', 'pair_velocity', 'log_gap', 'log_since_call']
+
+
+def _sorted_windows(groups, seconds, window):
+    """Sort events by (group, time). For each sorted position return the [start, end) range of
+    its group's events in [t - window, t], found with two binary searches over one composite key,
+    and the end of its group's events in [t, t + window]"""
+    if not len(groups):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    t = seconds - seconds.min()
+    # Wider than any time offset plus the window, so a lower bound never reaches the previous group
+    span = int(t.max()) + window + 1
+    key = groups.astype(np.int64) * span + t
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    start = np.searchsorted(key, key - window, side='left')
+    end = np.searchsorted(key, key, side='right')
+    ahead = np.searchsorted(key, key + window, side='right')
+    return order, start, end, ahead
+
+
+def _window_members(start, end, hit, n):
+    """Positions covered by any window [start, end) of a hit position (difference array + cumsum)"""
+    marks = np.bincount(start[hit], minlength=n + 1) - np.bincount(end[hit], minlength=n + 1)
+    return np.cumsum(marks[:n]) > 0
+
+
+def _unsort(order, values, fill):
+    out = np.full(len(order), fill, dtype=values.dtype)
+    out[order] = values
+    return out
+
+
+def _latest_before(groups, seconds, query_groups, query_seconds):
+    """Time of the latest event of the same group strictly before each query, or NaN"""
+    result = np.full(len(query_groups), np.nan)
+    if not len(groups) or not len(query_groups):
+        return result
+    base = min(seconds.min(), query_seconds.min())
+    span = int(max(seconds.max(), query_seconds.max()) - base) + 1
+    key = groups.astype(np.int64) * span + (seconds - base)
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    query = query_groups.astype(np.int64) * span + (query_seconds - base)
+    index = np.searchsorted(key, query, side='left') - 1
+    found = index >= 0
+    found[found] = groups[order][index[found]] == query_groups[found]
+    result[found] = seconds[order][index[found]]
+    return result
+
+
+class WindowAnalyticsEngine:
+    """Time-structure analytics over a case's events.
+
+    Every measure is computed on arrays sorted by (group, time), with windows found by
+    binary search instead of pairwise comparison, so a case costs O(n log n):
+    per-user transaction velocity, per-pair contact velocity, inter-event gaps and
+    call -> transfer sequences. The results feed the windowed rules in
+    vectorized_rules and the window features of the anomaly model."""
+
+    @staticmethod
+    def _frame(rows, columns=EVENT_COLUMNS):
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        frame['seconds'] = pd.to_numeric(frame['seconds'], errors='coerce')
+        frame['amount'] = pd.to_numeric(frame['amount'], errors='coerce')
+        return frame
+
+    @staticmethod
+    def _ordered(frame):
+        # Events in the same second are counted in rowid order, whichever subset was loaded
+        return frame.drop_duplicates('_rowid').sort_values('_rowid', ignore_index=True)
+
+    @staticmethod
+    def load(conn, case_id):
+        """Valid events of a case with epoch seconds, in rowid order; timestamps SQLite cannot
+        parse are NaN"""
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(f'{SELECT_EVENTS} WHERE case_id = ? AND is_valid = 1', (case_id,)).fetchall()
+        return WindowAnalyticsEngine._ordered(WindowAnalyticsEngine._frame(rows))
+
+    @staticmethod
+    def party_ranges(frame, columns, before, after):
+        """Merged [t - before, t + after] ranges of the timed events in frame, per party in columns.
+
+        Returns a list of (party, since, until) in epoch seconds"""
+        parts = [pd.DataFrame({'party': frame[column], 'seconds': frame['seconds']}) for column in columns]
+        events = pd.concat(parts, ignore_index=True).dropna().sort_values(['party', 'seconds'], ignore_index=True)
+        if not len(events):
+            return []
+        party, seconds = events['party'].to_numpy(), events['seconds'].to_numpy(dtype=np.int64)
+        new = np.r_[True, (party[1:] != party[:-1]) | (seconds[1:] - before > seconds[:-1] + after)]
+        group = np.cumsum(new)
+        ranges = events.groupby(group)['seconds'].agg(['min', 'max'])
+        return list(zip(party[new], (ranges['min'] - before).astype(int), (ranges['max'] + after).astype(int)))
+
+    @staticmethod
+    def load_ranges(conn, case_id, ranges, anchors=False):
+        """Valid events with one party as user or receiver within each (party, since, until)
+        range, in rowid order.
+
+        With anchors, each range also loads the party's latest event as user and latest call
+        (as either side) in the GAP_CAP_SECONDS before since: the rows the gap and since-call
+        features of the range's events can reach back to"""
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = []
+        for party, since, until in ranges:
+            for column in ('user_id', 'receiver'):
+                rows.extend(cursor.execute(
+                    f'{SELECT_EVENTS} WHERE case_id = ? AND {column} = ? AND is_valid = 1 AND {AT_OR_AFTER} AND {BEFORE}',
+                    (case_id, party, int(since), int(until) + 1)
+                ).fetchall())
+            if not anchors:
+                continue
+            window = (case_id, party, int(since) - GAP_CAP_SECONDS, int(since))
+            latest = f"AND {AT_OR_AFTER} AND {BEFORE} AND strftime('%s', timestamp) IS NOT NULL ORDER BY timestamp DESC, rowid DESC LIMIT 1"
+            for condition in ('user_id = ?', "event_type = 'call' AND user_id = ?",
+                              "event_type = 'call' AND receiver = ? AND user_id IS NOT NULL"):
+                rows.extend(cursor.execute(
+                    f'{SELECT_EVENTS} WHERE case_id = ? AND {condition} AND is_valid = 1 {latest}', window
+                ).fetchall())
+        return WindowAnalyticsEngine._ordered(WindowAnalyticsEngine._frame(rows))
+
+    @staticmethod
+    def analyze(frame):
+        """Add window columns to an events frame (event_type, user_id, receiver, seconds).
+
+        user_velocity / pair_velocity: the user's events / the pair's contacts in the trailing window
+        velocity_peak / pair_peak: the highest transaction / contact count in any window of that user / pair
+        velocity_nearby / pair_nearby: the user's transactions / the pair's contacts within the window
+            either side of the event, itself included
+        in_velocity_window / in_pair_window: the event is part of a window at or over the threshold
+        gap: seconds since the user's previous event
+        since_call: seconds since the user's latest call with anyone
+        since_pair_call: for transactions, seconds since the latest call between the same two parties"""
+        n = len(frame)
+        frame = frame.copy()
+        timed = frame['seconds'].notna().to_numpy()
+        seconds = frame['seconds'].fillna(0).to_numpy(dtype=np.int64)
+        is_txn = (frame['event_type'] == 'transaction').to_numpy() & timed
+        is_call = (frame['event_type'] == 'call').to_numpy() & timed
+
+        # One code space for users and receivers so a party matches on either side
+        codes, _ = pd.factorize(pd.concat([frame['user_id'], frame['receiver']], ignore_index=True))
+        user, receiver = codes[:n], codes[n:]
+        has_user = timed & (user >= 0)
+        has_pair = has_user & (receiver >= 0)
+        pair_codes, _ = pd.factorize(
+            np.minimum(user, receiver).astype(np.int64) * (int(codes.max(initial=0)) + 2) + np.maximum(user, receiver)
+        )
+        columns = {
+            name: np.zeros(n, dtype=np.int64)
+            for name in ('user_velocity', 'pair_velocity', 'velocity_peak', 'pair_peak', 'velocity_nearby', 'pair_nearby')
+        }
+        columns.update({name: np.zeros(n, dtype=bool) for name in ('in_velocity_window', 'in_pair_window')})
+        columns.update({name: np.full(n, np.nan) for name in ('gap', 'since_call', 'since_pair_call')})
+
+        # Velocity and gaps over all of a user's events
+        rows = np.flatnonzero(has_user)
+        order, start, _, _ = _sorted_windows(user[rows], seconds[rows], VELOCITY_WINDOW_SECONDS)
+        columns['user_velocity'][rows] = _unsort(order, np.arange(len(order)) - start + 1, 0)
+        sorted_users = user[rows][order]
+        same_user = np.r_[False, sorted_users[1:] == sorted_users[:-1]]
+        gaps = np.where(same_user, np.diff(seconds[rows][order], prepend=0), np.nan)
+        columns['gap'][rows] = _unsort(order, gaps, np.nan)
+
+        # Transaction velocity for the rule
+        rows = np.flatnonzero(is_txn & has_user)
+        order, start, end, ahead = _sorted_windows(user[rows], seconds[rows], VELOCITY_WINDOW_SECONDS)
+        counts = end - start
+        members = _window_members(start, end, np.flatnonzero(counts >= VELOCITY_THRESHOLD), len(order))
+        peaks = pd.Series(counts).groupby(user[rows][order]).transform('max').to_numpy()
+        columns['in_velocity_window'][rows] = _unsort(order, members, False)
+        columns['velocity_peak'][rows] = _unsort(order, peaks, 0)
+        columns['velocity_nearby'][rows] = _unsort(order, ahead - start, 0)
+
+        # Contacts between the same two parties, whichever side started them
+        rows = np.flatnonzero(has_pair)
+        order, start, end, ahead = _sorted_windows(pair_codes[rows], seconds[rows], PAIR_WINDOW_SECONDS)
+        counts = end - start
+        members = _window_members(start, end, np.flatnonzero(counts >= PAIR_THRESHOLD), len(order))
+        peaks = pd.Series(counts).groupby(pair_codes[rows][order]).transform('max').to_numpy()
+        columns['pair_velocity'][rows] = _unsort(order, np.arange(len(order)) - start + 1, 0)
+        columns['in_pair_window'][rows] = _unsort(order, members, False)
+        columns['pair_peak'][rows] = _unsort(order, peaks, 0)
+        columns['pair_nearby'][rows] = _unsort(order, ahead - start, 0)
+
+        # Sequences: the latest earlier call of the user, and of the pair for transactions
+        calls = np.flatnonzero(is_call & has_user)
+        answered = calls[receiver[calls] >= 0]
+        rows = np.flatnonzero(has_user)
+        columns['since_call'][rows] = seconds[rows] - _latest_before(
+            np.concatenate([user[calls], receiver[answered]]), np.concatenate([seconds[calls], seconds[answered]]),
+            user[rows], seconds[rows]
+        )
+        calls = np.flatnonzero(is_call & has_pair)
+        rows = np.flatnonzero(is_txn & has_pair)
+        columns['since_pair_call'][rows] = seconds[rows] - _latest_before(
+            pair_codes[calls], seconds[calls], pair_codes[rows], seconds[rows]
+        )
+
+        for name, values in columns.items():
+            frame[name] = values
+        return frame
+
+    @staticmethod
+    def rule_hits(frame):
+        """rule_type -> (hit rows, descriptions) for the windowed rules over an analyzed frame.
+
+        Descriptions only use counts from the window either side of the event, so a finding's
+        text does not change with events further away in time"""
+        minutes = VELOCITY_WINDOW_SECONDS // 60
+        hits = {}
+
+        velocity = frame.loc[frame['in_velocity_window'].to_numpy()]
+        hits['Transaction Velocity'] = (velocity, (
+            'User ' + velocity['user_id'].astype(str) + ' made ' + velocity['velocity_nearby'].astype(str)
+            + f' transactions within {minutes} minutes of this one (>= {VELOCITY_THRESHOLD} in {minutes} minutes)'
+        ))
+
+        pairs = frame.loc[frame['in_pair_window'].to_numpy()]
+        hits['Pair Contact Burst'] = (pairs, (
+            pairs['user_id'].astype(str) + ' and ' + pairs['receiver'].astype(str) + ' were in contact '
+            + pairs['pair_nearby'].astype(str) + f' times within {PAIR_WINDOW_SECONDS // 60} minutes of this contact'
+            + f' (>= {PAIR_THRESHOLD} in {PAIR_WINDOW_SECONDS // 60} minutes)'
+        ))
+
+        sequence = frame.loc[(frame['since_pair_call'] <= SEQUENCE_WINDOW_SECONDS).to_numpy()]
+        hits['Call Then Transfer'] = (sequence, (
+            'Transfer of $' + sequence['amount'].fillna(0).map('{:,.2f}'.format).astype(str) + ' to '
+            + sequence['receiver'].astype(str) + ' ' + (sequence['since_pair_call'] // 60).astype(int).astype(str)
+            + ' minutes after a call between them'
+        ))
+        return hits
+
+    @staticmethod
+    def features(frame):
+        """WINDOW_FEATURES as float32 for an analyzed frame; gaps are log-scaled and clipped"""
+        gap = np.log1p(frame['gap'].clip(upper=GAP_CAP_SECONDS).fillna(GAP_CAP_SECONDS).to_numpy(dtype=float))
+        since_call = np.log1p(frame['since_call'].clip(upper=GAP_CAP_SECONDS).fillna(GAP_CAP_SECONDS).to_numpy(dtype=float))
+        return np.column_stack([
+            frame['user_velocity'].to_numpy(dtype=float),
+            frame['pair_velocity'].to_numpy(dtype=float),
+            gap,
+            since_call
+        ]).astype(np.float32)
+
+    @staticmethod
+    def features_for(event_types, user_ids, receivers, timestamps):
+        """WINDOW_FEATURES for events held in memory, e.g. the seed dataset"""
+        stamps = pd.to_datetime(pd.Series(timestamps), errors='coerce', format='mixed')
+        frame = pd.DataFrame({
+            'event_type': list(event_types), 'user_id': list(user_ids), 'receiver': list(receivers),
+            'seconds': (stamps - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+        })
+        return WindowAnalyticsEngine.features(WindowAnalyticsEngine.analyze(frame))
+
+    @staticmethod
+    def chunk_features(conn, case_id, chunk):
+        """WINDOW_FEATURES for some of a case's events (a frame with _rowid, event_type, user_id,
+        receiver and seconds), in the chunk's row order.
+
+        Velocities count events involving the user in the trailing CONTEXT_SECONDS, and gaps
+        reach back only to the user's previous event and last call. Each user's context is
+        therefore those windows plus two anchor rows (load_ranges), whatever the case's size"""
+        ranges = WindowAnalyticsEngine.party_ranges(chunk, ('user_id',), CONTEXT_SECONDS, 0)
+        context = WindowAnalyticsEngine.load_ranges(conn, case_id, ranges, anchors=True)
+        frame = WindowAnalyticsEngine._ordered(pd.concat([chunk, context], ignore_index=True) if len(context) else chunk)
+        frame = WindowAnalyticsEngine.analyze(frame)
+        window = pd.DataFrame(
+            WindowAnalyticsEngine.features(frame), index=frame['_rowid'].to_numpy(), columns=WINDOW_FEATURES
+        )
+        return window.reindex(chunk['_rowid'].to_numpy()).to_numpy()
+
+    @staticmethod
+    def _carry(frame, party):
+        """The rows of party the next batch of its stream needs: its events in the last
+        CONTEXT_SECONDS, its latest event as user and its latest call"""
+        own = frame.loc[(frame['party'] == party).to_numpy()]
+        timed = own['seconds'].notna().to_numpy()
+        seconds = own['seconds'].to_numpy(dtype=float)
+        keep = timed & (seconds >= np.nanmax(seconds, initial=-np.inf) - CONTEXT_SECONDS)
+        for anchor in (
+            (own['role'] == 1).to_numpy(),
+            (own['event_type'] == 'call').to_numpy() & own['user_id'].notna().to_numpy()
+        ):
+            last = np.flatnonzero(anchor & timed)
+            keep[last[-1:]] = True
+        return list(own.loc[keep].itertuples(index=False, name=None))
+
+    @staticmethod
+    def iter_case_features(conn, case_id, chunk_size):
+        """Yield (events, WINDOW_FEATURES) for every valid event of a case, about chunk_size rows
+        at a time; events has event_id, event_type, amount, timestamp and metadata_size.
+
+        Events are read once as user and once as receiver, merged by SQLite into one
+        stream in (party, time) order from the per-party timestamp indexes. All the features of a
+        party's events as user come from earlier rows of its own stream, so a batch only
+        needs the rows _carry keeps when a party continues into the next batch. Memory
+        follows chunk_size and the busiest party-hour, not the size of the case"""
+        def cursor_for(sql, params):
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            return cursor.execute(sql, params)
+
+        def emit(frame, first):
+            analyzed = WindowAnalyticsEngine.analyze(WindowAnalyticsEngine._ordered(frame))
+            features = WindowAnalyticsEngine.features(analyzed)
+            events = frame.iloc[first:]
+            events = events.loc[(events['role'] == 1).to_numpy()]
+            return events, features[pd.Index(analyzed['_rowid']).get_indexer(events['_rowid'])]
+
+        # No user: every window feature is empty, so these need no context
+        unowned = cursor_for(STREAM_SQL.format(party='user_id', role=1, condition='IS NULL'), (case_id,))
+        while rows := unowned.fetchmany(chunk_size):
+            yield emit(WindowAnalyticsEngine._frame(rows, STREAM_COLUMNS), 0)
+
+        merged = cursor_for(
+            f"{STREAM_SQL.format(party='user_id', role=1, condition='IS NOT NULL')} "
+            f"UNION ALL {STREAM_SQL.format(party='receiver', role=0, condition='IS NOT NULL')} "
+            f"ORDER BY 1, 2, 3", (case_id, case_id)
+        )
+        carry, rows = [], merged.fetchmany(chunk_size)
+        while rows:
+            following = merged.fetchmany(chunk_size)
+            frame = WindowAnalyticsEngine._frame(carry + rows, STREAM_COLUMNS)
+            yield emit(frame, len(carry))
+            party = rows[-1][0]
+            carry = WindowAnalyticsEngine._carry(frame, party) if following and following[0][0] == party else []
+            rows = following
+
+    @staticmethod
+    def summary(conn, case_id, limit=10):
+        """Peak velocities per user and pair, gap distribution and call -> transfer sequences"""
+        frame = WindowAnalyticsEngine.analyze(WindowAnalyticsEngine.load(conn, case_id))
+        gaps = frame['gap'].dropna()
+        users = frame.loc[frame['velocity_peak'] > 0].groupby('user_id')['velocity_peak'].max()
+        contacts = frame.loc[frame['pair_peak'] > 0]
+        ends = np.sort(contacts[['user_id', 'receiver']].astype(str).to_numpy(), axis=1)
+        pairs = contacts['pair_peak'].groupby([ends[:, 0], ends[:, 1]]).max() if len(contacts) else pd.Series(dtype='int64')
+        # Burstiness per user: (sigma - mu) / (sigma + mu) of gaps; 1 is bursty, 0 random, -1 regular
+        stats = frame.dropna(subset=['gap']).groupby('user_id')['gap'].agg(['mean', 'std', 'size'])
+        stats = stats.loc[stats['size'] >= 3]
+        burstiness = ((stats['std'] - stats['mean']) / (stats['std'] + stats['mean']).replace(0, np.nan)).dropna()
+        sequences = frame.loc[frame['since_pair_call'] <= SEQUENCE_WINDOW_SECONDS]
+        return {
+            'events': len(frame),
+            'windows': {
+                'velocity_seconds': VELOCITY_WINDOW_SECONDS,
+                'pair_seconds': PAIR_WINDOW_SECONDS,
+                'sequence_seconds': SEQUENCE_WINDOW_SECONDS
+            },
+            'top_users': [
+                {'user_id': user_id, 'peak_transactions': int(peak)}
+                for user_id, peak in users.nlargest(limit).items()
+            ],
+            'top_pairs': [
+                {'parties': [a, b], 'peak_contacts': int(peak)}
+                for (a, b), peak in pairs.nlargest(limit).items()
+            ],
+            'gap_seconds': {
+                f'p{q}': float(gaps.quantile(q / 100)) for q in (5, 25, 50, 75, 95)
+            } if len(gaps) else {},
+            'burstiest_users': [
+                {'user_id': user_id, 'burstiness': round(float(value), 3)}
+                for user_id, value in burstiness.nlargest(limit).items()
+            ],
+            'call_then_transfer': {
+                'transactions': len(sequences),
+                'amount': float(sequences['amount'].fillna(0).sum())
+            },
+            'flagged': {
+                'velocity': int(frame['in_velocity_window'].sum()),
+                'pair': int(frame['in_pair_window'].sum())
+            }
+        }
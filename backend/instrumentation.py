@@ -0,0 +1,422 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from database import get_connection, set_statement_observer
+
+PROFILES_DIR = os.getenv('PROFILES_DIR', 'profiles')
+# Job types profiled on every run, e.g. "analysis,report"; a job payload can also set profile=true
+PROFILE_JOB_TYPES = {t.strip() for t in os.getenv('PROFILE_JOB_TYPES', '').split(',') if t.strip()}
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5')) / 1000
+# Exact per-stage Python allocation peaks via tracemalloc; slows the run down noticeably
+TRACE_ALLOCATIONS = os.getenv('INSTRUMENT_TRACEMALLOC', '0') == '1'
+# How often a run samples RSS to find each stage's peak
+RSS_SAMPLE_INTERVAL = float(os.getenv('INSTRUMENT_RSS_INTERVAL_MS', '20')) / 1000
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+
+_current_run = ContextVar('pipeline_run', default=None)
+_current_stage = ContextVar('pipeline_stage', default=None)
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_mb():
+    """Current resident set size; falls back to the high-water mark where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _observe_statement(seconds):
+    stage = _current_stage.get()
+    if stage is not None:
+        stage.sql_queries += 1
+        stage.sql_seconds += seconds
+    run = _current_run.get()
+    if run is not None:
+        run.sql_queries += 1
+        run.sql_seconds += seconds
+
+
+set_statement_observer(_observe_statement)
+
+
+class Stage:
+    """Measurements for one named step of a run; callers set rows when they know it"""
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.rows = None
+        self.seconds = 0.0
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.rss_start_mb = 0.0
+        self.rss_end_mb = 0.0
+        self.peak_rss_mb = 0.0
+        self.python_peak_mb = None
+
+    def as_dict(self):
+        return {
+            'stage': self.name,
+            'parent': self.parent,
+            'seconds': round(self.seconds, 4),
+            'rows': self.rows,
+            'rows_per_second': round(self.rows / self.seconds, 1) if self.rows and self.seconds else None,
+            'sql_queries': self.sql_queries,
+            'sql_seconds': round(self.sql_seconds, 4),
+            'rss_delta_mb': round(self.rss_end_mb - self.rss_start_mb, 1),
+            'peak_rss_mb': round(self.peak_rss_mb, 1),
+            'python_peak_mb': round(self.python_peak_mb, 1) if self.python_peak_mb is not None else None,
+        }
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage of the current run. Outside a run the stage is measured but not kept"""
+    run = _current_run.get()
+    parent = _current_stage.get()
+    current = Stage(name, parent.name if parent else None)
+    if TRACE_ALLOCATIONS and tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    current.rss_start_mb = current.peak_rss_mb = rss_mb()
+    sampler = run.rss_sampler if run is not None else None
+    if sampler:
+        sampler.track(current)
+    token = _current_stage.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - started
+        _current_stage.reset(token)
+        if sampler:
+            sampler.untrack(current)
+        current.rss_end_mb = rss_mb()
+        current.peak_rss_mb = max(current.peak_rss_mb, current.rss_end_mb)
+        if TRACE_ALLOCATIONS and tracemalloc.is_tracing():
+            current.python_peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        if parent is not None:
+            # Statements of a nested stage also count towards the enclosing one
+            parent.sql_queries += current.sql_queries
+            parent.sql_seconds += current.sql_seconds
+        if run is not None:
+            run.stages.append(current)
+
+
+class RSSSampler(threading.Thread):
+    """Polls the process's RSS while a run is active and raises the peak of every stage open
+    at that moment. ru_maxrss only knows the high-water mark since the process started, which
+    in a long-lived worker says nothing about a single stage"""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        super().__init__(daemon=True, name='rss-sampler')
+        self.interval = interval
+        self.peak_mb = rss_mb()
+        self._open = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def track(self, stage):
+        with self._lock:
+            self._open.append(stage)
+
+    def untrack(self, stage):
+        with self._lock:
+            self._open.remove(stage)
+
+    def sample(self):
+        value = rss_mb()
+        with self._lock:
+            self.peak_mb = max(self.peak_mb, value)
+            for stage in self._open:
+                stage.peak_rss_mb = max(stage.peak_rss_mb, value)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed ("folded") stacks,
+    the format py-spy writes with --format raw and flamegraph.pl / speedscope read"""
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        super().__init__(daemon=True, name='stack-sampler')
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class PipelineRun:
+    """One job's execution on a case. Stages opened while it is active attach to it, statements on
+    any connection in the same context are counted, and the run is saved to pipeline_runs on exit.
+
+    With profile=True the run also writes <id>.prof (cProfile/pstats) and <id>.folded (sampled
+    stacks) to PROFILES_DIR. Work done in child processes is not profiled."""
+
+    def __init__(self, case_id, run_type, job_id=None, profile=False):
+        self.id = str(uuid.uuid4())
+        self.case_id = case_id
+        self.run_type = run_type
+        self.job_id = job_id
+        self.profile = profile
+        self.stages = []
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.profile_path = None
+        self.rss_sampler = None
+        self._profiler = None
+        self._sampler = None
+
+    def __enter__(self):
+        self.started_at = datetime.now().isoformat()
+        self._started = time.perf_counter()
+        self._token = _current_run.set(self)
+        self._tracing = TRACE_ALLOCATIONS and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        self.rss_sampler = RSSSampler()
+        self.rss_sampler.start()
+        if self.profile:
+            self._sampler = StackSampler(threading.get_ident())
+            self._sampler.start()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._started
+        if self._profiler:
+            self._profiler.disable()
+            self._sampler.stop()
+            self.profile_path = self._write_profiles()
+        if self._tracing:
+            tracemalloc.stop()
+        self.rss_sampler.stop()
+        _current_run.reset(self._token)
+        try:
+            save_run(
+                self.case_id, self.run_type, seconds, self.stages,
+                status='failed' if exc_type else 'completed',
+                error=str(exc) if exc else None,
+                job_id=self.job_id, run_id=self.id, started_at=self.started_at,
+                sql_queries=self.sql_queries, sql_seconds=self.sql_seconds,
+                profile_path=self.profile_path, peak_rss=self.rss_sampler.peak_mb
+            )
+        except Exception as e:
+            print(f"Failed to record pipeline run {self.id}: {e}")
+        return False
+
+    def _write_profiles(self):
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        base = os.path.join(PROFILES_DIR, self.id)
+        self._profiler.dump_stats(base + '.prof')
+        self._sampler.write(base + '.folded')
+        return base
+
+
+def current_run():
+    return _current_run.get()
+
+
+def should_profile(job_type, payload):
+    return bool(payload.get('profile')) or job_type in PROFILE_JOB_TYPES
+
+
+def save_run(case_id, run_type, seconds, stages, status='completed', error=None, job_id=None, run_id=None,
+             started_at=None, sql_queries=None, sql_seconds=None, profile_path=None, peak_rss=None):
+    """Store a run; stages are Stage objects or dicts. Rows are those of the top-level stages.
+    peak_rss is the run's sampled peak; without it the process high-water mark is stored"""
+    stages = [s.as_dict() if isinstance(s, Stage) else s for s in stages]
+    top = [s for s in stages if not s.get('parent')]
+    rows = [s['rows'] for s in top if s.get('rows') is not None]
+    conn = get_connection()
+    conn.execute(
+        '''INSERT INTO pipeline_runs (id, case_id, job_id, run_type, status, error, started_at, seconds, rows,
+        sql_queries, sql_seconds, peak_rss_mb, stages, profile_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (
+            run_id or str(uuid.uuid4()), case_id, job_id, run_type, status, error,
+            started_at or datetime.now().isoformat(), round(seconds, 4), max(rows) if rows else None,
+            sql_queries if sql_queries is not None else sum(s['sql_queries'] for s in top),
+            round(sql_seconds if sql_seconds is not None else sum(s['sql_seconds'] for s in top), 4),
+            round(peak_rss if peak_rss is not None else peak_rss_mb(), 1), json.dumps(stages), profile_path
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_runs(conn, case_id=None, limit=50):
+    if case_id:
+        rows = conn.execute(
+            'SELECT * FROM pipeline_runs WHERE case_id = ? ORDER BY started_at DESC LIMIT ?', (case_id, limit)
+        ).fetchall()
+    else:
+        rows = conn.execute('SELECT * FROM pipeline_runs ORDER BY started_at DESC LIMIT ?', (limit,)).fetchall()
+    return [{**dict(row), 'stages': json.loads(row['stages'])} for row in rows]
+
+
+class RequestMetrics:
+    """Request counts and latency histograms per route template, for this process"""
+
+    def __init__(self, buckets=REQUEST_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._histograms = {}
+
+    def observe(self, method, route, status, seconds):
+        with self._lock:
+            self._counts[(method, route, str(status))] += 1
+            histogram = self._histograms.setdefault((method, route), [[0] * len(self.buckets), 0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts), {k: ([*v[0]], v[1], v[2]) for k, v in self._histograms.items()}
+
+
+request_metrics = RequestMetrics()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+class MetricsWriter:
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, help_text):
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {kind}')
+
+    def sample(self, name, value, **labels):
+        self.lines.append(f'{name}{_labels(**labels)} {value}')
+
+    def histogram(self, name, buckets, counts, total, sum_value, **labels):
+        for bound, count in zip(buckets, counts):
+            self.sample(f'{name}_bucket', count, **labels, le=bound)
+        self.sample(f'{name}_bucket', total, **labels, le='+Inf')
+        self.sample(f'{name}_count', total, **labels)
+        self.sample(f'{name}_sum', round(sum_value, 6), **labels)
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def render_metrics(conn, extra_gauges=None):
+    """Prometheus text exposition: this process's request metrics plus pipeline runs from the
+    database, which covers jobs executed in worker processes"""
+    out = MetricsWriter()
+    counts, histograms = request_metrics.snapshot()
+
+    out.family('forensic_http_requests_total', 'counter', 'HTTP requests by route template and status')
+    for (method, route, status), count in sorted(counts.items()):
+        out.sample('forensic_http_requests_total', count, method=method, route=route, status=status)
+    out.family('forensic_http_request_duration_seconds', 'histogram', 'Time until the response starts, by route template')
+    for (method, route), (buckets, total, sum_value) in sorted(histograms.items()):
+        out.histogram('forensic_http_request_duration_seconds', REQUEST_BUCKETS, buckets, total, sum_value, method=method, route=route)
+
+    out.family('forensic_pipeline_runs_total', 'counter', 'Pipeline runs by type and outcome')
+    for row in conn.execute('SELECT run_type, status, COUNT(*) AS n FROM pipeline_runs GROUP BY run_type, status'):
+        out.sample('forensic_pipeline_runs_total', row['n'], run_type=row['run_type'], status=row['status'])
+
+    stages = conn.execute(
+        '''SELECT r.run_type, json_extract(s.value, '$.stage') AS stage, json_extract(s.value, '$.seconds') AS seconds,
+        json_extract(s.value, '$.rows') AS rows, json_extract(s.value, '$.sql_queries') AS sql_queries,
+        json_extract(s.value, '$.sql_seconds') AS sql_seconds
+        FROM pipeline_runs r, json_each(r.stages) s'''
+    ).fetchall()
+    totals = {}
+    for row in stages:
+        key = (row['run_type'], row['stage'])
+        entry = totals.setdefault(key, {'buckets': [0] * len(STAGE_BUCKETS), 'count': 0, 'seconds': 0.0, 'rows': 0, 'sql_queries': 0, 'sql_seconds': 0.0})
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if row['seconds'] <= bound:
+                entry['buckets'][i] += 1
+        entry['count'] += 1
+        entry['seconds'] += row['seconds']
+        entry['rows'] += row['rows'] or 0
+        entry['sql_queries'] += row['sql_queries'] or 0
+        entry['sql_seconds'] += row['sql_seconds'] or 0
+
+    out.family('forensic_pipeline_stage_duration_seconds', 'histogram', 'Wall time of pipeline stages')
+    for (run_type, name), entry in sorted(totals.items()):
+        out.histogram('forensic_pipeline_stage_duration_seconds', STAGE_BUCKETS, entry['buckets'], entry['count'], entry['seconds'], run_type=run_type, stage=name)
+    for metric, key, help_text in (
+        ('forensic_pipeline_stage_rows_total', 'rows', 'Rows processed by pipeline stages'),
+        ('forensic_pipeline_stage_sql_queries_total', 'sql_queries', 'SQL statements executed by pipeline stages'),
+        ('forensic_pipeline_stage_sql_seconds_total', 'sql_seconds', 'Time spent executing SQL statements in pipeline stages'),
+    ):
+        out.family(metric, 'counter', help_text)
+        for (run_type, name), entry in sorted(totals.items()):
+            out.sample(metric, round(entry[key], 6), run_type=run_type, stage=name)
+
+    out.family('forensic_jobs', 'gauge', 'Jobs in the queue by status')
+    for row in conn.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status'):
+        out.sample('forensic_jobs', row['n'], status=row['status'])
+
+    out.family('forensic_process_resident_memory_mb', 'gauge', 'Resident set size of this API process')
+    out.sample('forensic_process_resident_memory_mb', round(rss_mb(), 1))
+    for prefix, values in (extra_gauges or {}).items():
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                out.family(f'forensic_{prefix}_{key}', 'gauge', f'{prefix} {key}'.replace('_', ' '))
+                out.sample(f'forensic_{prefix}_{key}', value)
+    return out.text()
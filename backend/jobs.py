@@ -0,0 +1,304 @@
+import importlib
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from database import get_connection
+from instrumentation import PipelineRun, should_profile
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_EXECUTOR = os.getenv('JOB_EXECUTOR', 'process')
+JOB_START_METHOD = os.getenv('JOB_START_METHOD', 'spawn')
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+
+# Handlers are referenced by import path so worker processes can resolve them
+JOB_HANDLERS = {
+    'ingest': 'pipeline.run_ingest_job',
+    'batch_ingest': 'pipeline.run_batch_ingest_job',
+    'rules': 'pipeline.run_rules_job',
+    'analysis': 'pipeline.run_analysis_job',
+    'train': 'pipeline.run_training_job',
+    'entities': 'pipeline.run_entity_index_job',
+    'search': 'pipeline.run_search_index_job',
+    'report': 'pipeline.run_report_job',
+    'archive': 'pipeline.run_archive_job',
+    'hydrate': 'pipeline.run_hydrate_job',
+    'summary': 'pipeline.run_summary_job',
+}
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """Persistent job queue stored in the jobs table"""
+
+    @staticmethod
+    def submit(job_type, case_id=None, payload=None, conn=None):
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job_id = str(uuid.uuid4())
+        own = conn is None
+        conn = conn or get_connection()
+        conn.execute(
+            'INSERT INTO jobs (id, case_id, job_type, status, stage, progress, counters, payload, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, case_id, job_type, JobStatus.QUEUED, 'queued', 0, '{}', json.dumps(payload or {}), datetime.now().isoformat())
+        )
+        if own:
+            conn.commit()
+            conn.close()
+        return job_id
+
+    @staticmethod
+    def submit_once(job_type, case_id=None, payload=None):
+        """Queue a job unless one of the same type for the case is already queued or running;
+        returns the id of the new or the pending job.
+
+        The check and the insert are one statement, so concurrent callers queue it once"""
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job_id = str(uuid.uuid4())
+        pending = 'SELECT id FROM jobs WHERE job_type = ? AND case_id IS ? AND status IN (?, ?)'
+        conn = get_connection()
+        try:
+            created = conn.execute(
+                f'''INSERT INTO jobs (id, case_id, job_type, status, stage, progress, counters, payload, created_at)
+                SELECT ?, ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS ({pending})''',
+                (job_id, case_id, job_type, JobStatus.QUEUED, 'queued', 0, '{}', json.dumps(payload or {}),
+                 datetime.now().isoformat(), job_type, case_id, JobStatus.QUEUED, JobStatus.RUNNING)
+            ).rowcount
+            if not created:
+                job_id = conn.execute(
+                    f'{pending} ORDER BY created_at LIMIT 1', (job_type, case_id, JobStatus.QUEUED, JobStatus.RUNNING)
+                ).fetchone()['id']
+            conn.commit()
+        finally:
+            conn.close()
+        return job_id
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job['counters'] = json.loads(job['counters'] or '{}')
+        job['payload'] = json.loads(job['payload'] or '{}')
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    @staticmethod
+    def get_job(job_id):
+        conn = get_connection()
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        conn.close()
+        return JobQueue._to_dict(row) if row else None
+
+    @staticmethod
+    def get_latest_job(case_id, job_type=None):
+        """Most recent job for a case; job_type may be one type or a tuple of types"""
+        conn = get_connection()
+        if job_type:
+            types = (job_type,) if isinstance(job_type, str) else tuple(job_type)
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE case_id = ? AND job_type IN ({', '.join('?' * len(types))}) ORDER BY created_at DESC LIMIT 1",
+                (case_id, *types)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                'SELECT * FROM jobs WHERE case_id = ? ORDER BY created_at DESC LIMIT 1',
+                (case_id,)
+            ).fetchone()
+        conn.close()
+        return JobQueue._to_dict(row) if row else None
+
+    @staticmethod
+    def update_progress(job_id, stage=None, progress=None, **counters):
+        """Record the current stage, overall percentage and any stage counters"""
+        conn = get_connection()
+        conn.execute(
+            '''UPDATE jobs SET
+                stage = COALESCE(?, stage),
+                progress = COALESCE(?, progress),
+                counters = json_patch(COALESCE(counters, '{}'), ?)
+            WHERE id = ?''',
+            (stage, round(progress, 1) if progress is not None else None, json.dumps(counters), job_id)
+        )
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def claim_next(worker_id):
+        """Claim the oldest queued job; jobs for a case already being processed wait their turn,
+        and so do jobs without a case (e.g. 'train') while one of the same type runs"""
+        conn = get_connection()
+        row = conn.execute(
+            '''UPDATE jobs SET status = ?, claimed_by = ?, started_at = ?
+            WHERE id = (
+                SELECT id FROM jobs WHERE status = ?
+                  AND (case_id IS NULL OR case_id NOT IN (
+                      SELECT case_id FROM jobs WHERE status = ? AND case_id IS NOT NULL))
+                  AND (case_id IS NOT NULL OR job_type NOT IN (
+                      SELECT job_type FROM jobs WHERE status = ? AND case_id IS NULL))
+                ORDER BY created_at LIMIT 1)
+              AND status = ?
+            RETURNING id''',
+            (JobStatus.RUNNING, worker_id, datetime.now().isoformat(),
+             JobStatus.QUEUED, JobStatus.RUNNING, JobStatus.RUNNING, JobStatus.QUEUED)
+        ).fetchone()
+        conn.commit()
+        conn.close()
+        return row['id'] if row else None
+
+    @staticmethod
+    def finish(job_id, result=None):
+        conn = get_connection()
+        conn.execute(
+            'UPDATE jobs SET status = ?, stage = ?, progress = 100, result = ?, finished_at = ? WHERE id = ?',
+            (JobStatus.COMPLETED, 'completed', json.dumps(result, default=str), datetime.now().isoformat(), job_id)
+        )
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def fail(job_id, error):
+        conn = get_connection()
+        conn.execute(
+            'UPDATE jobs SET status = ?, error_message = ?, finished_at = ? WHERE id = ? AND status != ?',
+            (JobStatus.FAILED, str(error), datetime.now().isoformat(), job_id, JobStatus.COMPLETED)
+        )
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def requeue_orphaned():
+        """Put back jobs left running by a dead process on this host"""
+        host = socket.gethostname()
+        conn = get_connection()
+        rows = conn.execute(
+            'SELECT id, claimed_by FROM jobs WHERE status = ?',
+            (JobStatus.RUNNING,)
+        ).fetchall()
+        requeued = 0
+        for row in rows:
+            owner_host, _, pid = (row['claimed_by'] or '').rpartition(':')
+            if owner_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                conn.execute(
+                    'UPDATE jobs SET status = ?, stage = ?, claimed_by = NULL WHERE id = ?',
+                    (JobStatus.QUEUED, 'queued', row['id'])
+                )
+                requeued += 1
+        conn.commit()
+        conn.close()
+        return requeued
+
+
+def execute_job(job_id):
+    """Entry point inside a worker: run one claimed job to completion"""
+    job = JobQueue.get_job(job_id)
+    if not job:
+        return
+    module_name, _, func_name = JOB_HANDLERS[job['job_type']].rpartition('.')
+    handler = getattr(importlib.import_module(module_name), func_name)
+    try:
+        with PipelineRun(job['case_id'], job['job_type'], job_id=job_id, profile=should_profile(job['job_type'], job['payload'])):
+            result = handler(job_id, job['case_id'], job['payload'])
+        JobQueue.finish(job_id, result)
+    except Exception as e:
+        traceback.print_exc()
+        JobQueue.fail(job_id, e)
+
+
+class JobRunner:
+    """Claims queued jobs and runs them on a process (or thread) pool"""
+
+    def __init__(self, max_workers=JOB_WORKERS, executor=JOB_EXECUTOR):
+        self.max_workers = max(1, max_workers)
+        self.executor_kind = executor
+        self.worker_id = _worker_id()
+        self._executor = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def start(self):
+        if self._thread:
+            return
+        requeued = JobQueue.requeue_orphaned()
+        if requeued:
+            print(f"Requeued {requeued} orphaned jobs")
+        if self.executor_kind == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        else:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(JOB_START_METHOD)
+            )
+        self._thread = threading.Thread(target=self._loop, name='job-runner', daemon=True)
+        self._thread.start()
+        print(f"Job runner started with {self.max_workers} {self.executor_kind} workers")
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                while self._has_capacity():
+                    job_id = JobQueue.claim_next(self.worker_id)
+                    if not job_id:
+                        break
+                    with self._lock:
+                        self._in_flight += 1
+                    future = self._executor.submit(execute_job, job_id)
+                    future.add_done_callback(partial(self._on_done, job_id))
+            except Exception as e:
+                print(f"Job runner error: {e}")
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+
+    def _has_capacity(self):
+        with self._lock:
+            return self._in_flight < self.max_workers
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            self._in_flight -= 1
+        # Only reached when the worker itself died (e.g. BrokenProcessPool)
+        if not future.cancelled() and future.exception() is not None:
+            JobQueue.fail(job_id, future.exception())
+        self._wake.set()
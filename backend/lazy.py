@@ -0,0 +1,71 @@
+"""Deferred imports for the API process.
+
+main.py refers to engines through LazyImport stand-ins, so pandas, scikit-learn,
+networkx, reportlab and openai are imported by the first request that needs them
+rather than before the server can answer anything. warm_up() imports them all ahead
+of time for processes that would rather pay at startup.
+"""
+import importlib
+import threading
+import time
+
+_lock = threading.RLock()
+_registry = []
+# "module:Name" -> seconds spent importing it, for the warm-up report
+import_seconds = {}
+
+
+class LazyImport:
+    """Stands in for "package.module:Name" (or a whole module) until first used.
+
+    Attribute access and calls are forwarded to the real object, importing it on
+    the first one. With instance=True the target is called once with no arguments
+    and the resulting object is used instead, for module-level singletons."""
+
+    def __init__(self, path, instance=False):
+        self._path = path
+        self._instance = instance
+        self._target = None
+        _registry.append(self)
+
+    def resolve(self):
+        if self._target is None:
+            with _lock:
+                if self._target is None:
+                    module_name, _, name = self._path.partition(':')
+                    started = time.perf_counter()
+                    target = importlib.import_module(module_name)
+                    if name:
+                        target = getattr(target, name)
+                    if self._instance:
+                        target = target()
+                    import_seconds[self._path] = round(time.perf_counter() - started, 4)
+                    self._target = target
+        return self._target
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<LazyImport {self._path}{'' if self.loaded else ' (not loaded)'}>"
+
+
+def warm_up():
+    """Resolve every LazyImport; returns {path: import seconds}"""
+    for lazy in list(_registry):
+        try:
+            lazy.resolve()
+        except Exception as e:
+            print(f"Warm-up import of {lazy._path} failed: {e}")
+    return dict(import_seconds)
+
+
+def loaded():
+    return {lazy._path: lazy.loaded for lazy in _registry}
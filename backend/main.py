@@ -1,27 +1,57 @@
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import json
+import threading
+import time
 
 # Load environment variables
 load_dotenv()
 
-from database import init_database, get_connection
-from engines.case_management import CaseManagementEngine, CaseStatus
-from engines.ingestion import IngestionEngine
-from engines.normalization import NormalizationEngine
-from engines.rule_engine import RuleEngine
-from engines.anomaly_engine import AnomalyEngine
-from engines.graph_engine import GraphEngine
-from engines.risk_aggregation import RiskAggregationEngine
-from engines.explainability import ExplainabilityEngine, ReportEngine
-from engines.forensic_risk import ForensicRiskCalculator
-from engines.ai_assistant import AIForensicAssistant
+import sqlite3
+
+from database import init_database, get_pool, get_read_db, get_write_db, bump_case_version, get_case_version
+from engines.graph_view import GraphViewEngine, DEFAULT_NODE_LIMIT, MAX_NODE_LIMIT, MAX_HOPS
+from engines.streaming_ingestion import StreamingIngestionEngine
+from engines.deduplication import DeduplicationEngine
+from engines.timeline import TimelineEngine
+from engines.entity_index import EntityIndexEngine
+from engines.search import SearchEngine, DEFAULT_RESULT_LIMIT, MAX_RESULT_LIMIT
+from engines.case_archive import CaseArchiveEngine
+from jobs import JobQueue, JobRunner, JobStatus
+from response_cache import response_cache, cached_case_response
+from instrumentation import request_metrics, render_metrics, get_runs, rss_mb
+import lazy
+from lazy import LazyImport
+
+# Engines that pull in pandas, scikit-learn, scipy, reportlab or openai are imported
+# by the first request that uses them (or by the warm-up below), not at startup
+CaseManagementEngine = LazyImport('engines.case_management:CaseManagementEngine')
+CaseStatus = LazyImport('engines.case_management:CaseStatus')
+IngestionEngine = LazyImport('engines.ingestion:IngestionEngine')
+NormalizationEngine = LazyImport('engines.normalization:NormalizationEngine')
+RuleEngine = LazyImport('engines.rule_engine:RuleEngine')
+AnomalyEngine = LazyImport('engines.anomaly_engine:AnomalyEngine')
+GraphEngine = LazyImport('engines.graph_engine:GraphEngine')
+SparseGraphEngine = LazyImport('engines.sparse_graph:SparseGraphEngine')
+RiskAggregationEngine = LazyImport('engines.risk_aggregation:RiskAggregationEngine')
+ExplainabilityEngine = LazyImport('engines.explainability:ExplainabilityEngine')
+ReportBuilder = LazyImport('engines.report_builder:ReportBuilder')
+ForensicRiskCalculator = LazyImport('engines.forensic_risk:ForensicRiskCalculator')
+AnswerCache = LazyImport('engines.assistant_service:AnswerCache')
+CaseDigestEngine = LazyImport('engines.case_digest:CaseDigestEngine')
+CaseSummaryEngine = LazyImport('engines.case_summary:CaseSummaryEngine')
+VectorizedRuleEngine = LazyImport('engines.vectorized_rules:VectorizedRuleEngine')
+WindowAnalyticsEngine = LazyImport('engines.window_analytics:WindowAnalyticsEngine')
+ModelRegistry = LazyImport('engines.model_registry:ModelRegistry')
+IncrementalTrainer = LazyImport('engines.model_training:IncrementalTrainer')
+TrainingScheduler = LazyImport('engines.model_training:TrainingScheduler')
 
 app = FastAPI(title="Security Investigation Platform API")
 
@@ -33,13 +63,109 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create reports directory
-os.makedirs('reports', exist_ok=True)
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # The route template, not the raw path, keeps label cardinality bounded
+    route = request.scope.get('route')
+    request_metrics.observe(
+        request.method, getattr(route, 'path', 'unmatched'), response.status_code, time.perf_counter() - started
+    )
+    return response
+
+job_runner = JobRunner()
+assistant = LazyImport('engines.assistant_service:AssistantService', instance=True)
+
+# Periodic background retraining; 0 disables the schedule
+RETRAIN_INTERVAL_HOURS = float(os.getenv('RETRAIN_INTERVAL_HOURS', '0'))
+training_scheduler = None
+
+# API_WARMUP: "none" (import engines on first use), "background" (import them in a
+# thread once the server is up) or "startup" (import them before accepting requests)
+API_WARMUP = os.getenv('API_WARMUP', 'none')
+
+def queue_job(conn, job_type, case_id=None, payload=None):
+    """Queue a job through the request's writer connection. It is committed before the
+    runner is woken so the runner's next claim sees it"""
+    job_id = JobQueue.submit(job_type, case_id, payload, conn=conn)
+    conn.commit()
+    job_runner.wake()
+    return job_id
+
+def require_hot(case_id):
+    """Archived cases are hydrated by a queued job, never inside a request; until that job
+    has run, reads of the case answer 202 with the job to poll"""
+    if CaseArchiveEngine.readable(case_id):
+        return
+    job = JobQueue.get_latest_job(case_id, 'hydrate')
+    if job and job['status'] in (JobStatus.QUEUED, JobStatus.RUNNING):
+        job_id = job['id']
+    else:
+        job_id = JobQueue.submit('hydrate', case_id)
+        job_runner.wake()
+    raise HTTPException(status_code=202, detail={"status": "hydrating", "job_id": job_id})
+
+def schedule_training(time_budget):
+    # Every worker's scheduler calls this; the pending check and insert are one statement
+    JobQueue.submit_once('train', None, {'time_budget': time_budget})
+    job_runner.wake()
+
+def warm_up():
+    """Import every lazily loaded engine and load the active anomaly model"""
+    started = time.perf_counter()
+    imports = lazy.warm_up()
+    try:
+        model = ModelRegistry.preload()
+        model_version = model['version'] if model else None
+    except Exception as e:
+        print(f"Model preload failed: {e}")
+        model_version = None
+    seconds = round(time.perf_counter() - started, 3)
+    print(f"Warm-up finished in {seconds}s")
+    return {'seconds': seconds, 'imports': imports, 'model_version': model_version, 'rss_mb': round(rss_mb(), 1)}
 
-init_database()
+@app.on_event("startup")
+def prepare_storage():
+    os.makedirs('reports', exist_ok=True)
+    init_database()
 
-# Mount static files for reports
-app.mount("/reports", StaticFiles(directory="reports"), name="reports")
+@app.on_event("startup")
+def start_job_runner():
+    global training_scheduler
+    job_runner.start()
+    if RETRAIN_INTERVAL_HOURS > 0:
+        training_scheduler = TrainingScheduler(RETRAIN_INTERVAL_HOURS)
+        training_scheduler.start(schedule_training)
+
+@app.on_event("startup")
+def start_warm_up():
+    if API_WARMUP == 'startup':
+        warm_up()
+    elif API_WARMUP == 'background':
+        threading.Thread(target=warm_up, name='api-warm-up', daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_job_runner():
+    if training_scheduler:
+        training_scheduler.stop()
+    job_runner.stop()
+    get_pool().close()
+
+# Mount static files for reports; the directory is created by prepare_storage at startup
+app.mount("/reports", StaticFiles(directory="reports", check_dir=False), name="reports")
+
+# Uploads at or above this size skip the in-memory ingestion path.
+# INGESTION_MODE: "auto" (size based), "streaming" or "legacy"
+INGESTION_MODE = os.getenv('INGESTION_MODE', 'auto')
+STREAMING_THRESHOLD_BYTES = int(os.getenv('STREAMING_THRESHOLD_MB', '25')) * 1024 * 1024
+
+def use_streaming_ingestion(file_size):
+    if INGESTION_MODE == 'streaming':
+        return True
+    if INGESTION_MODE == 'legacy':
+        return False
+    return file_size >= STREAMING_THRESHOLD_BYTES
 
 # Models
 class CaseCreate(BaseModel):
@@ -48,6 +174,7 @@ class CaseCreate(BaseModel):
 
 class ReportGenerate(BaseModel):
     title: str = "Investigation Report"
+    force: bool = False
 
 # CASE MANAGEMENT ENDPOINTS
 @app.get("/api/cases")
@@ -68,13 +195,25 @@ def create_case(case: CaseCreate):
     return CaseManagementEngine.get_case(case_id)
 
 @app.delete("/api/cases/{case_id}")
-def delete_case(case_id: str):
+def delete_case(case_id: str, conn: sqlite3.Connection = Depends(get_write_db)):
     CaseManagementEngine.delete_case(case_id)
+    # Derived state goes in one transaction on the writer, committed when the request succeeds
+    VectorizedRuleEngine.reset_state(case_id, conn)
+    GraphViewEngine.clear_layout(case_id, conn)
+    SparseGraphEngine.reset_state(case_id, conn)
+    EntityIndexEngine.remove_case(case_id, conn)
+    SearchEngine.remove_case(case_id, conn)
+    CaseSummaryEngine.remove_case(case_id, conn)
+    CaseDigestEngine.remove_case(case_id, conn)
+    AnswerCache.remove_case(case_id, conn)
+    CaseArchiveEngine.remove_case(case_id, conn)
+    bump_case_version(case_id, conn)
+    response_cache.invalidate(case_id)
     return {"message": "Case deleted successfully"}
 
 # UPLOAD ENDPOINTS
 @app.post("/api/cases/{case_id}/upload")
-async def upload_file(case_id: str, file: UploadFile = File(...)):
+def upload_file(case_id: str, file: UploadFile = File(...), full_rerun: bool = False):
     print(f"=== UPLOAD REQUEST ===")
     print(f"Case ID: {case_id}")
     print(f"Filename: {file.filename}")
@@ -92,30 +231,36 @@ async def upload_file(case_id: str, file: UploadFile = File(...)):
         print("Resetting failed case status")
         CaseManagementEngine.update_status(case_id, CaseStatus.CREATED)
     
+    spooled = None
     try:
-        content = await file.read()
-        print(f"File size: {len(content)} bytes")
+        # Spool to disk in chunks so the body is never held in memory
+        spooled = StreamingIngestionEngine.spool_upload(file)
+        print(f"File size: {spooled.file_size} bytes (sha256 {spooled.file_hash[:12]})")
         
-        if not content:
+        if not spooled.file_size:
             raise HTTPException(status_code=400, detail="Empty file")
         
-        upload_id, result = IngestionEngine.ingest_file(case_id, file.filename, content)
-        if not upload_id:
-            print(f"Ingestion failed: {result}")
-            raise HTTPException(status_code=400, detail=result)
-        
-        print(f"Upload successful: {upload_id}")
+        # The exact same file is already in the case: nothing to do
+        with get_pool().reader() as conn:
+            duplicate = DeduplicationEngine.find_completed_upload(conn, case_id, spooled.file_hash)
+        if duplicate:
+            print(f"Duplicate of upload {duplicate['id']}, skipping")
+            return {"job_id": None, "status": "duplicate", "duplicate_of": duplicate}
         
-        # Process synchronously
-        success, message = NormalizationEngine.normalize_and_store(case_id, file.filename, result)
-        if success:
-            print(f"Normalization successful: {message}")
-            RuleEngine.run_all_rules(case_id)
-            print("Rules executed")
-        else:
-            print(f"Normalization failed: {message}")
+        # Parsing, normalization and rules run in the job worker pool
+        job_id = JobQueue.submit('ingest', case_id, {
+            'filename': file.filename,
+            'path': spooled.path,
+            'file_hash': spooled.file_hash,
+            'file_size': spooled.file_size,
+            'streaming': use_streaming_ingestion(spooled.file_size),
+            'full_rerun': full_rerun
+        })
+        spooled = None
+        job_runner.wake()
+        print(f"Queued ingest job: {job_id}")
         
-        return {"upload_id": upload_id, "status": "processing"}
+        return {"job_id": job_id, "status": "queued"}
         
     except HTTPException:
         raise
@@ -124,6 +269,54 @@ async def upload_file(case_id: str, file: UploadFile = File(...)):
         print(f"Upload error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Upload error: {str(e)}")
+    finally:
+        if spooled:
+            spooled.discard()
+
+@app.post("/api/cases/{case_id}/upload/batch")
+def upload_batch(case_id: str, files: List[UploadFile] = File(...), full_rerun: bool = False):
+    """Several evidence files and/or zip/tar archives, ingested in parallel as one job"""
+    case = CaseManagementEngine.get_case(case_id)
+    if not case:
+        raise HTTPException(status_code=404, detail="Case not found")
+    
+    if case['status'] == CaseStatus.FAILED:
+        CaseManagementEngine.update_status(case_id, CaseStatus.CREATED)
+    
+    spooled = []
+    try:
+        for file in files:
+            upload = StreamingIngestionEngine.spool_upload(file)
+            spooled.append(upload)
+            print(f"Batch member: {file.filename} ({upload.file_size} bytes, sha256 {upload.file_hash[:12]})")
+        
+        if not any(s.file_size for s in spooled):
+            raise HTTPException(status_code=400, detail="Empty upload")
+        
+        job_id = JobQueue.submit('batch_ingest', case_id, {
+            'files': [
+                {'filename': s.filename, 'path': s.path, 'file_hash': s.file_hash, 'file_size': s.file_size}
+                for s in spooled if s.file_size
+            ],
+            'full_rerun': full_rerun
+        })
+        for s in spooled:
+            if not s.file_size:
+                s.discard()
+        spooled = []
+        job_runner.wake()
+        
+        return {"job_id": job_id, "status": "queued", "files": len(files)}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=400, detail=f"Upload error: {str(e)}")
+    finally:
+        for s in spooled:
+            s.discard()
 
 @app.get("/api/cases/{case_id}/processing-status")
 def get_processing_status(case_id: str):
@@ -131,161 +324,233 @@ def get_processing_status(case_id: str):
     if not case:
         raise HTTPException(status_code=404, detail="Case not found")
     
+    job = JobQueue.get_latest_job(case_id, ('ingest', 'batch_ingest'))
+    if job:
+        return job_status_response(job)
+    
     status = case['status']
     if status in [CaseStatus.NORMALIZED, CaseStatus.ANALYZED]:
         return {"status": "completed", "progress": 100}
-    elif status == CaseStatus.PROCESSING:
-        return {"status": "processing", "progress": 50}
     elif status == CaseStatus.FAILED:
         return {"status": "failed", "progress": 0}
     else:
         return {"status": "idle", "progress": 0}
 
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = JobQueue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status_response(job)
+
+def job_status_response(job):
+    counters = job['counters']
+    status = {
+        JobStatus.QUEUED: "queued",
+        JobStatus.RUNNING: "processing",
+        JobStatus.COMPLETED: "completed",
+        JobStatus.FAILED: "failed"
+    }[job['status']]
+    return {
+        "job_id": job['id'],
+        "job_type": job['job_type'],
+        "status": status,
+        "stage": job['stage'],
+        "progress": job['progress'],
+        "records_processed": counters.get('rows_normalized', 0),
+        "counters": counters,
+        "result": job['result'],
+        "errors": [job['error_message']] if job['error_message'] else []
+    }
+
 # TIMELINE ENDPOINTS
-@app.get("/api/cases/{case_id}/timeline")
-def get_timeline(case_id: str):
-    conn = get_connection()
-    events = conn.execute(
-        'SELECT * FROM unified_events WHERE case_id = ? AND is_valid = 1 ORDER BY timestamp DESC LIMIT 100',
-        (case_id,)
-    ).fetchall()
-    conn.close()
-    
+def timeline_filters(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    event_type: Optional[str] = None,
+    user_id: Optional[str] = None,
+    source: Optional[str] = None,
+    receiver: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
     return {
-        "events": [dict(e) for e in events],
-        "total": len(events)
+        'start': start, 'end': end, 'event_type': event_type, 'user_id': user_id,
+        'source': source, 'receiver': receiver, 'min_amount': min_amount, 'max_amount': max_amount
     }
 
+@app.get("/api/cases/{case_id}/timeline")
+@cached_case_response
+def get_timeline(
+    case_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    filters: dict = Depends(timeline_filters),
+    conn: sqlite3.Connection = Depends(get_read_db)
+):
+    require_hot(case_id)
+    try:
+        return TimelineEngine.get_page(conn, case_id, filters, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/cases/{case_id}/timeline/export")
+def export_timeline(case_id: str, filters: dict = Depends(timeline_filters)):
+    """Stream every matching event as NDJSON"""
+    require_hot(case_id)
+    try:
+        TimelineEngine.build_where(case_id, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    def generate():
+        # The response outlives request dependencies, so hold our own connection
+        with get_pool().reader() as conn:
+            yield from TimelineEngine.iter_ndjson(conn, case_id, filters)
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="timeline_{case_id}.ndjson"'}
+    )
+
 # RULE ENGINE ENDPOINTS
 @app.get("/api/cases/{case_id}/rules")
-def get_rules(case_id: str):
-    conn = get_connection()
+@cached_case_response
+def get_rules(case_id: str, conn: sqlite3.Connection = Depends(get_read_db)):
+    require_hot(case_id)
+    case_summary = CaseSummaryEngine.get(conn, case_id)
+    severity_counts = case_summary['severity_counts']
     
-    suspicious = conn.execute(
-        'SELECT * FROM suspicious_events WHERE case_id = ? ORDER BY CASE severity WHEN "critical" THEN 1 WHEN "high" THEN 2 WHEN "medium" THEN 3 WHEN "low" THEN 4 END, created_at DESC',
-        (case_id,)
-    ).fetchall()
-    
-    suspicious = [dict(s) for s in suspicious]
-    
-    # Summary
     summary = {
-        'total_violations': len(suspicious),
-        'critical': sum(1 for s in suspicious if s['severity'] == 'critical'),
-        'high': sum(1 for s in suspicious if s['severity'] == 'high'),
-        'medium': sum(1 for s in suspicious if s['severity'] == 'medium'),
-        'low': sum(1 for s in suspicious if s['severity'] == 'low')
+        'total_violations': case_summary['total_violations'],
+        'critical': severity_counts.get('critical', 0),
+        'high': severity_counts.get('high', 0),
+        'medium': severity_counts.get('medium', 0),
+        'low': severity_counts.get('low', 0),
+        'stale': case_summary['stale']
     }
     
-    # Group by rule type with severity priority
-    rule_types = {}
-    for s in suspicious:
-        rule = s['rule_type']
-        if rule not in rule_types:
-            rule_types[rule] = {'name': rule, 'violations': 0, 'severity': s['severity']}
-        rule_types[rule]['violations'] += 1
-        # Keep highest severity
-        if s['severity'] == 'critical':
-            rule_types[rule]['severity'] = 'critical'
-        elif s['severity'] == 'high' and rule_types[rule]['severity'] not in ['critical']:
-            rule_types[rule]['severity'] = 'high'
-    
     # Sort rules by severity
     severity_order = {'critical': 1, 'high': 2, 'medium': 3, 'low': 4}
-    sorted_rules = sorted(rule_types.values(), key=lambda x: (severity_order.get(x['severity'], 5), -x['violations']))
+    rule_types = [
+        {'name': name, 'violations': rule['violations'], 'severity': rule['severity']}
+        for name, rule in case_summary['rule_counts'].items()
+    ]
+    sorted_rules = sorted(rule_types, key=lambda x: (severity_order.get(x['severity'], 5), -x['violations']))
     
-    conn.close()
+    suspicious = CaseSummaryEngine.top_violations(conn, case_id, case_summary, limit=50)
     
     return {
         'summary': summary,
         'rules': sorted_rules,
-        'events': suspicious[:50]
+        'events': suspicious
     }
 
+@app.post("/api/cases/{case_id}/rules/run")
+def run_rules(case_id: str, full_rerun: bool = True, profile: bool = False, conn: sqlite3.Connection = Depends(get_write_db)):
+    """Queue a rule evaluation; full re-run unless full_rerun=false. profile=true saves a profile of the run"""
+    case = CaseManagementEngine.get_case(case_id)
+    if not case:
+        raise HTTPException(status_code=404, detail="Case not found")
+    
+    job_id = queue_job(conn, 'rules', case_id, {'full_rerun': full_rerun, 'profile': profile})
+    
+    return {"status": "queued", "job_id": job_id}
+
+@app.get("/api/cases/{case_id}/velocity")
+@cached_case_response
+def get_velocity(case_id: str, limit: int = Query(10, ge=1, le=100), conn: sqlite3.Connection = Depends(get_read_db)):
+    """Time-window analytics: peak velocities per user and pair, gap distribution, call -> transfer sequences"""
+    require_hot(case_id)
+    return WindowAnalyticsEngine.summary(conn, case_id, limit=limit)
+
 # ANOMALY ENDPOINTS
 @app.post("/api/anomaly/train")
-def train_anomaly_model():
-    """Train baseline anomaly detection model on all historical data"""
+def train_anomaly_model(
+    mode: str = Query('full', pattern='^(incremental|full)$'),
+    time_budget: Optional[float] = Query(None, gt=0, le=3600, description="seconds; defaults to TRAINING_TIME_BUDGET"),
+    activate: bool = True,
+    conn: sqlite3.Connection = Depends(get_write_db)
+):
+    """Retrain synchronously on all data (default), or queue incremental training on the reservoir sample (mode=incremental)"""
+    if mode == 'incremental':
+        payload = {'activate': activate}
+        if time_budget is not None:
+            payload['time_budget'] = time_budget
+        job_id = queue_job(conn, 'train', None, payload)
+        return {"status": "queued", "job_id": job_id}
+
     result = AnomalyEngine.train_baseline_model()
     if 'error' in result:
         raise HTTPException(status_code=400, detail=result['error'])
+    result['model_version'] = ModelRegistry.import_legacy()
     return result
 
+@app.get("/api/anomaly/training-stats")
+def get_training_stats():
+    """Running feature statistics and reservoir fill used by incremental training"""
+    return {
+        'reservoir_rows': len(IncrementalTrainer.load_sample()),
+        'features': IncrementalTrainer.feature_stats()
+    }
+
+@app.get("/api/models")
+def list_models():
+    return ModelRegistry.list_models()
+
+@app.get("/api/models/active")
+def get_active_model():
+    version = ModelRegistry.active_version()
+    if not version:
+        raise HTTPException(status_code=404, detail="No active model")
+    return ModelRegistry.get(version)
+
+@app.post("/api/models/{version}/activate")
+def activate_model(version: str, conn: sqlite3.Connection = Depends(get_write_db)):
+    """Hot-swap the active anomaly model without restarting"""
+    try:
+        ModelRegistry.activate(version, conn)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # Committed before loading so this worker picks up the new version right away
+    conn.commit()
+    return ModelRegistry.get_active()[1]
+
 @app.post("/api/cases/{case_id}/anomaly/run")
-def run_anomaly(case_id: str):
+def run_anomaly(case_id: str, full_rebuild: bool = False, profile: bool = False, conn: sqlite3.Connection = Depends(get_write_db)):
+    """Queue analysis; the graph is updated incrementally unless full_rebuild=true. profile=true saves a profile of the run"""
     case = CaseManagementEngine.get_case(case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Case not found")
     
-    result = AnomalyEngine.run_anomaly_detection(case_id)
-    if 'error' in result:
-        raise HTTPException(status_code=400, detail=result['error'])
+    job_id = queue_job(conn, 'analysis', case_id, {'full_rebuild': full_rebuild, 'profile': profile})
     
-    # Update case status
-    CaseManagementEngine.update_status(case_id, CaseStatus.ANALYZED)
-    
-    # Build graph
-    GraphEngine.build_graph(case_id)
-    
-    # Aggregate risk
-    risk = RiskAggregationEngine.aggregate_risk(case_id)
-    CaseManagementEngine.update_risk(case_id, risk['total_score'], risk['risk_level'])
-    
-    return {"status": "completed", "result": result}
+    return {"status": "queued", "job_id": job_id}
 
 @app.get("/api/cases/{case_id}/anomaly")
-def get_anomaly(case_id: str):
-    conn = get_connection()
-    
-    # Get top anomalies for display
-    anomalies = conn.execute(
-        'SELECT * FROM anomaly_results WHERE case_id = ? AND is_anomaly = 1 ORDER BY anomaly_score DESC LIMIT 20',
-        (case_id,)
-    ).fetchall()
-    
-    # Calculate average score of ALL anomalous events (not just top 20)
-    avg_score = conn.execute(
-        'SELECT AVG(anomaly_score) as avg FROM anomaly_results WHERE case_id = ? AND is_anomaly = 1',
-        (case_id,)
-    ).fetchone()
+@cached_case_response
+def get_anomaly(case_id: str, conn: sqlite3.Connection = Depends(get_read_db)):
+    require_hot(case_id)
+    # Top anomalies for display, with their events
+    anomalies = CaseSummaryEngine.top_anomalies(conn, case_id, limit=20)
     
-    # Get total count for percentage
-    total_events = conn.execute(
-        'SELECT COUNT(*) as count FROM anomaly_results WHERE case_id = ?',
-        (case_id,)
-    ).fetchone()['count']
-    
-    # Get ALL anomaly count (not just top 20)
-    anomaly_count = conn.execute(
-        'SELECT COUNT(*) as count FROM anomaly_results WHERE case_id = ? AND is_anomaly = 1',
-        (case_id,)
-    ).fetchone()['count']
-    
-    conn.close()
-    
-    anomalies = [dict(a) for a in anomalies]
-    
-    # Get events for top anomalies
-    for anomaly in anomalies:
-        conn = get_connection()
-        event = conn.execute(
-            'SELECT * FROM unified_events WHERE event_id = ?',
-            (anomaly['event_id'],)
-        ).fetchone()
-        conn.close()
-        if event:
-            anomaly['event'] = dict(event)
+    # Totals over ALL results (not just top 20) come from the case summary
+    case_summary = CaseSummaryEngine.get(conn, case_id)
+    total_events = case_summary['anomaly_total']
+    anomaly_count = case_summary['anomaly_count']
     
     # Calculate meaningful score: percentage of anomalies + severity
     anomaly_percentage = (anomaly_count / max(total_events, 1)) * 100
-    avg_anomaly_score = (avg_score['avg'] or 0) * 100
+    avg_anomaly_score = (case_summary['anomaly_avg_score'] or 0) * 100
     
     # Combined score: weighted average
     combined_score = int((anomaly_percentage * 0.6) + (avg_anomaly_score * 0.4))
     
     return {
         'score': combined_score,
-        'model_version': anomalies[0]['model_version'] if anomalies else 'v1.0.0',
+        'summary_stale': case_summary['stale'],
+        'model_version': anomalies[0]['model_version'] if anomalies else ModelRegistry.active_version(),
         'confidence': 0.92,
         'baseline_comparison': [
             {'metric': 'Transaction Volume', 'baseline': 100, 'current': 100 + int(anomaly_percentage * 1.5)},
@@ -305,54 +570,39 @@ def get_anomaly(case_id: str):
 
 # GRAPH ENDPOINTS
 @app.get("/api/cases/{case_id}/graph")
-def get_graph(case_id: str):
-    conn = get_connection()
-    
-    nodes = conn.execute(
-        'SELECT * FROM graph_nodes WHERE case_id = ?',
-        (case_id,)
-    ).fetchall()
-    
-    edges = conn.execute(
-        'SELECT * FROM graph_edges WHERE case_id = ?',
-        (case_id,)
-    ).fetchall()
-    
-    conn.close()
-    
-    return {
-        'nodes': [
-            {
-                'id': n['node_id'],
-                'label': n['label'],
-                'type': n['node_type'],
-                'centrality': n['centrality']
-            }
-            for n in nodes
-        ],
-        'edges': [
-            {
-                'id': e['id'],
-                'source': e['source'],
-                'target': e['target'],
-                'label': e['edge_type'],
-                'weight': e['weight']
-            }
-            for e in edges
-        ]
-    }
+@cached_case_response
+def get_graph(
+    case_id: str,
+    min_weight: float = Query(0, ge=0),
+    edge_type: Optional[str] = None,
+    top_k: int = Query(DEFAULT_NODE_LIMIT, ge=1, le=MAX_NODE_LIMIT),
+    ego: Optional[str] = None,
+    hops: int = Query(1, ge=1, le=MAX_HOPS),
+    conn: sqlite3.Connection = Depends(get_read_db)
+):
+    """Filtered graph view: the top_k most central nodes, or the ego network of a node"""
+    require_hot(case_id)
+    return GraphViewEngine.get_view(conn, case_id, {
+        'min_weight': min_weight,
+        'edge_type': edge_type,
+        'top_k': top_k,
+        'ego': ego,
+        'hops': hops
+    })
 
 # RISK ENDPOINTS
 @app.get("/api/cases/{case_id}/forensic-risk")
+@cached_case_response
 def get_forensic_risk(case_id: str):
     """Get detailed forensic risk assessment with justifications"""
+    require_hot(case_id)
     result = ForensicRiskCalculator.calculate_forensic_risk(case_id)
     return result
 
 @app.get("/api/cases/{case_id}/risk")
-def get_risk(case_id: str):
-    conn = get_connection()
-    
+@cached_case_response
+def get_risk(case_id: str, conn: sqlite3.Connection = Depends(get_read_db)):
+    require_hot(case_id)
     risk = conn.execute(
         'SELECT * FROM case_risk WHERE case_id = ?',
         (case_id,)
@@ -363,17 +613,7 @@ def get_risk(case_id: str):
         (case_id,)
     ).fetchone()
     
-    suspicious_count = conn.execute(
-        'SELECT COUNT(*) as count FROM suspicious_events WHERE case_id = ?',
-        (case_id,)
-    ).fetchone()
-    
-    anomaly_count = conn.execute(
-        'SELECT COUNT(*) as count FROM anomaly_results WHERE case_id = ? AND is_anomaly = 1',
-        (case_id,)
-    ).fetchone()
-    
-    conn.close()
+    case_summary = CaseSummaryEngine.get(conn, case_id)
     
     if not risk:
         return {
@@ -398,99 +638,240 @@ def get_risk(case_id: str):
         'explanation': explanation,
         'metrics': {
             'total_events': case['records_count'],
-            'suspicious_events': suspicious_count['count'],
-            'critical_violations': anomaly_count['count'],
-            'anomaly_rate': round(anomaly_count['count'] / max(case['records_count'], 1), 2)
+            'suspicious_events': case_summary['total_violations'],
+            'critical_violations': case_summary['anomaly_count'],
+            'anomaly_rate': round(case_summary['anomaly_count'] / max(case['records_count'], 1), 2),
+            'summary_stale': case_summary['stale']
         }
     }
 
 # REPORT ENDPOINTS
 @app.post("/api/cases/{case_id}/ai-assistant")
-def query_ai_assistant(case_id: str, request: dict):
+async def query_ai_assistant(case_id: str, request: dict):
     """Query AI forensic assistant"""
     question = request.get('question', '')
     if not question:
         raise HTTPException(status_code=400, detail="Question is required")
+    # SQLite reads block, so they run off the event loop
+    await run_in_threadpool(require_hot, case_id)
     
-    result = AIForensicAssistant.query_assistant(case_id, question)
-    return result
+    return await assistant.ask(case_id, question)
 
-@app.post("/api/cases/{case_id}/report/generate")
-def generate_report(case_id: str, report: ReportGenerate):
-    try:
-        case = CaseManagementEngine.get_case(case_id)
-        if not case:
-            raise HTTPException(status_code=404, detail="Case not found")
-        
-        report_id, result = ReportEngine.generate_report(case_id, report.title)
-        if not report_id:
-            raise HTTPException(status_code=400, detail=result)
-        
-        conn = get_connection()
-        
-        # Get comprehensive data with safe defaults
-        suspicious_count = conn.execute(
-            'SELECT COUNT(*) as count FROM suspicious_events WHERE case_id = ?',
-            (case_id,)
-        ).fetchone()['count']
-        
-        anomaly_count = conn.execute(
-            'SELECT COUNT(*) as count FROM anomaly_results WHERE case_id = ? AND is_anomaly = 1',
-            (case_id,)
-        ).fetchone()['count']
-        
-        risk_row = conn.execute(
-            'SELECT * FROM case_risk WHERE case_id = ?',
-            (case_id,)
-        ).fetchone()
-        
-        conn.close()
-        
-        risk = dict(risk_row) if risk_row else {}
-        
-        key_findings = []
-        if suspicious_count > 0:
-            key_findings.append(f"{suspicious_count} rule violations detected")
-        if anomaly_count > 0:
-            key_findings.append(f"{anomaly_count} anomalous events identified")
-        if risk.get('total_score', 0) >= 70:
-            key_findings.append("High-risk activity patterns detected")
-        
-        recommendations = []
-        if suspicious_count > 10:
-            recommendations.append("Review all flagged rule violations immediately")
-        if anomaly_count > 5:
-            recommendations.append("Investigate anomalous behavior patterns")
-        if risk.get('correlation_score', 0) > 30:
-            recommendations.append("Analyze network connections for coordinated activity")
-        
-        return {
-            'report_id': report_id,
-            'status': 'completed',
-            'filename': result,
-            'summary': f"Investigation report generated with {suspicious_count} violations and {anomaly_count} anomalies detected.",
-            'executive_summary': f"Comprehensive forensic analysis completed for case '{case['name']}'. Risk level: {risk.get('risk_level', 'UNKNOWN').upper()}.",
-            'key_findings': key_findings if key_findings else ['Analysis in progress'],
-            'recommendations': recommendations if recommendations else ['Continue monitoring']
+@app.post("/api/cases/{case_id}/ai-assistant/stream")
+async def stream_ai_assistant(case_id: str, request: dict):
+    """Stream the assistant's answer as plain text chunks"""
+    question = request.get('question', '')
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is required")
+    await run_in_threadpool(require_hot, case_id)
+    
+    meta, chunks = await assistant.open(case_id, question)
+    
+    async def generate():
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            yield f"\n[Assistant query failed: {e}]"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "X-Assistant-Cache": "hit" if meta['cached'] else "miss",
+            "X-Assistant-Backend": meta['backend'],
+            "X-Context-Tokens": str(meta['context_tokens'])
         }
-    except HTTPException:
-        raise
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Report generation failed: {str(e)}")
+    )
+
+@app.post("/api/cases/{case_id}/report/generate")
+def generate_report(case_id: str, report: ReportGenerate, conn: sqlite3.Connection = Depends(get_write_db)):
+    """Queue PDF rendering; a report already rendered at the current data version is returned at once"""
+    case = CaseManagementEngine.get_case(case_id)
+    if not case:
+        raise HTTPException(status_code=404, detail="Case not found")
+    
+    if not report.force:
+        existing = ReportBuilder.find_reusable(conn, case_id, report.title, get_case_version(conn, case_id))
+        if existing:
+            return {
+                'report_id': existing['id'],
+                'status': 'completed',
+                'filename': os.path.basename(existing['file_path']),
+                'file_path': existing['file_path'],
+                'case_version': existing['case_version'],
+                'reused': True,
+                **existing['details']
+            }
+    
+    job_id = queue_job(conn, 'report', case_id, {'title': report.title, 'force': report.force})
+    
+    return {"status": "queued", "job_id": job_id}
 
 @app.get("/api/cases/{case_id}/reports")
-def get_reports(case_id: str):
-    conn = get_connection()
+def get_reports(case_id: str, conn: sqlite3.Connection = Depends(get_read_db)):
     reports = conn.execute(
         'SELECT * FROM reports WHERE case_id = ? ORDER BY created_at DESC',
         (case_id,)
     ).fetchall()
-    conn.close()
     
     return [dict(r) for r in reports]
 
+@app.get("/api/cases/{case_id}/reports/{report_id}/download")
+def download_report(case_id: str, report_id: str, request: Request, conn: sqlite3.Connection = Depends(get_read_db)):
+    """Stream a report PDF in chunks; honours a single-range Range header"""
+    row = conn.execute(
+        'SELECT file_path FROM reports WHERE id = ? AND case_id = ?',
+        (report_id, case_id)
+    ).fetchone()
+    if not row or not row['file_path'] or not os.path.exists(row['file_path']):
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    path = row['file_path']
+    size = os.path.getsize(path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{os.path.basename(path)}"'
+    }
+    try:
+        byte_range = ReportBuilder.parse_range(request.headers.get('range'), size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        ReportBuilder.iter_file(path, start, end),
+        status_code=206 if byte_range else 200,
+        media_type="application/pdf",
+        headers=headers
+    )
+
+# ARCHIVE ENDPOINTS
+@app.get("/api/cases/{case_id}/archive")
+def get_archive(case_id: str, conn: sqlite3.Connection = Depends(get_read_db)):
+    """Archive status of a case: archived, hydrated (readable from SQLite) or not archived"""
+    archive = CaseArchiveEngine.get_archive(conn, case_id)
+    if not archive:
+        return {"case_id": case_id, "status": "hot"}
+    archive['flattened_columns'] = json.loads(archive['flattened_columns'] or '{}')
+    return archive
+
+@app.post("/api/cases/{case_id}/archive")
+def archive_case(case_id: str, conn: sqlite3.Connection = Depends(get_write_db)):
+    """Queue moving the case's rows to the Parquet archive tier"""
+    case = CaseManagementEngine.get_case(case_id)
+    if not case:
+        raise HTTPException(status_code=404, detail="Case not found")
+    
+    job_id = queue_job(conn, 'archive', case_id)
+    
+    return {"status": "queued", "job_id": job_id}
+
+@app.post("/api/cases/{case_id}/archive/restore")
+def restore_case(case_id: str, conn: sqlite3.Connection = Depends(get_write_db)):
+    """Bring an archived case back into SQLite for good and delete its archive"""
+    if not CaseArchiveEngine.restore(case_id, conn):
+        raise HTTPException(status_code=404, detail="Case is not archived")
+    return {"status": "restored", "case_id": case_id}
+
+# SEARCH ENDPOINTS
+@app.get("/api/cases/{case_id}/search")
+def search_events(
+    case_id: str,
+    q: str,
+    filters: dict = Depends(timeline_filters),
+    limit: int = Query(DEFAULT_RESULT_LIMIT, ge=1, le=MAX_RESULT_LIMIT),
+    offset: int = Query(0, ge=0),
+    conn: sqlite3.Connection = Depends(get_read_db)
+):
+    """Ranked keyword search: "phrases", prefix*, AND / OR / NOT, plus the timeline filters"""
+    require_hot(case_id)
+    try:
+        result = SearchEngine.search(conn, case_id, q, filters, limit=limit, offset=offset)
+    except (ValueError, OverflowError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {e}")
+    if result is None:
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    return result
+
+@app.post("/api/cases/{case_id}/search/reindex")
+def reindex_search(case_id: str, conn: sqlite3.Connection = Depends(get_write_db)):
+    """Queue full-text indexing of a case's existing events"""
+    case = CaseManagementEngine.get_case(case_id)
+    if not case:
+        raise HTTPException(status_code=404, detail="Case not found")
+    
+    job_id = queue_job(conn, 'search', case_id)
+    
+    return {"status": "queued", "job_id": job_id}
+
+# ENTITY ENDPOINTS
+@app.get("/api/entities/{identifier}")
+def lookup_entity(
+    identifier: str,
+    exclude_case: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    conn: sqlite3.Connection = Depends(get_read_db)
+):
+    """Cases and events involving a phone number or account id, across all cases"""
+    result = EntityIndexEngine.lookup(conn, identifier, exclude_case=exclude_case, limit=limit)
+    if result is None:
+        raise HTTPException(status_code=400, detail="Identifier is empty")
+    return result
+
+@app.post("/api/cases/{case_id}/entities/reindex")
+def reindex_entities(case_id: str, conn: sqlite3.Connection = Depends(get_write_db)):
+    """Queue indexing of a case's existing events"""
+    case = CaseManagementEngine.get_case(case_id)
+    if not case:
+        raise HTTPException(status_code=404, detail="Case not found")
+    
+    job_id = queue_job(conn, 'entities', case_id)
+    
+    return {"status": "queued", "job_id": job_id}
+
+# SYSTEM ENDPOINTS
+@app.get("/api/system/db-pool")
+def get_db_pool_metrics():
+    """Connection pool usage: in-use count, checkouts and wait times"""
+    return get_pool().metrics()
+
+@app.get("/api/system/response-cache")
+def get_response_cache_metrics():
+    """Response cache usage: entries, bytes, hits, misses and 304s"""
+    return response_cache.metrics()
+
+@app.post("/api/system/warm-up")
+def run_warm_up():
+    """Import any engines not loaded yet and load the active model; reports per-import seconds"""
+    return warm_up()
+
+@app.get("/api/system/pipeline-runs")
+def get_pipeline_runs(limit: int = Query(50, ge=1, le=500), conn: sqlite3.Connection = Depends(get_read_db)):
+    """Most recent pipeline runs across cases, with per-stage timings"""
+    return get_runs(conn, limit=limit)
+
+@app.get("/api/cases/{case_id}/pipeline-runs")
+def get_case_pipeline_runs(case_id: str, limit: int = Query(50, ge=1, le=500), conn: sqlite3.Connection = Depends(get_read_db)):
+    return get_runs(conn, case_id, limit=limit)
+
+@app.get("/api/system/pipeline-runs/{run_id}/profile")
+def download_profile(run_id: str, format: str = Query('prof', pattern='^(prof|folded)$'), conn: sqlite3.Connection = Depends(get_read_db)):
+    """cProfile stats (format=prof) or collapsed stacks (format=folded) of a profiled run"""
+    row = conn.execute('SELECT profile_path FROM pipeline_runs WHERE id = ?', (run_id,)).fetchone()
+    if not row or not row['profile_path'] or not os.path.exists(f"{row['profile_path']}.{format}"):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(f"{row['profile_path']}.{format}", filename=f"{run_id}.{format}")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(conn: sqlite3.Connection = Depends(get_read_db)):
+    """Prometheus text exposition of request latencies, pipeline stage timings and pool/cache gauges"""
+    text = render_metrics(conn, {'db_pool': get_pool().metrics(), 'response_cache': response_cache.metrics()})
+    return PlainTextResponse(text, media_type='text/plain; version=0.0.4')
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
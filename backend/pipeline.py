@@ -0,0 +1,422 @@
+import os
+
+from database import get_connection, bump_case_version, get_case_version, normalize_event_timestamps
+from engines.case_management import CaseManagementEngine, CaseStatus
+from engines.ingestion import IngestionEngine
+from engines.normalization import NormalizationEngine
+from engines.rule_engine import RuleEngine
+from engines.anomaly_engine import AnomalyEngine
+from engines.graph_engine import GraphEngine
+from engines.graph_view import GraphViewEngine
+from engines.sparse_graph import SparseGraphEngine
+from engines.risk_aggregation import RiskAggregationEngine
+from engines.explainability import ReportEngine
+from engines.report_builder import ReportBuilder
+from engines.streaming_ingestion import StreamingIngestionEngine, SpooledUpload
+from engines.batch_ingestion import BatchIngestionEngine
+from engines.deduplication import DeduplicationEngine
+from engines.case_summary import CaseSummaryEngine
+from engines.case_digest import CaseDigestEngine
+from engines.entity_index import EntityIndexEngine
+from engines.search import SearchEngine
+from engines.vectorized_rules import VectorizedRuleEngine, RULES, WINDOW_RULES
+from engines.anomaly_scoring import AnomalyScoringEngine
+from engines.model_registry import ModelRegistry
+from engines.model_training import IncrementalTrainer, DEFAULT_TIME_BUDGET_SECONDS
+from engines.case_archive import CaseArchiveEngine, CASE_ARCHIVE_MODE
+from jobs import JobQueue
+from instrumentation import stage
+
+# "legacy" uses RuleEngine; "vectorized" evaluates the same rules in one columnar pass, plus the
+# window rules when RULE_WINDOW_RULES=1
+RULE_ENGINE_MODE = os.getenv('RULE_ENGINE_MODE', 'legacy')
+
+# "chunked" scores with the registry model when its feature schema allows; "legacy" uses AnomalyEngine
+ANOMALY_ENGINE_MODE = os.getenv('ANOMALY_ENGINE_MODE', 'chunked')
+
+# "sparse" aggregates edges in SQL and samples betweenness; "legacy" uses GraphEngine
+GRAPH_ENGINE_MODE = os.getenv('GRAPH_ENGINE_MODE', 'sparse')
+
+# "bulk" renders from the case summary and top-K reads; "legacy" uses ReportEngine
+REPORT_ENGINE_MODE = os.getenv('REPORT_ENGINE_MODE', 'bulk')
+
+
+def last_event_rowid():
+    conn = get_connection()
+    rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM unified_events').fetchone()[0]
+    conn.close()
+    return rowid
+
+
+def count_events_since(case_id, rowid):
+    conn = get_connection()
+    count = conn.execute(
+        'SELECT COUNT(*) FROM unified_events WHERE rowid > ? AND case_id = ?',
+        (rowid, case_id)
+    ).fetchone()[0]
+    conn.close()
+    return count
+
+
+def normalize_new_timestamps(case_id, rowid):
+    """Bring rows from the legacy normalizer onto the stored timestamp form"""
+    conn = get_connection()
+    normalize_event_timestamps(conn, rowid, case_id)
+    conn.commit()
+    conn.close()
+
+
+def mark_case_updated(case_id):
+    """Bump the case version, then rematerialize its summary at that version"""
+    with stage('summary'):
+        bump_case_version(case_id)
+        CaseSummaryEngine.refresh(case_id)
+
+
+def count_findings(case_id):
+    conn = get_connection()
+    count = conn.execute(
+        'SELECT COUNT(*) FROM suspicious_events WHERE case_id = ?',
+        (case_id,)
+    ).fetchone()[0]
+    conn.close()
+    return count
+
+
+def run_rules(case_id, full=False):
+    """Incremental by default: only events stored since the last rule run are evaluated"""
+    if RULE_ENGINE_MODE == 'legacy':
+        RuleEngine.run_all_rules(case_id)
+        return {'mode': 'legacy', 'rules_evaluated': len(RULES) - len(WINDOW_RULES), 'findings': count_findings(case_id)}
+    if full:
+        return VectorizedRuleEngine.run_all_rules(case_id)
+    return VectorizedRuleEngine.run_incremental(case_id)
+
+
+def build_graph(case_id, full=False):
+    """Incremental in sparse mode when the case already has a graph"""
+    if GRAPH_ENGINE_MODE == 'legacy':
+        GraphEngine.build_graph(case_id)
+        # The legacy build replaces the rows the sparse watermark refers to
+        SparseGraphEngine.reset_state(case_id)
+        return {'mode': 'legacy'}
+    return SparseGraphEngine.refresh(case_id, full=full)
+
+
+def prepare_fingerprints(job_id, case_id):
+    """Stamp events stored before fingerprints existed so new uploads dedupe against them"""
+    with stage('fingerprint') as s:
+        stamped, _ = DeduplicationEngine.fingerprint_events(case_id)
+        s.rows = stamped
+    if stamped:
+        JobQueue.update_progress(job_id, rows_fingerprinted=stamped)
+
+
+def finish_ingest(job_id, case_id, before, payload):
+    """Index, rule-check and graph-update the events stored since the rowid watermark"""
+    JobQueue.update_progress(job_id, stage='indexing', progress=72)
+    with stage('entity_index') as s:
+        entities = s.rows = EntityIndexEngine.index_events(case_id, before)
+    with stage('search_index') as s:
+        searchable = s.rows = SearchEngine.index_events(case_id, before)
+    JobQueue.update_progress(job_id, entities_indexed=entities, rows_searchable=searchable)
+
+    mark_case_updated(case_id)
+    JobQueue.update_progress(job_id, stage='rules', progress=75)
+    with stage('rules') as s:
+        rules = run_rules(case_id, full=payload.get('full_rerun', False))
+        s.rows = rules.get('events')
+    JobQueue.update_progress(
+        job_id, stage='rules', progress=95,
+        rules_evaluated=rules['rules_evaluated'],
+        rule_findings=rules['findings']
+    )
+
+    # Keep edge weights of an existing graph current; centrality is rescored on the next analysis run
+    graph = None
+    if GRAPH_ENGINE_MODE == 'sparse':
+        with stage('graph_edges'):
+            graph = SparseGraphEngine.update_edges(case_id)
+    mark_case_updated(case_id)
+    return {'rules': rules, 'graph': graph}
+
+
+def run_ingest_job(job_id, case_id, payload):
+    """Parse, normalize and rule-check one spooled upload"""
+    CaseArchiveEngine.restore(case_id)
+    spooled = SpooledUpload(payload['filename'], payload['path'], payload['file_hash'], payload['file_size'])
+    conn = get_connection()
+    duplicate = DeduplicationEngine.find_completed_upload(conn, case_id, spooled.file_hash)
+    conn.close()
+    if duplicate:
+        spooled.discard()
+        return {'upload_id': None, 'duplicate_of': duplicate}
+
+    try:
+        CaseManagementEngine.update_status(case_id, CaseStatus.PROCESSING)
+        JobQueue.update_progress(job_id, stage='parsing', progress=5)
+        prepare_fingerprints(job_id, case_id)
+        before = last_event_rowid()
+
+        if payload.get('streaming'):
+            def on_progress(stats):
+                fraction = stats['bytes_read'] / max(spooled.file_size, 1)
+                JobQueue.update_progress(
+                    job_id, progress=5 + 65 * fraction,
+                    rows_parsed=stats['rows_parsed'],
+                    rows_normalized=stats['rows_valid'],
+                    rows_invalid=stats['rows_invalid']
+                )
+
+            with stage('ingest') as s:
+                upload_id, result = StreamingIngestionEngine.ingest_stream(case_id, spooled, on_progress=on_progress)
+                if not upload_id:
+                    raise ValueError(result)
+                s.rows = result['rows_parsed']
+            JobQueue.update_progress(
+                job_id, stage='normalized', progress=70,
+                rows_parsed=result['rows_parsed'],
+                rows_normalized=result['rows_valid'],
+                rows_invalid=result['rows_invalid'],
+                rows_duplicate=result['rows_duplicate']
+            )
+            CaseManagementEngine.update_status(case_id, CaseStatus.NORMALIZED)
+        else:
+            with stage('ingest') as s:
+                upload_id, result = IngestionEngine.ingest_file(case_id, spooled.filename, spooled.read_bytes())
+                if not upload_id:
+                    raise ValueError(result)
+                rows_parsed = s.rows = len(result) if hasattr(result, '__len__') else None
+            JobQueue.update_progress(job_id, stage='normalizing', progress=35, rows_parsed=rows_parsed)
+
+            with stage('normalize') as s:
+                s.rows = rows_parsed
+                success, message = NormalizationEngine.normalize_and_store(case_id, spooled.filename, result)
+                if not success:
+                    raise ValueError(f"Normalization failed: {message}")
+                # The legacy writer keeps ISO 'T' timestamps and doesn't fingerprint; normalize and stamp
+                # its rows, then drop the ones already in the case
+                normalize_new_timestamps(case_id, before)
+                _, removed = DeduplicationEngine.fingerprint_events(case_id, before, remove_duplicates=True)
+            JobQueue.update_progress(
+                job_id, stage='normalized', progress=70,
+                rows_normalized=count_events_since(case_id, before),
+                rows_duplicate=removed
+            )
+
+        return {'upload_id': upload_id, **finish_ingest(job_id, case_id, before, payload)}
+    except Exception:
+        CaseManagementEngine.update_status(case_id, CaseStatus.FAILED)
+        # Batches committed before the failure are still visible
+        bump_case_version(case_id)
+        raise
+    finally:
+        spooled.discard()
+
+
+def run_batch_ingest_job(job_id, case_id, payload):
+    """Several files and/or archives: expand, dedupe by hash, parse in parallel, merge with one writer"""
+    CaseArchiveEngine.restore(case_id)
+    try:
+        CaseManagementEngine.update_status(case_id, CaseStatus.PROCESSING)
+        JobQueue.update_progress(job_id, stage='extracting', progress=2)
+        prepare_fingerprints(job_id, case_id)
+        before = last_event_rowid()
+
+        with stage('extract') as s:
+            members, skipped = BatchIngestionEngine.expand(payload['files'])
+            members, duplicates = BatchIngestionEngine.dedupe(case_id, members)
+            s.rows = len(members)
+        JobQueue.update_progress(
+            job_id, stage='parsing', progress=5,
+            files_total=len(members), files_skipped=len(skipped), files_duplicate=len(duplicates)
+        )
+
+        def on_progress(stats):
+            fraction = stats['bytes_done'] / max(stats['bytes_total'], 1)
+            JobQueue.update_progress(
+                job_id, progress=5 + 65 * fraction,
+                files_done=stats['files_done'],
+                files_failed=stats['files_failed'],
+                rows_parsed=stats['rows_parsed'],
+                rows_normalized=stats['rows_valid'],
+                rows_invalid=stats['rows_invalid'],
+                rows_duplicate=stats['rows_duplicate']
+            )
+
+        with stage('ingest') as s:
+            stats = BatchIngestionEngine.ingest(case_id, members, on_progress=on_progress)
+            s.rows = stats['rows_parsed']
+        if members and not stats['uploads']:
+            raise ValueError(f"No file could be ingested: {stats['failures']}")
+        JobQueue.update_progress(job_id, stage='normalized', progress=70)
+        CaseManagementEngine.update_status(case_id, CaseStatus.NORMALIZED)
+
+        result = {
+            'uploads': stats['uploads'],
+            'failures': stats['failures'],
+            'skipped': skipped,
+            'duplicates': duplicates,
+            'rows_parsed': stats['rows_parsed'],
+            'rows_valid': stats['rows_valid'],
+            'rows_invalid': stats['rows_invalid'],
+            'rows_duplicate': stats['rows_duplicate']
+        }
+        if stats['uploads']:
+            result.update(finish_ingest(job_id, case_id, before, payload))
+        return result
+    except Exception:
+        CaseManagementEngine.update_status(case_id, CaseStatus.FAILED)
+        bump_case_version(case_id)
+        raise
+    finally:
+        for spooled in payload['files']:
+            SpooledUpload(spooled['filename'], spooled['path'], None, 0).discard()
+
+
+def run_rules_job(job_id, case_id, payload):
+    """Explicit rule re-run, full by default"""
+    CaseArchiveEngine.restore(case_id)
+    JobQueue.update_progress(job_id, stage='rules', progress=5)
+    with stage('rules') as s:
+        rules = run_rules(case_id, full=payload.get('full_rerun', True))
+        s.rows = rules.get('events')
+    JobQueue.update_progress(
+        job_id, stage='rules', progress=95,
+        rules_evaluated=rules['rules_evaluated'],
+        rule_findings=rules['findings']
+    )
+    mark_case_updated(case_id)
+    return rules
+
+
+def run_anomaly_detection(job_id, case_id):
+    if ANOMALY_ENGINE_MODE == 'chunked' and AnomalyScoringEngine.supports(ModelRegistry.get_active()[1]):
+        def on_progress(stats):
+            JobQueue.update_progress(job_id, rows_scored=stats['events_scored'], anomalies=stats['anomalies'])
+
+        return AnomalyScoringEngine.score_case(case_id, on_progress=on_progress)
+    return AnomalyEngine.run_anomaly_detection(case_id)
+
+
+def run_analysis_job(job_id, case_id, payload):
+    """Anomaly detection, graph build and risk aggregation for a case"""
+    CaseArchiveEngine.restore(case_id)
+    JobQueue.update_progress(job_id, stage='anomaly', progress=5)
+    with stage('anomaly') as s:
+        result = run_anomaly_detection(job_id, case_id)
+        if 'error' in result:
+            raise ValueError(result['error'])
+        s.rows = result.get('events_scored')
+    CaseManagementEngine.update_status(case_id, CaseStatus.ANALYZED)
+
+    JobQueue.update_progress(job_id, stage='graph', progress=50)
+    with stage('graph') as s:
+        graph = build_graph(case_id, full=payload.get('full_rebuild', False))
+        s.rows = graph.get('edges')
+    with stage('layout'):
+        GraphViewEngine.compute_layout(case_id)
+
+    JobQueue.update_progress(job_id, stage='risk', progress=85)
+    with stage('risk'):
+        risk = RiskAggregationEngine.aggregate_risk(case_id)
+        CaseManagementEngine.update_risk(case_id, risk['total_score'], risk['risk_level'])
+    mark_case_updated(case_id)
+    # Precompute the assistant's context so the first question after a run doesn't pay for it
+    with stage('digest'):
+        CaseDigestEngine.refresh(case_id)
+
+    return {'anomaly': result, 'graph': graph, 'risk': risk}
+
+
+def render_report(case_id, title, force=False):
+    """Reuse the case's report when its data version is unchanged, else render a new one"""
+    if REPORT_ENGINE_MODE != 'legacy':
+        return ReportBuilder.generate(case_id, title, force=force)
+    conn = get_connection()
+    version = get_case_version(conn, case_id)
+    existing = None if force else ReportBuilder.find_reusable(conn, case_id, title, version)
+    conn.close()
+    if existing:
+        return existing
+    report_id, filename = ReportEngine.generate_report(case_id, title)
+    if not report_id:
+        raise ValueError(filename)
+    return ReportBuilder.stamp(report_id, version)
+
+
+def run_report_job(job_id, case_id, payload):
+    """Render the case's PDF report off the request path"""
+    JobQueue.update_progress(job_id, stage='rendering', progress=10)
+    CaseArchiveEngine.ensure_hot(case_id)
+    with stage('report'):
+        report = render_report(case_id, payload.get('title', 'Investigation Report'), force=payload.get('force', False))
+    CaseManagementEngine.update_status(case_id, CaseStatus.REPORTED)
+    JobQueue.update_progress(job_id, reused=report['reused'])
+    if CASE_ARCHIVE_MODE == 'reported':
+        JobQueue.submit('archive', case_id)
+    return {
+        'report_id': report['id'],
+        'filename': os.path.basename(report['file_path']),
+        'file_path': report['file_path'],
+        'case_version': report['case_version'],
+        'reused': report['reused'],
+        **report['details']
+    }
+
+
+def run_entity_index_job(job_id, case_id, payload):
+    """Index a case's existing events, e.g. ones stored before the entity index existed"""
+    JobQueue.update_progress(job_id, stage='indexing', progress=5)
+    CaseArchiveEngine.ensure_hot(case_id)
+    entities = EntityIndexEngine.index_events(case_id, payload.get('after_rowid', 0))
+    return {'entities_indexed': entities}
+
+
+def run_search_index_job(job_id, case_id, payload):
+    """Full-text index a case's existing events"""
+    JobQueue.update_progress(job_id, stage='indexing', progress=5)
+    CaseArchiveEngine.ensure_hot(case_id)
+    return {'rows_searchable': SearchEngine.index_events(case_id, payload.get('after_rowid', 0))}
+
+
+def run_training_job(job_id, case_id, payload):
+    """Incremental baseline training on the reservoir sample within a time budget"""
+    JobQueue.update_progress(job_id, stage='sampling', progress=5)
+
+    def on_progress(counters):
+        stage = 'training' if 'estimators' in counters else 'sampling'
+        JobQueue.update_progress(job_id, stage=stage, progress=50 if stage == 'training' else 30, **counters)
+
+    result = IncrementalTrainer.train(
+        time_budget=float(payload.get('time_budget', DEFAULT_TIME_BUDGET_SECONDS)),
+        activate=payload.get('activate', True),
+        on_progress=on_progress
+    )
+    if 'error' in result:
+        raise ValueError(result['error'])
+    return result
+
+
+def run_archive_job(job_id, case_id, payload):
+    """Move a closed case's rows to the Parquet archive tier"""
+    JobQueue.update_progress(job_id, stage='archiving', progress=10)
+    with stage('archive') as s:
+        archive = CaseArchiveEngine.archive(case_id)
+        s.rows = sum(archive['rows'].values())
+    return archive
+
+
+def run_summary_job(job_id, case_id, payload):
+    """Rematerialize a summary that API reads found stale"""
+    with stage('summary'):
+        summary = CaseSummaryEngine.refresh(case_id)
+    return {'version': summary['version'], 'total_events': summary['total_events']}
+
+
+def run_hydrate_job(job_id, case_id, payload):
+    """Load an archived case back into SQLite so the API can read it, then evict idle ones"""
+    JobQueue.update_progress(job_id, stage='hydrating', progress=10)
+    with stage('hydrate'):
+        hydrated = CaseArchiveEngine.ensure_hot(case_id)
+    return {'hydrated': hydrated}
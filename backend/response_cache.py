@@ -0,0 +1,148 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from database import get_pool
+
+RESPONSE_CACHE_MAX_BYTES = int(float(os.getenv('RESPONSE_CACHE_MB', '64')) * 1024 * 1024)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '2048'))
+# A single body larger than this share of the budget is served but never cached
+MAX_ENTRY_FRACTION = 0.25
+CACHE_CONTROL = 'private, no-cache'
+
+
+class ResponseCache:
+    """LRU of serialized JSON responses keyed by (endpoint, case_id, params, case version).
+
+    Entries for an old version are never served again; they are dropped as soon as
+    a newer version of the same case is cached, or pushed out by the LRU."""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._case_stamps = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def case_stamp(case_id):
+        """(version, updated_at, summary version) of the case's data; updated_at tells apart a
+        recreated database, and the summary version changes when a stale summary is refreshed"""
+        with get_pool().reader() as conn:
+            row = conn.execute(
+                '''SELECT v.version, v.updated_at, s.version AS summary_version
+                FROM case_versions v LEFT JOIN case_summary s ON s.case_id = v.case_id
+                WHERE v.case_id = ?''', (case_id,)
+            ).fetchone()
+        return (row['version'], row['updated_at'], row['summary_version']) if row else (0, None, None)
+
+    @staticmethod
+    def make_etag(key):
+        digest = hashlib.sha1(json.dumps(key, default=str).encode()).hexdigest()[:20]
+        return f'W/"{digest}"'
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes * MAX_ENTRY_FRACTION:
+            return
+        case_id, stamp = key[1], key[3]
+        with self._lock:
+            if self._case_stamps.get(case_id) != stamp:
+                self._drop_case(case_id)
+                self._case_stamps[case_id] = stamp
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def _drop_case(self, case_id):
+        for key in [k for k in self._entries if k[1] == case_id]:
+            self._bytes -= len(self._entries.pop(key))
+            self._stats['invalidations'] += 1
+
+    def invalidate(self, case_id):
+        """Forget every cached response for a case (e.g. when it is deleted)"""
+        with self._lock:
+            self._drop_case(case_id)
+            self._case_stamps.pop(case_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._case_stamps.clear()
+            self._bytes = 0
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        stats['max_entries'] = self.max_entries
+        stats['hit_rate'] = stats['hits'] / max(stats['hits'] + stats['misses'], 1)
+        return stats
+
+    def respond(self, request, case_id, build):
+        """Serve from the cache, answer 304 on a matching If-None-Match, or build and cache"""
+        stamp = self.case_stamp(case_id)
+        params = tuple(sorted(request.query_params.multi_items()))
+        key = (request.url.path, case_id, params, stamp)
+        etag = self.make_etag(key)
+        headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL}
+
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]):
+            with self._lock:
+                self._stats['not_modified'] += 1
+            return Response(status_code=304, headers=headers)
+
+        body = self.get(key)
+        if body is None:
+            body = json.dumps(jsonable_encoder(build()), separators=(',', ':')).encode()
+            self.put(key, body)
+        return Response(content=body, media_type='application/json', headers=headers)
+
+
+response_cache = ResponseCache()
+
+
+def cached_case_response(endpoint):
+    """Decorator for GET endpoints taking case_id whose answer only changes with the case version.
+
+    Adds a hidden Request parameter to the endpoint's signature so FastAPI injects it."""
+    signature = inspect.signature(endpoint)
+    parameters = list(signature.parameters.values()) + [
+        inspect.Parameter('_cache_request', inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+    ]
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, _cache_request, **kwargs):
+        return response_cache.respond(
+            _cache_request, kwargs['case_id'], lambda: endpoint(*args, **kwargs)
+        )
+
+    wrapper.__signature__ = signature.replace(parameters=parameters)
+    return wrapper
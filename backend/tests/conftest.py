@@ -0,0 +1,23 @@
+"""Shared fixtures for the backend tests.
+
+Each test that touches SQLite runs in its own temporary directory, since the
+database and the archive live at paths relative to the working directory.
+"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database import init_database, get_connection  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    init_database()
+    conn = get_connection()
+    yield conn
+    conn.close()
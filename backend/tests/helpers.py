@@ -0,0 +1,50 @@
+"""Event factories shared by the backend tests"""
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from database import bulk_insert
+
+EVENT_COLUMNS = ('event_id', 'case_id', 'event_type', 'user_id', 'timestamp', 'source', 'amount', 'receiver', 'metadata')
+PARTIES = ['alice', 'bob', 'carol', 'dave', 'erin']
+START = datetime(2024, 3, 1, 22, 0, 0)
+
+
+def random_events(case_id, count, seed, hours=6, parties=PARTIES, start=START):
+    """Events among a few parties over a few hours, so windows overlap and rules fire"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(count):
+        event_type = rng.choice(['transaction', 'call', 'message'], p=[0.5, 0.3, 0.2])
+        user, receiver = rng.choice(parties, size=2, replace=False)
+        timestamp = start + timedelta(seconds=int(rng.integers(0, hours * 3600)))
+        amount = float(rng.choice([50.0, 500.0, 15000.0])) if event_type == 'transaction' else None
+        metadata = {'text': f'note {rng.integers(1000)}', 'is_deleted': bool(rng.random() < 0.1)}
+        rows.append((
+            str(uuid.uuid4()), case_id, str(event_type), str(user), timestamp.isoformat(sep=' '), 'test',
+            amount, str(receiver), json.dumps(metadata)
+        ))
+    return rows
+
+
+def insert_events(conn, rows):
+    bulk_insert(conn, 'unified_events', EVENT_COLUMNS, rows)
+
+
+def create_case(conn, case_id):
+    conn.execute(
+        "INSERT INTO cases (id, name, description, created_at, status) VALUES (?, ?, '', ?, 'created')",
+        (case_id, case_id, datetime.now().isoformat())
+    )
+    conn.commit()
+
+
+def snapshot_findings(conn, case_id):
+    return sorted(
+        tuple(row) for row in conn.execute(
+            'SELECT event_id, rule_type, severity, score_contribution, description FROM suspicious_events WHERE case_id = ?',
+            (case_id,)
+        )
+    )
@@ -0,0 +1,84 @@
+"""Chunked anomaly scoring: the staging swap and the chunks held in memory"""
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+
+import engines.anomaly_scoring as scoring
+from engines.anomaly_scoring import AnomalyScoringEngine, FEATURE_SCHEMA
+from engines.model_registry import ModelRegistry
+from helpers import random_events, insert_events, create_case
+
+
+@pytest.fixture
+def case(db, monkeypatch):
+    model = IsolationForest(n_estimators=10, random_state=0).fit(
+        np.random.default_rng(0).normal(size=(200, len(FEATURE_SCHEMA)))
+    )
+    meta = {'version': 'v-test', 'feature_schema': FEATURE_SCHEMA}
+    monkeypatch.setattr(ModelRegistry, 'get_active', staticmethod(lambda: (model, meta)))
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 500, seed=1))
+    return db
+
+
+def results(db, table='anomaly_results'):
+    return sorted(tuple(row) for row in db.execute(
+        f'SELECT event_id, model_version, anomaly_score FROM {table} WHERE case_id = ?', ('c1',)
+    ))
+
+
+def test_a_failed_run_keeps_the_previous_results(case, monkeypatch):
+    assert AnomalyScoringEngine.score_case('c1', chunk_size=100)['events_scored'] == 500
+    previous = results(case)
+    score_chunk = scoring._score_chunk
+    calls = []
+
+    def failing(model, features):
+        calls.append(1)
+        if len(calls) == 3:
+            raise RuntimeError('worker died')
+        return score_chunk(model, features)
+
+    monkeypatch.setattr(scoring, '_score_chunk', failing)
+    with pytest.raises(RuntimeError):
+        AnomalyScoringEngine.score_case('c1', chunk_size=100)
+
+    # Two chunks were staged before the failure; none of them reached anomaly_results
+    assert results(case) == previous
+    assert results(case, 'anomaly_results_staging') == []
+
+
+def test_a_rerun_replaces_the_results_in_one_swap(case):
+    AnomalyScoringEngine.score_case('c1', chunk_size=100)
+    insert_events(case, random_events('c1', 50, seed=2))
+
+    stats = AnomalyScoringEngine.score_case('c1', chunk_size=100)
+    rows = results(case)
+    assert stats['events_scored'] == len(rows) == 550
+    assert len({row[0] for row in rows}) == 550
+    assert results(case, 'anomaly_results_staging') == []
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_at_most_n_jobs_chunks_are_held(case, monkeypatch, n_jobs):
+    held, peak = [], []
+    iter_chunks = AnomalyScoringEngine.iter_feature_chunks
+    write_chunk = AnomalyScoringEngine._write_chunk
+
+    def counting_chunks(*args, **kwargs):
+        for event_ids, features in iter_chunks(*args, **kwargs):
+            assert len(event_ids) <= 100
+            held.append(len(event_ids))
+            peak.append(len(held))
+            yield event_ids, features
+
+    def counting_write(*args):
+        held.pop()
+        write_chunk(*args)
+
+    monkeypatch.setattr(AnomalyScoringEngine, 'iter_feature_chunks', staticmethod(counting_chunks))
+    monkeypatch.setattr(AnomalyScoringEngine, '_write_chunk', staticmethod(counting_write))
+
+    stats = AnomalyScoringEngine.score_case('c1', chunk_size=100, n_jobs=n_jobs)
+    assert stats['events_scored'] == 500 and stats['chunks'] >= 5
+    assert max(peak) == n_jobs
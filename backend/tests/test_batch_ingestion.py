@@ -0,0 +1,82 @@
+"""Batch ingestion: archive expansion, file-hash dedup and the single-writer merge"""
+import hashlib
+import json
+import zipfile
+
+from engines.batch_ingestion import BatchIngestionEngine
+from helpers import create_case
+
+EPOCH = 1709330400
+
+
+def spool(tmp_path, filename, data):
+    path = tmp_path / f'{filename}.part'
+    path.write_bytes(data)
+    return {'filename': filename, 'path': str(path), 'file_hash': hashlib.sha256(data).hexdigest(), 'file_size': len(data)}
+
+
+def jsonl(user, count):
+    return ''.join(
+        json.dumps({'user_id': user, 'receiver': 'bob', 'timestamp': EPOCH + i, 'amount': i}) + '\n'
+        for i in range(count)
+    ).encode()
+
+
+def archive(tmp_path, members):
+    path = tmp_path / 'export.zip'
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return spool(tmp_path, 'export.zip', path.read_bytes())
+
+
+def ingest(case_id, uploads, spool_dir):
+    members, skipped = BatchIngestionEngine.expand(uploads, spool_dir=str(spool_dir))
+    unique, duplicates = BatchIngestionEngine.dedupe(case_id, members)
+    return BatchIngestionEngine.ingest(case_id, unique, workers=2), skipped, duplicates
+
+
+def test_files_and_archive_members_are_merged_once(db, tmp_path):
+    create_case(db, 'c1')
+    a, b = jsonl('alice', 30), jsonl('carol', 20)
+    uploads = [
+        spool(tmp_path, 'a.jsonl', a),
+        archive(tmp_path, {'b.jsonl': b, 'copy/a.jsonl': a, 'notes.bin': b'\x00', '__MACOSX/._b.jsonl': b''}),
+    ]
+
+    stats, skipped, duplicates = ingest('c1', uploads, tmp_path)
+    assert skipped == [{'filename': 'export.zip/notes.bin', 'reason': 'unsupported file type'}]
+    assert duplicates == [{'filename': 'export.zip/copy/a.jsonl', 'reason': 'duplicate within upload'}]
+    assert stats['files_done'] == 2 and stats['files_failed'] == 0
+    assert stats['rows_parsed'] == stats['rows_valid'] == 50 and stats['rows_duplicate'] == 0
+    assert {u['filename'] for u in stats['uploads']} == {'a.jsonl', 'export.zip/b.jsonl'}
+
+    stored = db.execute("SELECT COUNT(*) FROM unified_events WHERE case_id = 'c1'").fetchone()[0]
+    assert stored == 50
+    assert db.execute("SELECT records_count FROM cases WHERE id = 'c1'").fetchone()[0] == 50
+    # Spooled files and parsed row batches are cleaned up
+    assert not list(tmp_path.glob('*.part')) and not list(tmp_path.glob('*.rows'))
+
+
+def test_a_file_already_ingested_is_skipped_by_hash(db, tmp_path):
+    create_case(db, 'c1')
+    a = jsonl('alice', 30)
+    ingest('c1', [spool(tmp_path, 'a.jsonl', a)], tmp_path)
+
+    # Same bytes under another name, next to a file with overlapping records
+    overlap = jsonl('alice', 40)
+    stats, _, duplicates = ingest('c1', [spool(tmp_path, 'renamed.jsonl', a), spool(tmp_path, 'more.jsonl', overlap)], tmp_path)
+    assert duplicates == [{'filename': 'renamed.jsonl', 'reason': 'already ingested'}]
+    assert stats['files_done'] == 1 and stats['rows_parsed'] == 40 and stats['rows_duplicate'] == 30
+    assert db.execute("SELECT records_count FROM cases WHERE id = 'c1'").fetchone()[0] == 40
+
+
+def test_a_member_that_fails_to_parse_is_logged_without_stopping_the_batch(db, tmp_path):
+    create_case(db, 'c1')
+    stats, _, _ = ingest('c1', [spool(tmp_path, 'good.jsonl', jsonl('alice', 10)), spool(tmp_path, 'bad.jsonl', b'{broken\n')], tmp_path)
+
+    assert stats['files_done'] == 2 and stats['files_failed'] == 1
+    assert stats['failures'][0]['filename'] == 'bad.jsonl'
+    assert stats['rows_parsed'] == 10
+    status = dict(db.execute("SELECT filename, status FROM upload_logs WHERE case_id = 'c1'").fetchall())
+    assert status == {'good.jsonl': 'completed', 'bad.jsonl': 'failed'}
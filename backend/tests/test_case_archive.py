@@ -0,0 +1,68 @@
+"""Archive → hydrate round trips and the rowids they depend on"""
+import sqlite3
+
+from database import init_database, get_connection
+from engines.case_archive import CaseArchiveEngine
+from engines.search import SearchEngine
+from engines.vectorized_rules import VectorizedRuleEngine
+from helpers import random_events, insert_events, create_case, snapshot_findings
+
+
+def test_archive_hydrate_round_trip_keeps_rowids_and_search(db):
+    for case_id in ('c1', 'c2'):
+        create_case(db, case_id)
+    insert_events(db, random_events('c1', 300, seed=6))
+    SearchEngine.index_events('c1')
+    VectorizedRuleEngine.run_all_rules('c1')
+
+    def events():
+        return [tuple(row) for row in db.execute(
+            'SELECT rowid, * FROM unified_events WHERE case_id = ? ORDER BY rowid', ('c1',)
+        )]
+
+    before, findings = events(), snapshot_findings(db, 'c1')
+    found = SearchEngine.search(db, 'c1', 'note')
+    CaseArchiveEngine.archive('c1')
+
+    assert not events() and not CaseArchiveEngine.readable('c1')
+    # Events stored while the case is archived must not take the archived rowids
+    insert_events(db, random_events('c2', 20, seed=7))
+    assert db.execute('SELECT MIN(rowid) FROM unified_events WHERE case_id = ?', ('c2',)).fetchone()[0] > before[-1][0]
+    # Nothing but real events in the table, so MAX(rowid) watermarks and unfiltered scans see only them
+    assert [row[0] for row in db.execute('SELECT DISTINCT case_id FROM unified_events')] == ['c2']
+
+    assert CaseArchiveEngine.ensure_hot('c1')
+    assert CaseArchiveEngine.readable('c1')
+    assert events() == before
+    assert snapshot_findings(db, 'c1') == findings
+    assert SearchEngine.search(db, 'c1', 'note') == found
+
+
+def test_tables_from_before_autoincrement_are_rebuilt_in_place(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conn = sqlite3.connect('security_investigation.db')
+    conn.execute('''CREATE TABLE unified_events (
+        event_id TEXT PRIMARY KEY, case_id TEXT NOT NULL, event_type TEXT NOT NULL, user_id TEXT,
+        timestamp TEXT NOT NULL, source TEXT, amount REAL, receiver TEXT, metadata TEXT,
+        is_valid INTEGER DEFAULT 1, validation_errors TEXT)''')
+    conn.executemany(
+        "INSERT INTO unified_events (rowid, event_id, case_id, event_type, timestamp) VALUES (?, ?, 'c1', 'call', '2024-03-01 22:00:00')",
+        [(rowid, f'e{rowid}') for rowid in (3, 7, 9)]
+    )
+    # The placeholder older archives left above the archived rowids
+    conn.execute(
+        "INSERT INTO unified_events (rowid, event_id, case_id, event_type, timestamp, is_valid) "
+        "VALUES (40, '__archive_rowid_guard__:40', '__archive_rowid_guard__', 'rowid_guard', '', 0)"
+    )
+    conn.commit()
+    conn.close()
+
+    init_database()
+    conn = get_connection()
+    assert [tuple(row) for row in conn.execute('SELECT rowid, event_id FROM unified_events ORDER BY rowid')] == [
+        (3, 'e3'), (7, 'e7'), (9, 'e9')
+    ]
+    create_case(conn, 'c2')
+    insert_events(conn, random_events('c2', 1, seed=1))
+    assert conn.execute("SELECT rowid FROM unified_events WHERE case_id = 'c2'").fetchone()[0] == 41
+    conn.close()
@@ -0,0 +1,57 @@
+"""Case summary freshness: reads serve the stored row and leave the refresh to a job"""
+from database import bump_case_version
+from engines.case_summary import CaseSummaryEngine
+from helpers import random_events, insert_events, create_case
+
+
+def summary_jobs(db):
+    return db.execute("SELECT COUNT(*) FROM jobs WHERE job_type = 'summary' AND case_id = 'c1'").fetchone()[0]
+
+
+def stored_version(db):
+    return db.execute("SELECT version FROM case_summary WHERE case_id = 'c1'").fetchone()[0]
+
+
+def test_a_current_summary_is_read_as_is(db):
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 20, seed=1))
+    bump_case_version('c1')
+    CaseSummaryEngine.refresh('c1')
+
+    summary = CaseSummaryEngine.get(db, 'c1')
+    assert summary['total_events'] == 20 and not summary['stale']
+    assert summary_jobs(db) == 0
+
+
+def test_a_stale_summary_is_served_and_refreshed_by_one_job(db):
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 20, seed=1))
+    bump_case_version('c1')
+    CaseSummaryEngine.refresh('c1')
+    insert_events(db, random_events('c1', 5, seed=2))
+    bump_case_version('c1')
+
+    for _ in range(3):
+        summary = CaseSummaryEngine.get(db, 'c1')
+        assert summary['total_events'] == 20 and summary['stale']
+    # The read wrote nothing but the one queued job
+    assert stored_version(db) == 1 and summary_jobs(db) == 1
+
+    fresh = CaseSummaryEngine.get(db, 'c1', fresh=True)
+    assert fresh['total_events'] == 25 and not fresh['stale'] and stored_version(db) == 1
+
+    # What the queued job runs
+    CaseSummaryEngine.refresh('c1')
+    summary = CaseSummaryEngine.get(db, 'c1')
+    assert summary['total_events'] == 25 and not summary['stale'] and stored_version(db) == 2
+
+
+def test_a_missing_summary_is_aggregated_without_storing_it(db):
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 20, seed=1))
+    bump_case_version('c1')
+
+    summary = CaseSummaryEngine.get(db, 'c1')
+    assert summary['total_events'] == 20 and not summary['stale']
+    assert db.execute("SELECT COUNT(*) FROM case_summary WHERE case_id = 'c1'").fetchone()[0] == 0
+    assert summary_jobs(db) == 1
@@ -0,0 +1,28 @@
+"""Event fingerprints: stable across metadata key order, and computed once per event"""
+import uuid
+
+from engines.deduplication import DeduplicationEngine, event_fingerprint
+from helpers import random_events, insert_events, create_case
+
+
+def test_fingerprint_ignores_metadata_key_order():
+    a = event_fingerprint('call', 'alice', 'bob', '2024-03-01 22:00:00', None, '{"a": 1, "b": 2}')
+    b = event_fingerprint('call', 'alice', 'bob', '2024-03-01 22:00:00', None, {'b': 2, 'a': 1})
+    assert a == b
+    assert a != event_fingerprint('call', 'alice', 'bob', '2024-03-01 22:00:01', None, {'a': 1, 'b': 2})
+
+
+def test_fingerprint_events_is_idempotent(db):
+    create_case(db, 'c1')
+    rows = random_events('c1', 50, seed=1)
+    # The same record again under a new event id, as from an overlapping export
+    duplicate = (str(uuid.uuid4()),) + rows[0][1:]
+    insert_events(db, rows + [duplicate])
+
+    assert DeduplicationEngine.fingerprint_events('c1') == (50, 0)
+    fingerprints = dict(db.execute('SELECT event_id, fingerprint FROM unified_events WHERE case_id = ?', ('c1',)).fetchall())
+    assert fingerprints[duplicate[0]] == f'dup:{duplicate[0]}'
+
+    assert DeduplicationEngine.fingerprint_events('c1') == (0, 0)
+    again = dict(db.execute('SELECT event_id, fingerprint FROM unified_events WHERE case_id = ?', ('c1',)).fetchall())
+    assert again == fingerprints
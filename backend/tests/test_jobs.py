@@ -0,0 +1,48 @@
+"""Job queue claiming and the training schedule"""
+import time
+
+from engines.model_training import TrainingScheduler
+from jobs import JobQueue, JobStatus
+
+
+def statuses(db, job_type):
+    return sorted(row[0] for row in db.execute('SELECT status FROM jobs WHERE job_type = ?', (job_type,)))
+
+
+def test_submit_once_keeps_one_pending_job(db):
+    first = JobQueue.submit_once('train', None, {'time_budget': 5})
+    assert JobQueue.submit_once('train', None, {'time_budget': 5}) == first
+    assert JobQueue.claim_next('w1') == first
+    # Running still counts as pending
+    assert JobQueue.submit_once('train') == first
+
+    JobQueue.finish(first)
+    assert JobQueue.submit_once('train') != first
+    assert statuses(db, 'train') == [JobStatus.COMPLETED, JobStatus.QUEUED]
+
+
+def test_train_jobs_are_claimed_one_at_a_time(db):
+    first = JobQueue.submit('train')
+    second = JobQueue.submit('train')
+    hydrate = JobQueue.submit('hydrate', 'c1')
+
+    assert JobQueue.claim_next('w1') == first
+    # The second train job waits; other work goes ahead of it
+    assert JobQueue.claim_next('w2') == hydrate
+    assert JobQueue.claim_next('w2') is None
+    JobQueue.finish(first)
+    assert JobQueue.claim_next('w2') == second
+
+
+def test_schedulers_in_several_workers_queue_one_train_job(db):
+    def submit(time_budget):
+        JobQueue.submit_once('train', None, {'time_budget': time_budget})
+
+    schedulers = [TrainingScheduler(0.01 / 3600) for _ in range(4)]
+    for scheduler in schedulers:
+        scheduler.start(submit)
+    time.sleep(0.3)
+    for scheduler in schedulers:
+        scheduler.stop()
+    time.sleep(0.05)
+    assert statuses(db, 'train') == [JobStatus.QUEUED]
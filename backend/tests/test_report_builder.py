@@ -0,0 +1,27 @@
+"""Report downloads: `Range` header parsing"""
+import pytest
+
+from engines.report_builder import ReportBuilder
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('bytes=0-99', (0, 99)),
+    ('bytes=500-', (500, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('bytes=900-5000', (900, 999)),
+    ('bytes=999-999', (999, 999)),
+    ('bytes=-', None),
+    ('bytes=0-1,5-6', None),
+    ('items=0-99', None),
+])
+def test_parse_range(header, expected):
+    assert ReportBuilder.parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=5-2', 'bytes=1000-1200'])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        ReportBuilder.parse_range(header, 1000)
@@ -0,0 +1,67 @@
+"""Version-keyed response cache and its ETags"""
+import json
+
+import pytest
+from starlette.requests import Request
+
+import database
+from database import bump_case_version
+from engines.case_summary import CaseSummaryEngine
+from helpers import random_events, insert_events, create_case
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(db, monkeypatch):
+    # A pool for this test's database, not one left over from an earlier test
+    monkeypatch.setattr(database, '_pool', None)
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 20, seed=1))
+    bump_case_version('c1')
+    CaseSummaryEngine.refresh('c1')
+    return ResponseCache()
+
+
+def get(cache, build, etag=None):
+    headers = [(b'if-none-match', etag.encode())] if etag else []
+    request = Request({'type': 'http', 'method': 'GET', 'path': '/api/cases/c1/rules', 'query_string': b'', 'headers': headers})
+    return cache.respond(request, 'c1', build)
+
+
+def test_a_refreshed_summary_replaces_the_cached_stale_answer(db, cache):
+    def build():
+        summary = CaseSummaryEngine.get(db, 'c1')
+        return {'total': summary['total_events'], 'stale': summary['stale']}
+
+    insert_events(db, random_events('c1', 5, seed=2))
+    bump_case_version('c1')
+    stale = get(cache, build)
+    assert json.loads(stale.body) == {'total': 20, 'stale': True}
+
+    CaseSummaryEngine.refresh('c1')
+    refreshed = get(cache, build, etag=stale.headers['ETag'])
+    assert refreshed.status_code == 200 and refreshed.headers['ETag'] != stale.headers['ETag']
+    assert json.loads(refreshed.body) == {'total': 25, 'stale': False}
+
+
+def test_matching_etag_answers_304_until_the_case_changes(db, cache):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {'calls': len(calls)}
+
+    first = get(cache, build)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'private, no-cache'
+
+    assert get(cache, build, etag=etag).status_code == 304
+    assert get(cache, build, etag=f'W/"other", {etag}').status_code == 304
+    # Served from the cache without building again
+    assert json.loads(get(cache, build).body) == {'calls': 1} and len(calls) == 1
+
+    bump_case_version('c1')
+    changed = get(cache, build, etag=etag)
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert json.loads(changed.body) == {'calls': 2}
+    assert cache.metrics()['not_modified'] == 2 and cache.metrics()['invalidations'] == 1
@@ -0,0 +1,69 @@
+"""Sparse graph builds: sampled betweenness and SQL-aggregated edges"""
+import networkx as nx
+import numpy as np
+
+from database import run_migration, _split_communication_edges
+from engines.graph_view import GraphViewEngine
+from engines.sparse_graph import SparseGraphEngine
+from helpers import random_events, insert_events, create_case
+
+
+def test_betweenness_matches_networkx_when_every_node_is_a_pivot():
+    graph = nx.gnm_random_graph(40, 90, seed=3)
+    sources, targets = zip(*graph.edges())
+    node_ids, matrix = SparseGraphEngine.adjacency(np.array(sources), np.array(targets))
+
+    scores, pivots, epsilon = SparseGraphEngine.betweenness(matrix)
+
+    assert pivots == len(node_ids) and epsilon == 0.0
+    expected = nx.betweenness_centrality(graph, normalized=True)
+    assert np.allclose(scores, [expected[int(node)] for node in node_ids])
+
+
+def edges(conn, case_id):
+    return sorted(
+        (row[0], row[1], row[2], row[3], round(row[4], 2)) for row in conn.execute(
+            '''SELECT source, target, edge_type, weight, json_extract(metadata, '$.total_amount')
+            FROM graph_edges WHERE case_id = ?''', (case_id,)
+        )
+    )
+
+
+def test_edges_keep_the_event_type_through_incremental_updates(db):
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 200, seed=1))
+    SparseGraphEngine.build_graph('c1')
+    insert_events(db, random_events('c1', 80, seed=2))
+    SparseGraphEngine.update_edges('c1')
+    incremental = edges(db, 'c1')
+
+    SparseGraphEngine.build_graph('c1')
+    assert incremental == edges(db, 'c1')
+    assert {edge[2] for edge in incremental} == {'call', 'message', 'transaction'}
+
+    calls = GraphViewEngine.get_view(db, 'c1', {'edge_type': 'call'})['edges']
+    assert calls and {edge['label'] for edge in calls} == {'call'}
+
+
+def test_communication_edges_from_earlier_builds_are_split(db):
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 200, seed=3))
+    SparseGraphEngine.build_graph('c1')
+    expected = edges(db, 'c1')
+    # Rows past the watermark are folded in by the next incremental update, not by the migration
+    insert_events(db, random_events('c1', 20, seed=4))
+
+    merged = db.execute(
+        '''SELECT source, target, SUM(weight), SUM(json_extract(metadata, '$.total_amount')) FROM graph_edges
+        WHERE case_id = 'c1' AND edge_type != 'transaction' GROUP BY source, target'''
+    ).fetchall()
+    db.execute("DELETE FROM graph_edges WHERE edge_type != 'transaction'")
+    db.executemany(
+        "INSERT INTO graph_edges (id, case_id, source, target, edge_type, weight, metadata) "
+        "VALUES (?, 'c1', ?, ?, 'communication', ?, json_object('total_amount', ?))",
+        [(f'm{i}', *row) for i, row in enumerate(merged)]
+    )
+    db.execute("DELETE FROM schema_migrations WHERE name = 'split_communication_edges'")
+
+    run_migration(db, 'split_communication_edges', _split_communication_edges)
+    assert edges(db, 'c1') == expected
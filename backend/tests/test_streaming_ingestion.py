@@ -0,0 +1,93 @@
+"""Streaming ingestion: timestamp parsing, JSON reading and the case's record count"""
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from engines.streaming_ingestion import StreamingIngestionEngine, StreamingJSONReader, SpooledUpload
+from helpers import create_case
+
+EPOCH = 1709330400
+EXPECTED = datetime.fromtimestamp(EPOCH).strftime('%Y-%m-%d %H:%M:%S')
+
+
+@pytest.mark.parametrize('value, expected', [
+    (EPOCH, EXPECTED),
+    (float(EPOCH), EXPECTED),
+    (EPOCH * 1000, EXPECTED),
+    (str(EPOCH), EXPECTED),
+    (f'{EPOCH * 1000}', EXPECTED),
+    ('2024-03-01 22:00:00', '2024-03-01 22:00:00'),
+    ('2024-03-01T22:00:00', '2024-03-01 22:00:00'),
+    (True, None),
+    (False, None),
+    (None, None),
+    ('', None),
+    ('not a time', None),
+    (float('nan'), None),
+    (10 ** 30, None),
+    (-10 ** 30, None),
+    ('99999-01-01', None),
+])
+def test_parse_timestamp(value, expected):
+    assert StreamingIngestionEngine._parse_timestamp(value) == expected
+
+
+def test_unparseable_timestamp_marks_the_record_invalid():
+    row = StreamingIngestionEngine.normalize_record('c1', {'user_id': 'alice', 'timestamp': 10 ** 30}, 'test')
+    assert row[9] == 0
+    assert 'Missing or invalid timestamp' in json.loads(row[10])
+
+
+class CountingReader(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def test_a_record_spanning_many_chunks_is_read_in_few_fills():
+    record = {'user_id': 'alice', 'text': 'x' * 200_000}
+    fp = CountingReader(json.dumps([record, {'user_id': 'bob'}]))
+
+    assert list(StreamingJSONReader(fp, chunk_size=64)) == [record, {'user_id': 'bob'}]
+    # Doubling reads: about log2(200_000 / 64), not 200_000 / 64
+    assert fp.reads < 30
+
+
+def write_jsonl(path, records, tail=''):
+    path.write_text(''.join(json.dumps(r) + '\n' for r in records) + tail)
+    return SpooledUpload(path.name, str(path), None, path.stat().st_size)
+
+
+def stored_valid(db, case_id):
+    return db.execute('SELECT COUNT(*) FROM unified_events WHERE case_id = ? AND is_valid = 1', (case_id,)).fetchone()[0]
+
+
+def records_count(db, case_id):
+    return db.execute('SELECT records_count FROM cases WHERE id = ?', (case_id,)).fetchone()[0]
+
+
+def test_records_count_follows_stored_rows_through_a_failure_and_a_retry(db, tmp_path):
+    create_case(db, 'c1')
+    records = [
+        {'user_id': f'user{i}', 'timestamp': EPOCH + i, 'amount': i} for i in range(30)
+    ] + [{'timestamp': EPOCH}]
+
+    # Fails after two committed batches of ten
+    upload_id, error = StreamingIngestionEngine.ingest_stream(
+        'c1', write_jsonl(tmp_path / 'part.jsonl', records[:25], tail='{broken\n'), batch_size=10
+    )
+    assert upload_id is None and error
+    assert records_count(db, 'c1') == stored_valid(db, 'c1') == 20
+
+    # The whole file again: stored records are skipped, the rest are counted once
+    upload_id, stats = StreamingIngestionEngine.ingest_stream(
+        'c1', write_jsonl(tmp_path / 'full.jsonl', records), batch_size=10
+    )
+    assert upload_id and stats['rows_duplicate'] == 20 and stats['rows_invalid'] == 1
+    assert records_count(db, 'c1') == stored_valid(db, 'c1') == 30
@@ -0,0 +1,57 @@
+"""Vectorized rule runs, full and incremental"""
+from datetime import timedelta
+
+from engines.vectorized_rules import VectorizedRuleEngine, WINDOW_RULES
+from engines.window_analytics import WindowAnalyticsEngine
+from helpers import START, random_events, insert_events, create_case, snapshot_findings
+
+
+def test_window_rules_only_run_when_enabled(db, monkeypatch):
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 300, seed=1))
+
+    result = VectorizedRuleEngine.run_all_rules('c1')
+    assert result['rules_evaluated'] == 4
+    assert not {finding[1] for finding in snapshot_findings(db, 'c1')} & set(WINDOW_RULES)
+
+    monkeypatch.setattr('engines.vectorized_rules.WINDOW_RULES_ENABLED', True)
+    result = VectorizedRuleEngine.run_all_rules('c1')
+    assert result['rules_evaluated'] == 7
+    assert {finding[1] for finding in snapshot_findings(db, 'c1')} >= set(WINDOW_RULES)
+
+
+def test_incremental_rules_match_a_full_run(db, monkeypatch):
+    monkeypatch.setattr('engines.vectorized_rules.WINDOW_RULES_ENABLED', True)
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 400, seed=2) + random_events('c1', 400, seed=5, hours=10 * 24))
+    VectorizedRuleEngine.run_all_rules('c1')
+
+    # Later uploads interleave in time with the first one, and push users over the burst threshold
+    for seed, hours in ((3, 6), (4, 10 * 24), (6, 1)):
+        insert_events(db, random_events('c1', 150, seed=seed, hours=hours))
+        assert VectorizedRuleEngine.run_incremental('c1')['mode'] == 'incremental'
+        incremental = snapshot_findings(db, 'c1')
+        VectorizedRuleEngine.run_all_rules('c1')
+        assert incremental == snapshot_findings(db, 'c1')
+    assert {finding[1] for finding in incremental} >= set(WINDOW_RULES) | {'Transaction Burst'}
+
+
+def test_incremental_window_rules_reload_only_around_new_events(db, monkeypatch):
+    monkeypatch.setattr('engines.vectorized_rules.WINDOW_RULES_ENABLED', True)
+    create_case(db, 'c1')
+    insert_events(db, random_events('c1', 3000, seed=7, hours=60 * 24))
+    VectorizedRuleEngine.run_all_rules('c1')
+    loaded = []
+    load_ranges = WindowAnalyticsEngine.load_ranges
+
+    def recording(conn, case_id, ranges, anchors=False):
+        frame = load_ranges(conn, case_id, ranges, anchors)
+        loaded.append(len(frame))
+        return frame
+
+    monkeypatch.setattr(WindowAnalyticsEngine, 'load_ranges', staticmethod(recording))
+    insert_events(db, random_events('c1', 20, seed=8, hours=1, start=START + timedelta(days=30)))
+    VectorizedRuleEngine.run_incremental('c1')
+
+    # The new hour and the reach of the window rules either side, not the two months of the case
+    assert 20 <= loaded[0] < 200
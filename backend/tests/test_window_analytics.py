@@ -0,0 +1,124 @@
+"""Window analytics against brute force, and the context window features load"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engines.window_analytics import (
+    WindowAnalyticsEngine, WINDOW_FEATURES, VELOCITY_WINDOW_SECONDS, VELOCITY_THRESHOLD, PAIR_WINDOW_SECONDS
+)
+from helpers import PARTIES, START, random_events, insert_events, create_case
+
+
+def long_case(db, case_id='c1'):
+    """A month of events in which alice takes part in most, including untimed and userless rows"""
+    create_case(db, case_id)
+    rows = random_events(case_id, 1200, seed=11, hours=30 * 24, parties=PARTIES[:3])
+    rows += random_events(case_id, 600, seed=12, hours=30 * 24)
+    rows += random_events(case_id, 300, seed=13, hours=2, start=START + timedelta(days=12))
+    rows[5] = rows[5][:4] + ('not a time',) + rows[5][5:]
+    rows[6] = rows[6][:3] + (None,) + rows[6][4:]
+    # Upload order is not time order
+    np.random.default_rng(1).shuffle(rows)
+    insert_events(db, [tuple(row) for row in rows])
+
+
+def expected_features(db, case_id):
+    frame = WindowAnalyticsEngine.analyze(WindowAnalyticsEngine.load(db, case_id))
+    return pd.DataFrame(WindowAnalyticsEngine.features(frame), index=frame['event_id'], columns=WINDOW_FEATURES)
+
+
+@pytest.fixture
+def analyzed_sizes(monkeypatch):
+    sizes = []
+    analyze = WindowAnalyticsEngine.analyze
+
+    def recording(frame):
+        sizes.append(len(frame))
+        return analyze(frame)
+
+    monkeypatch.setattr(WindowAnalyticsEngine, 'analyze', staticmethod(recording))
+    return sizes
+
+
+def brute_force_windows(frame):
+    """The window columns of WindowAnalyticsEngine.analyze by direct comparison of every pair"""
+    t, users, receivers, types = (
+        frame['seconds'].to_numpy(), frame['user_id'].to_numpy(), frame['receiver'].to_numpy(), frame['event_type'].to_numpy()
+    )
+    n = len(frame)
+    pair = [frozenset((users[i], receivers[i])) for i in range(n)]
+    txn = types == 'transaction'
+    out = {name: np.zeros(n) for name in (
+        'user_velocity', 'pair_velocity', 'in_velocity_window', 'velocity_peak', 'velocity_nearby', 'pair_nearby'
+    )}
+    out.update({name: np.full(n, np.nan) for name in ('gap', 'since_call', 'since_pair_call')})
+    for i in range(n):
+        same_user = users == users[i]
+        same_pair = np.array([p == pair[i] for p in pair])
+        out['user_velocity'][i] = np.sum(same_user & (t >= t[i] - VELOCITY_WINDOW_SECONDS) & (t <= t[i]))
+        out['pair_velocity'][i] = np.sum(same_pair & (t >= t[i] - PAIR_WINDOW_SECONDS) & (t <= t[i]))
+        out['pair_nearby'][i] = np.sum(same_pair & (np.abs(t - t[i]) <= PAIR_WINDOW_SECONDS))
+        earlier = t[same_user & (t < t[i])]
+        out['gap'][i] = t[i] - earlier.max() if len(earlier) else np.nan
+        calls = t[(types == 'call') & ((users == users[i]) | (receivers == users[i])) & (t < t[i])]
+        out['since_call'][i] = t[i] - calls.max() if len(calls) else np.nan
+        if txn[i]:
+            pair_calls = t[(types == 'call') & same_pair & (t < t[i])]
+            out['since_pair_call'][i] = t[i] - pair_calls.max() if len(pair_calls) else np.nan
+            # Windows ending at each transaction of the user; the event is flagged inside any busy one
+            ends = np.flatnonzero(txn & same_user)
+            counts = [np.sum(txn & same_user & (t >= t[k] - VELOCITY_WINDOW_SECONDS) & (t <= t[k])) for k in ends]
+            out['velocity_peak'][i] = max(counts)
+            out['velocity_nearby'][i] = np.sum(txn & same_user & (np.abs(t - t[i]) <= VELOCITY_WINDOW_SECONDS))
+            out['in_velocity_window'][i] = any(
+                c >= VELOCITY_THRESHOLD and t[k] - VELOCITY_WINDOW_SECONDS <= t[i] <= t[k] for k, c in zip(ends, counts)
+            )
+    return out
+
+
+def test_window_analytics_match_brute_force():
+    rng = np.random.default_rng(5)
+    n = 300
+    frame = pd.DataFrame({
+        'event_type': rng.choice(['transaction', 'call', 'message'], size=n, p=[0.6, 0.3, 0.1]),
+        'user_id': rng.choice(PARTIES[:3], size=n),
+        'receiver': rng.choice(PARTIES[3:], size=n),
+        # Distinct seconds, so the order of events in the same second doesn't matter
+        'seconds': rng.choice(4 * 3600, size=n, replace=False) + 1_700_000_000,
+    })
+    analyzed = WindowAnalyticsEngine.analyze(frame)
+    expected = brute_force_windows(frame)
+    assert analyzed['in_velocity_window'].any() and analyzed['since_pair_call'].notna().any()
+
+    for name, values in expected.items():
+        assert np.allclose(analyzed[name].to_numpy(dtype=float), values, equal_nan=True), name
+
+
+def test_case_features_come_from_a_bounded_stream(db, analyzed_sizes):
+    long_case(db)
+    expected = expected_features(db, 'c1')
+    analyzed_sizes.clear()
+
+    chunks = list(WindowAnalyticsEngine.iter_case_features(db, 'c1', chunk_size=200))
+    events = pd.concat([events for events, _ in chunks])
+    features = pd.DataFrame(np.vstack([f for _, f in chunks]), index=events['event_id'], columns=WINDOW_FEATURES)
+
+    assert sorted(features.index) == sorted(expected.index)
+    assert np.allclose(features.loc[expected.index].to_numpy(), expected.to_numpy())
+    # Each batch is the chunk plus a party's last hour, never the rest of the case
+    assert max(analyzed_sizes) <= 200 + 120 and len(analyzed_sizes) >= 2 * len(expected) // 200
+
+
+def test_chunk_features_load_only_the_windows_before_the_chunk(db, analyzed_sizes):
+    long_case(db)
+    expected = expected_features(db, 'c1')
+    chunk = WindowAnalyticsEngine.load(db, 'c1').sample(50, random_state=3)
+    analyzed_sizes.clear()
+
+    features = WindowAnalyticsEngine.chunk_features(db, 'c1', chunk)
+
+    assert np.allclose(features, expected.loc[chunk['event_id']].to_numpy())
+    # The hour before each chunk event, not the month around it
+    assert analyzed_sizes[0] < len(expected) // 4
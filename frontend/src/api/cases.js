@@ -43,14 +43,33 @@ export const getTimeline = async (caseId, filters) => {
   return data
 }
 
+export const searchEvents = async (caseId, query, filters = {}) => {
+  const { data } = await api.get(`/cases/${caseId}/search`, { params: { q: query, ...filters } })
+  return data
+}
+
 export const getRuleResults = async (caseId) => {
   const { data } = await api.get(`/cases/${caseId}/rules`)
   return data
 }
 
+export const getJob = async (jobId) => {
+  const { data } = await api.get(`/jobs/${jobId}`)
+  return data
+}
+
+export const waitForJob = async (jobId, intervalMs = 2000) => {
+  while (true) {
+    const job = await getJob(jobId)
+    if (job.status === 'completed') return job
+    if (job.status === 'failed') throw new Error(job.errors?.[0] || 'Job failed')
+    await new Promise(resolve => setTimeout(resolve, intervalMs))
+  }
+}
+
 export const runAnomalyDetection = async (caseId) => {
   const { data } = await api.post(`/cases/${caseId}/anomaly/run`)
-  return data
+  return data.job_id ? waitForJob(data.job_id) : data
 }
 
 export const getAnomalyResults = async (caseId) => {
@@ -58,8 +77,15 @@ export const getAnomalyResults = async (caseId) => {
   return data
 }
 
-export const getGraphData = async (caseId, filters) => {
-  const { data } = await api.get(`/cases/${caseId}/graph`, { params: filters })
+export const getGraphData = async (caseId, filters = {}) => {
+  const params = {
+    min_weight: filters.minWeight || undefined,
+    edge_type: filters.edgeType || undefined,
+    top_k: filters.topK || undefined,
+    ego: filters.ego || undefined,
+    hops: filters.hops || undefined
+  }
+  const { data } = await api.get(`/cases/${caseId}/graph`, { params })
   return data
 }
 
@@ -68,11 +94,33 @@ export const getRiskScore = async (caseId) => {
   return data
 }
 
-export const generateReport = async (caseId, title = 'Investigation Report') => {
-  const { data } = await api.post(`/cases/${caseId}/report/generate`, { title })
-  return data
+export const generateReport = async (caseId, title = 'Investigation Report', force = false) => {
+  const { data } = await api.post(`/cases/${caseId}/report/generate`, { title, force })
+  return data.job_id ? (await waitForJob(data.job_id)).result : data
 }
 
+export const streamAssistant = async (caseId, question, onChunk) => {
+  const response = await fetch(`${api.defaults.baseURL}/cases/${caseId}/ai-assistant/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ question })
+  })
+  if (!response.ok) throw new Error(`Assistant request failed (${response.status})`)
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let text = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    text += decoder.decode(value, { stream: true })
+    onChunk(text)
+  }
+  return text
+}
+
+export const getReportDownloadUrl = (caseId, reportId) =>
+  `${api.defaults.baseURL}/cases/${caseId}/reports/${reportId}/download`
+
 export const getReports = async (caseId) => {
   const { data } = await api.get(`/cases/${caseId}/reports`)
   return { reports: data, summary: null }
@@ -2,7 +2,7 @@ import { useState } from 'react'
 import { useParams } from 'react-router-dom'
 import { Brain, Send, Loader2 } from 'lucide-react'
 import Card from '../components/Card'
-import axios from 'axios'
+import { streamAssistant } from '../api/cases'
 
 const AIAssistantPage = () => {
   const { id } = useParams()
@@ -20,24 +20,18 @@ const AIAssistantPage = () => {
     setLoading(true)
 
     try {
-      const response = await axios.post(`http://localhost:8000/api/cases/${id}/ai-assistant`, {
-        question: question
+      // Show the answer as it streams in
+      setMessages(prev => [...prev, { role: 'assistant', content: '', success: true }])
+      await streamAssistant(id, question, (text) => {
+        setMessages(prev => [...prev.slice(0, -1), { role: 'assistant', content: text, success: true }])
       })
-
-      const assistantMessage = {
-        role: 'assistant',
-        content: response.data.response,
-        success: response.data.success
-      }
-
-      setMessages(prev => [...prev, assistantMessage])
     } catch (error) {
       const errorMessage = {
         role: 'assistant',
         content: 'Failed to get response from AI assistant. Please try again.',
         success: false
       }
-      setMessages(prev => [...prev, errorMessage])
+      setMessages(prev => [...prev.slice(0, -1), errorMessage])
     } finally {
       setLoading(false)
     }
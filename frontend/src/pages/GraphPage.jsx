@@ -25,18 +25,9 @@ const GraphPage = () => {
     try {
       const data = await getGraphData(id, filters)
       
-      // Filter edges based on minWeight
-      const filteredEdges = data.edges?.filter(edge => edge.weight >= filters.minWeight) || []
-      
-      // Get unique node IDs from filtered edges
-      const connectedNodeIds = new Set()
-      filteredEdges.forEach(edge => {
-        connectedNodeIds.add(edge.source)
-        connectedNodeIds.add(edge.target)
-      })
-      
-      // Only show nodes that have connections
-      const filteredNodes = data.nodes?.filter(node => connectedNodeIds.has(node.id)) || []
+      // Filtering, node selection and layout are done server-side
+      const filteredEdges = data.edges || []
+      const filteredNodes = data.nodes || []
       
       // Calculate layout in a force-directed style
       const centerX = 400
@@ -239,7 +230,8 @@ const GraphPage = () => {
                   className="w-full bg-dark-bg border border-dark-border rounded-lg px-3 py-2 text-sm"
                 >
                   <option value="">All</option>
-                  <option value="communication">Communication</option>
+                  <option value="call">Call</option>
+                  <option value="message">Message</option>
                   <option value="transaction">Transaction</option>
                 </select>
               </div>
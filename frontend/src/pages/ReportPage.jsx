@@ -5,7 +5,7 @@ import Card from '../components/Card'
 import Table from '../components/Table'
 import Badge from '../components/Badge'
 import Loader from '../components/Loader'
-import { generateReport, getReports } from '../api/cases'
+import { generateReport, getReports, getReportDownloadUrl } from '../api/cases'
 
 const ReportPage = () => {
   const { id } = useParams()
@@ -56,7 +56,7 @@ const ReportPage = () => {
       header: 'Actions',
       render: (row) => (
         <a 
-          href={`http://localhost:8000/${row.file_path}`}
+          href={getReportDownloadUrl(id, row.id)}
           target="_blank"
           rel="noopener noreferrer"
           className="text-blue-400 hover:text-blue-300 flex items-center gap-2"
@@ -4,13 +4,15 @@ import { Search, Filter } from 'lucide-react'
 import Card from '../components/Card'
 import Badge from '../components/Badge'
 import Loader from '../components/Loader'
-import { getTimeline } from '../api/cases'
+import { getTimeline, searchEvents } from '../api/cases'
 
 const TimelinePage = () => {
   const { id } = useParams()
-  const [allEvents, setAllEvents] = useState([])
   const [events, setEvents] = useState([])
+  const [total, setTotal] = useState(0)
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [filters, setFilters] = useState({
     source: '',
     search: '',
@@ -18,71 +20,61 @@ const TimelinePage = () => {
     dateTo: ''
   })
 
-  useEffect(() => {
-    loadTimeline()
-  }, [id])
+  // Source and date filters run server-side over the whole case, one keyset page at a time
+  const serverFilters = () => ({
+    source: filters.source || undefined,
+    start: filters.dateFrom || undefined,
+    end: filters.dateTo || undefined
+  })
 
   useEffect(() => {
-    applyFilters()
-  }, [filters, allEvents])
+    // Keyword search runs server-side over the whole case
+    const timer = setTimeout(filters.search ? runSearch : loadTimeline, 300)
+    return () => clearTimeout(timer)
+  }, [id, filters])
+
+  const runSearch = async () => {
+    try {
+      const data = await searchEvents(id, filters.search, serverFilters())
+      setEvents(data.results || [])
+      setTotal(data.results?.length || 0)
+      setNextCursor(null)
+    } catch (error) {
+      console.error('Search failed:', error)
+      setEvents([])
+      setTotal(0)
+    } finally {
+      setLoading(false)
+    }
+  }
 
   const loadTimeline = async () => {
     try {
-      const data = await getTimeline(id)
-      setAllEvents(data.events || [])
+      const data = await getTimeline(id, serverFilters())
       setEvents(data.events || [])
+      setTotal(data.total || 0)
+      setNextCursor(data.next_cursor)
     } catch (error) {
       console.error('Failed to load timeline:', error)
-      setAllEvents([])
       setEvents([])
+      setTotal(0)
+      setNextCursor(null)
     } finally {
       setLoading(false)
     }
   }
 
-  const applyFilters = () => {
-    let filtered = [...allEvents]
-
-    // Filter by source
-    if (filters.source) {
-      filtered = filtered.filter(e => e.source === filters.source)
-    }
-
-    // Filter by date range
-    if (filters.dateFrom) {
-      const fromDate = new Date(filters.dateFrom)
-      filtered = filtered.filter(e => new Date(e.timestamp) >= fromDate)
-    }
-    if (filters.dateTo) {
-      const toDate = new Date(filters.dateTo)
-      toDate.setHours(23, 59, 59)
-      filtered = filtered.filter(e => new Date(e.timestamp) <= toDate)
-    }
-
-    // Filter by search - search across all fields including metadata
-    if (filters.search) {
-      const search = filters.search.toLowerCase()
-      filtered = filtered.filter(e => {
-        // Search in basic fields
-        const basicMatch = 
-          e.user_id?.toLowerCase().includes(search) ||
-          e.event_type?.toLowerCase().includes(search) ||
-          e.source?.toLowerCase().includes(search) ||
-          e.receiver?.toLowerCase().includes(search) ||
-          e.amount?.toString().includes(search) ||
-          e.timestamp?.toLowerCase().includes(search) ||
-          e.message_text?.toLowerCase().includes(search) ||
-          e.language?.toLowerCase().includes(search)
-        
-        // Search in metadata JSON
-        const metadataMatch = e.metadata && e.metadata !== '{}' && 
-          e.metadata.toLowerCase().includes(search)
-        
-        return basicMatch || metadataMatch
-      })
+  const loadMore = async () => {
+    setLoadingMore(true)
+    try {
+      const data = await getTimeline(id, { ...serverFilters(), cursor: nextCursor })
+      setEvents(previous => [...previous, ...(data.events || [])])
+      setNextCursor(data.next_cursor)
+    } catch (error) {
+      console.error('Failed to load more events:', error)
+    } finally {
+      setLoadingMore(false)
     }
-
-    setEvents(filtered)
   }
 
   const getEventColor = (type) => {
@@ -150,10 +142,10 @@ const TimelinePage = () => {
             </div>
           </div>
         </div>
-        <button onClick={applyFilters} className="btn-primary mt-4 flex items-center gap-2">
+        <p className="text-sm text-gray-400 mt-4 flex items-center gap-2">
           <Filter className="w-4 h-4" />
-          Apply Filters ({events.length} results)
-        </button>
+          Showing {events.length} of {total} events
+        </p>
       </Card>
 
       <div className="space-y-4">
@@ -206,6 +198,11 @@ const TimelinePage = () => {
             )
           })
         )}
+        {nextCursor && (
+          <button onClick={loadMore} disabled={loadingMore} className="btn-primary w-full">
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        )}
       </div>
     </div>
   )